@@ -0,0 +1,42 @@
+# Keystroke throughput of the calculator core
+#
+# Drives Calculator.step() with a scripted key stream, without a display or the
+# keypad, so it shows how fast the core itself is. Run it on the device:
+#   mpremote run benchmarks/calculator_benchmark.py
+# or on the host, from outside the repository (its copy.py and types.py shadow the standard library):
+#   cd /tmp && python /path/to/benchmarks/calculator_benchmark.py
+
+try:
+    from time import ticks_us, ticks_diff
+except ImportError:
+    # CPython
+    import os
+    import sys
+    from time import perf_counter_ns
+
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    def ticks_us():
+        return perf_counter_ns() // 1000
+
+    def ticks_diff(a, b):
+        return a - b
+
+from calculator import Calculator, DrawOps, Buttons
+
+
+def run(name, keys, repeat):
+    calculator = Calculator(DrawOps())
+    ops = 0
+    start = ticks_us()
+    for i in range(repeat):
+        for key in keys:
+            ops += len(calculator.step(key))
+    us = ticks_diff(ticks_us(), start)
+    count = len(keys) * repeat
+    print("%s: %d keys/s, %d us per key, %d drawing operations per key" % (name, count * 1000000 // us, us // count, ops // count))
+
+
+run("typing", list("12+3*4-5/6") + [Buttons.cancel], 20)
+run("calculating", list("12+3*4-5/6") + [Buttons.ok, Buttons.cancel], 20)
+run("formula", [Buttons.menu, Buttons.down, Buttons.down, Buttons.ok, "1", "0", Buttons.ok, "2", Buttons.ok, Buttons.cancel], 10)
@@ -0,0 +1,49 @@
+# Benchmark of copy.deepcopy on calculator state sized data
+#
+# Run it on the device, where copy is the vendored module:
+#   mpremote run benchmarks/copy_benchmark.py
+
+import copy
+import time
+
+class Snapshot:
+    def __init__(self, i):
+        self.expression = "1+%d" % i
+        self.result = float(i)
+        self.values = [str(i), ""]
+
+
+def state():
+    return {
+        "to_eval": "12+3*4",
+        "state": 0,
+        "values": ["1", "2", ""],
+        "history": [{"expression": "1+%d" % i, "result": float(i), "unit": ("J", 1.0)} for i in range(50)],
+        "matrix": [[float(i * j) for j in range(8)] for i in range(8)],
+        "sessions": [Snapshot(i) for i in range(20)],
+    }
+
+
+def nested(depth):
+    root = []
+    current = root
+    for i in range(depth):
+        child = []
+        current.append(child)
+        current = child
+    return root
+
+
+def run(name, function, repeat):
+    start = time.ticks_us()
+    for i in range(repeat):
+        function()
+    print("%s: %d us" % (name, time.ticks_diff(time.ticks_us(), start) // repeat))
+
+
+data = state()
+run("deepcopy state", lambda: copy.deepcopy(data), 100)
+flat = [float(i) for i in range(256)]
+run("deepcopy flat list", lambda: copy.deepcopy(flat), 100)
+deep = nested(2000)
+run("deepcopy 2000 levels", lambda: copy.deepcopy(deep), 10)
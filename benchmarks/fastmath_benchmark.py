@@ -0,0 +1,65 @@
+# Speed and accuracy of fastmath against math
+#
+# For every function: microseconds per call with both implementations, and the
+# largest error of fastmath relative to math over the sample points.
+# Run it on the device:
+#   mpremote run benchmarks/fastmath_benchmark.py
+# or on the host, from outside the repository (its copy.py and types.py shadow the standard library):
+#   cd /tmp && python /path/to/benchmarks/fastmath_benchmark.py
+
+import math
+
+try:
+    from time import ticks_us, ticks_diff
+except ImportError:
+    # CPython
+    import os
+    import sys
+    from time import perf_counter_ns
+
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    def ticks_us():
+        return perf_counter_ns() // 1000
+
+    def ticks_diff(a, b):
+        return a - b
+
+import fastmath
+
+
+def points(low, high, count=200):
+    return [low + (high - low) * i / (count - 1) for i in range(count)]
+
+
+CASES = [
+    ("sin", points(-10, 10)),
+    ("cos", points(-10, 10)),
+    ("tan", points(-1.5, 1.5)),
+    ("asin", points(-1, 1)),
+    ("acos", points(-1, 1)),
+    ("atan", points(-100, 100)),
+    ("ln", points(0.001, 1000)),
+    ("log10", points(0.001, 1000)),
+    ("exp", points(-20, 20)),
+]
+
+
+def per_call(function, xs):
+    start = ticks_us()
+    for x in xs:
+        function(x)
+    return ticks_diff(ticks_us(), start) / len(xs)
+
+
+fast = fastmath.functions(True)
+reference = fastmath.functions(False)
+for name, xs in CASES:
+    error = 0.0
+    for x in xs:
+        expected = reference[name](x)
+        error = max(error, abs(fast[name](x) - expected) / max(1.0, abs(expected)))
+    print("%s: fastmath %.1f us, math %.1f us, max error %.2e" % (name, per_call(fast[name], xs), per_call(reference[name], xs), error))
+
+xs = points(0.1, 10)
+print("pow: fastmath %.1f us, math %.1f us" % (per_call(lambda x: fastmath.pow(x, 2.5), xs), per_call(lambda x: math.pow(x, 2.5), xs)))
@@ -0,0 +1,43 @@
+# Packed fonts against the full st7789_mpy font modules
+#
+# Import time and heap used by each font, and microseconds per glyph for a
+# glyph that has to be decoded and for one from the cache. The full modules
+# are only there if they were copied to the device next to the packed ones.
+# Run it on the device:
+#   mpremote run benchmarks/font_benchmark.py
+
+import gc
+import time
+
+from fonts import PackedFont
+
+
+def load(name):
+    gc.collect()
+    free = gc.mem_free()
+    start = time.ticks_us()
+    try:
+        module = __import__(name)
+    except ImportError:
+        return None
+    print("%s: import %d us, %d B heap" % (name, time.ticks_diff(time.ticks_us(), start), free - gc.mem_free()))
+    return module
+
+
+def per_glyph(font, codes, cache_size):
+    # A cache smaller than the glyphs drawn makes every glyph a decode
+    packed = PackedFont(font, cache_size)
+    start = time.ticks_us()
+    for i in range(10):
+        for code in codes:
+            packed.glyph(code)
+    return time.ticks_diff(time.ticks_us(), start) / (10 * len(codes))
+
+
+for packed_name, full_name in (("font_large", "vga1_16x32"), ("font_small", "vga2_bold_16x16")):
+    font = load(packed_name)
+    load(full_name)
+    if font is None:
+        continue
+    codes = list(font.CODES)[:20]
+    print("%s: decode %.1f us per glyph, cached %.1f us per glyph" % (packed_name, per_glyph(font, codes, 1), per_glyph(font, codes, 32)))
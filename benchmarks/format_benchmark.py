@@ -0,0 +1,40 @@
+# Result formatting, NumberFormatter against str()
+#
+# Microseconds per result and bytes allocated per result, for a few kinds of
+# numbers. The allocation is measured with the collector off, so nothing is
+# freed in between.
+# Run it on the device:
+#   mpremote run benchmarks/format_benchmark.py
+
+import gc
+import time
+
+from numformat import NumberFormatter
+
+CASES = [
+    ("integer", [i * 37 for i in range(100)]),
+    ("fraction", [1 / (i + 3) for i in range(100)]),
+    ("large", [1.5 ** (i + 40) for i in range(100)]),
+    ("small", [0.7 ** (i + 40) for i in range(100)]),
+]
+
+formatter = NumberFormatter(15)
+
+
+def measure(function, values):
+    gc.collect()
+    gc.disable()
+    allocated = gc.mem_alloc()
+    start = time.ticks_us()
+    for value in values:
+        function(value)
+    elapsed = time.ticks_diff(time.ticks_us(), start)
+    allocated = gc.mem_alloc() - allocated
+    gc.enable()
+    return elapsed / len(values), allocated / len(values)
+
+
+for name, values in CASES:
+    fmt_us, fmt_bytes = measure(formatter.format, values)
+    str_us, str_bytes = measure(str, values)
+    print("%s: format %.1f us %.0f B, str %.1f us %.0f B" % (name, fmt_us, fmt_bytes, str_us, str_bytes))
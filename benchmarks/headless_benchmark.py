@@ -0,0 +1,49 @@
+# Bytes per keystroke of the headless display backend
+#
+# Types an expression the way the calculate screen draws it (one character per
+# keystroke, result bar on =) and compares what was sent with dumping every
+# cell, or the whole RGB565 framebuffer, after each keystroke.
+# Runs on the device or on the host:
+#   mpremote run benchmarks/headless_benchmark.py
+
+from headless import HeadlessDisplay
+
+WHITE = 0xFFFF
+BLACK = 0x0000
+GREEN = 0x07E0
+
+
+class Font:
+    WIDTH = 16
+    HEIGHT = 32
+
+
+class Counter:
+    def __init__(self):
+        self.bytes = 0
+
+    def write(self, data):
+        self.bytes += len(data)
+
+
+counter = Counter()
+display = HeadlessDisplay(counter, 240, 240)
+display.fill(BLACK)
+display.show()
+keyframe = counter.bytes
+
+expression = "12+3*4-5/6+sqrt(49)*2-7"
+ratio = 240 // Font.WIDTH
+for index in range(len(expression)):
+    display.text(Font, expression[index], (index % ratio) * Font.WIDTH, (index // ratio) * Font.HEIGHT, WHITE, BLACK)
+    display.show()
+display.fill_rect(0, 208, 240, 32, GREEN)
+display.text(Font, "=37.16667", 0, 208, BLACK, GREEN)
+display.show()
+
+keystrokes = len(expression) + 1
+sent = counter.bytes - keyframe
+print("keyframe: %d B" % keyframe)
+print("delta: %d B per keystroke" % (sent // keystrokes))
+print("cell dump: %d B per keystroke" % display.raw_frame_size())
+print("framebuffer dump: %d B per keystroke" % (240 * 240 * 2))
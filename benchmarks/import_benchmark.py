@@ -0,0 +1,31 @@
+# Import time and heap cost of copy and types
+#
+# Run it on the device after a soft reset, so nothing is imported yet:
+#   mpremote soft-reset run benchmarks/import_benchmark.py
+
+import gc
+import sys
+import time
+
+
+def measure(name, function):
+    gc.collect()
+    free = gc.mem_free()
+    start = time.ticks_us()
+    function()
+    us = time.ticks_diff(time.ticks_us(), start)
+    gc.collect()
+    print("%s: %d us, %d B heap" % (name, us, free - gc.mem_free()))
+
+
+def load(module):
+    return lambda: __import__(module)
+
+
+measure("import copy", load("copy"))
+print("types imported by copy:", "types" in sys.modules)
+measure("import types", load("types"))
+import types
+
+measure("types.MethodType", lambda: types.MethodType)
+measure("types.new_class", lambda: types.new_class)
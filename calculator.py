@@ -0,0 +1,1504 @@
+# Calculator core
+#
+# Everything the calculator does in response to a button, without touching
+# any hardware. The display is injected: Calculator draws on a DrawOps, which
+# records the drawing operations of each step and forwards them to a real
+# display if it has one. main.py wires it to the panel and the keypad, a
+# script or another front-end can drive step() directly, as fast as it likes.
+
+from math import sqrt, pi
+from array import array
+
+try:
+    from micropython import const
+except ImportError:
+    # CPython, for the host tools
+    def const(x):
+        return x
+
+from plot import Plot
+from matrix import Matrix, Singular, MAX_SIZE
+import units
+import precise
+import fastmath
+from numformat import NumberFormatter
+import profiler
+from profiler import timed
+
+
+class Colors:
+    # RGB565, the same values as the st7789 driver constants
+    BLACK = const(0x0000)
+    BLUE = const(0x001F)
+    RED = const(0xF800)
+    GREEN = const(0x07E0)
+    CYAN = const(0x07FF)
+    YELLOW = const(0xFFE0)
+    WHITE = const(0xFFFF)
+
+
+class Buttons:
+    zero = "0"
+    one = "1"
+    two = "2"
+    three = "3"
+    four = "4"
+    five = "5"
+    six = "6"
+    seven = "7"
+    eight = "8"
+    nine = "9"
+    ok = 10
+    cancel = 11
+    delete = 12
+    plus = "+"
+    minus = "-"
+    divide = "/"
+    multiply = "*"
+    dot = "."
+    start_brace = "("
+    end_brace = ")"
+    square_root = "^"
+    menu = 21
+    up = 22
+    down = 23
+    back = 24
+    sleep = 25
+    scroll_up = 26
+    scroll_down = 27
+    x = "x"
+    plot = 28
+    convert = 29
+    diagnostics = 30
+    precision = 31
+
+
+class Math:
+    # Names available to expressions and compiled formulas, the math functions are added by select()
+    namespace = {"sqrt": sqrt, "pi": pi}
+    fast = False
+
+    @staticmethod
+    def select(fast=False):
+        # Switches the math functions between fastmath and math. Compiled formulas share the namespace, so they switch too.
+        # math is the default, fastmath is less accurate for results near zero. On the device the precision key
+        # switches them on the diagnostics screen, see toggle_precision().
+        Math.namespace.update(fastmath.functions(fast))
+        Math.fast = fast
+
+    @staticmethod
+    def is_name_char(c):
+        # Provider symbols can contain non-ASCII characters, like ΔT and °C.
+        return c == "_" or c.isalpha() or c.isdigit() or ord(c) > 127
+
+    @staticmethod
+    def substitute(expression, names):
+        # Replaces whole names in expression using the names dictionary. Numbers are left alone,
+        # so a symbol never matches inside a longer name or a literal like 1e5.
+        result = []
+        i = 0
+        while i < len(expression):
+            c = expression[i]
+            if Math.is_name_char(c):
+                j = i + 1
+                while j < len(expression) and (Math.is_name_char(expression[j]) or (c.isdigit() and expression[j] == ".")):
+                    j += 1
+                token = expression[i:j]
+                result.append(token if c.isdigit() else names.get(token, token))
+                i = j
+            else:
+                result.append(c)
+                i += 1
+        return "".join(result)
+
+    @staticmethod
+    def prepare(to_evaluate):
+        # Rewrites the calculator grammar (^ for square root) into a Python expression.
+        # re is only needed once something is calculated, so it isn't imported at boot.
+        import re
+        to_evaluate = to_evaluate.replace("^(", "sqrt(")
+        # Matches all with operators afterwards
+        while True:
+            matches = re.search(r"(\^).[+\-/*]", to_evaluate)
+            if not matches:
+                break
+            match = matches.group(0)
+            if not match:
+                break
+            number = match[1:-1]
+            to_evaluate = to_evaluate.replace(match, f"sqrt({number}){match[-1]}")
+
+        # Matches all without operators afterwards
+        while True:
+            matches = re.search(r"(\^).*", to_evaluate)
+            if not matches:
+                break
+            match = matches.group(0)
+            if not match:
+                break
+            number = match[1:]
+            to_evaluate = to_evaluate.replace(match, f"sqrt({number})")
+        
+        print(to_evaluate)
+
+        return to_evaluate
+
+    @staticmethod
+    @timed("Math.evaluate")
+    def evaluate(to_evaluate):
+        return eval(Math.prepare(to_evaluate), Math.namespace)
+
+    @staticmethod
+    def compile(expression, arguments):
+        # Compiles an expression into a function of the given arguments, for evaluating it many times.
+        return eval(f"lambda {arguments}: {Math.prepare(expression)}", Math.namespace)
+
+
+Math.select()
+profiler.gauge("math", lambda: "fastmath" if Math.fast else "math")
+
+
+class Functions:
+    # Math functions typed by a long press of a key that has no other long press function
+    keymap = {
+        "1": "sin(",
+        "3": "cos(",
+        "4": "tan(",
+        "5": "ln(",
+        "7": "log10(",
+        "8": "exp(",
+        "9": "fact(",
+        "+": "nCr(",
+        "-": "pow(",
+    }
+    # Typing a function again right after itself replaces it with its inverse
+    inverse = {
+        "sin(": "asin(",
+        "cos(": "acos(",
+        "tan(": "atan(",
+    }
+
+
+class State:
+    calculate = 0
+    formula_overview = 1
+    formula_calculation = 2
+    sweep = 3
+    plot = 4
+    diagnostics = 5
+    matrix = 6
+    
+    names = ("calculate", "formula overview", "formula calculation", "sweep", "plot", "diagnostics", "matrix")
+
+
+class TextLayout:
+    @staticmethod
+    def wrap(text: str, width: int):
+        # Word wraps text into lines of at most width characters.
+        # Returns an array of (start, end) offset pairs, one pair per line, so drawing a line is a single slice.
+        # Words longer than a line are broken at the line width.
+        offsets = array("H")
+        start = 0
+        length = len(text)
+        while start < length:
+            while start < length and text[start] == " ":
+                start += 1
+            if start >= length:
+                break
+            end = start + width
+            if end >= length:
+                end = length
+            else:
+                space = text.rfind(" ", start, end + 1)
+                if space > start:
+                    end = space
+            offsets.append(start)
+            offsets.append(end)
+            start = end
+        return offsets
+
+
+class FormulaProvider:
+    def __init__(self, provider_name, provider_formula_name, unit):
+        self.provider_name = provider_name
+        self.provider_formula_name = provider_formula_name
+        self.unit = unit
+        # Parsed once at boot, unit checks and conversions never touch the unit string again
+        self.parsed_unit = units.parse(unit)
+
+
+class FormulaProviders:
+    mass = FormulaProvider("Masa", "m", "kg")
+    speed = FormulaProvider("Hitrost", "v", "m/s")
+    distance = FormulaProvider("Pot", "s", "m")
+    force = FormulaProvider("Sila", "F", "N")
+    accelaration = FormulaProvider("Pospesek", "a", "m/(s**2)")
+    time = FormulaProvider("Cas", "t", "s")
+    kinetic_energy = FormulaProvider("Kin. en.", "Wk", "J")
+    potential_energy = FormulaProvider("Pot. en.", "Wp", "J")
+    work = FormulaProvider("Delo", "A", "J")
+    gravitational_accelaration = FormulaProvider("G posp.", "g",  "m/(s**2)")
+    height = FormulaProvider("Visina", "h", "m")
+    start_speed = FormulaProvider("Zac. h.", "v1", "m/s")
+    end_speed = FormulaProvider("Kon. h.", "v2", "m/s")
+    delta_temperature = FormulaProvider("Temp razl.", "ΔT", "K")
+    specific_heat_capacity = FormulaProvider("Spec. topl.", "c", "J/(kg*K)")
+    kelvin = FormulaProvider("Kelvin", "K", "K")
+    celsius = FormulaProvider("Celzija", "°C", "°C")
+    resistance = FormulaProvider("Upor", "Ohm", "Ω")
+    current = FormulaProvider("Napetost", "U", "V")
+    voltage = FormulaProvider("Tok", "I", "A")
+    radius = FormulaProvider("Polmer", "r", "cm")
+    diameter = FormulaProvider("Premer", "d", "cm")
+    a = FormulaProvider("Stranica", "a", "cm")
+    height_to_a = FormulaProvider("Vis. na stran.", "v", "cm")
+    height_geo = FormulaProvider("Visina", "v", "cm")
+    base_area = FormulaProvider("Os. pl.", "O", "cm2")
+    coat = FormulaProvider("Plasc", "Pl", "cm2")
+    leg1 = FormulaProvider("Kateta 1", "k1", "cm")
+    leg2 = FormulaProvider("Kateta 2", "k2", "cm")
+    hypotenuse = FormulaProvider("Hipotenuza", "h", "cm")
+
+
+class Formula:
+    def __init__(self, formula_name, formula, description, calculation_formula, providers):
+        self.formula_name = formula_name
+        self.formula = formula
+        self.description = description
+        self.calculation_formula = calculation_formula
+        self.providers = providers
+        self.compiled = None
+        self.unit = None
+
+    def source(self):
+        # The formula as a lambda taking provider values in the order of self.providers.
+        names = {}
+        for i in range(len(self.providers)):
+            names[self.providers[i].provider_formula_name] = f"_{i}"
+        arguments = ", ".join(names[p.provider_formula_name] for p in self.providers)
+        return f"lambda {arguments}: {Math.substitute(self.calculation_formula, names)}"
+
+    def compile(self):
+        # Compiles the formula. It is compiled once and cached, so evaluating it again doesn't touch any strings.
+        if self.compiled is None:
+            self.compiled = eval(self.source(), Math.namespace)
+        return self.compiled
+
+    def check_unit(self):
+        # Works out the unit of the result by evaluating the formula over the provider units,
+        # and checks it against the unit of the result symbol, if that is a provider.
+        # The provider unit wins when it matches, so K-273 gives °C and not K.
+        try:
+            self.unit = eval(self.source(), units.namespace)(*[p.parsed_unit for p in self.providers])
+        except Exception as e:
+            print(f"[UNITS] {self.formula}: {e}")
+            return
+        symbol = self.formula.split("=")[0]
+        expected = [p.parsed_unit for p in Formulas.providers() if p.provider_formula_name == symbol]
+        for u in expected:
+            if u.dimension == self.unit.dimension and u.scale == self.unit.scale:
+                self.unit = u
+                return
+        if expected and all(u.dimension != self.unit.dimension for u in expected):
+            print(f"[UNITS] {self.formula}: result is {self.unit}, expected {expected[0]}")
+            # Showing a unit we know is wrong would be worse than showing none
+            self.unit = None
+            return
+        # A unit without a name, like cm4, can't be shown or converted. The result is shown as a plain number
+        # in the units of the providers, as it was before units were parsed.
+        self.unit = units.find(self.unit)
+
+
+class Formulas:
+    formulas = [
+        # Formule povezane z delom
+        Formula("Delo", "A=F*s", "Izracun dela iz sile in poti", "F*s", [FormulaProviders.force, FormulaProviders.distance]),
+        # Formule povezane z kinetično energijo
+        Formula("Povp. hitrost", "v_avg=(v1+v2)/2", "Izracun povprecne hitrosti iz zacetne in koncne hitrosti", "(v1+v2)/2", [FormulaProviders.start_speed, FormulaProviders.end_speed]),
+        Formula("Kineticna en.", "Wk=(m*(v**2))/2", "Izracun kineticne energije iz hitrosti in mase", "(m*(v**2))/2", [FormulaProviders.mass, FormulaProviders.speed]),
+        # Formule povezane z potencialno energijo
+        Formula("Potencialna en. iz mase", "Wp=m*g*h", "Izracun potencialne energije iz mase in visine", "m*10*h", [FormulaProviders.mass, FormulaProviders.height]),
+        Formula("Potencialna en. iz sile", "Wp=F*h", "Izracun potencialne energije iz sile in visine", "F*h", [FormulaProviders.force, FormulaProviders.height]),
+        # Formule povezane s toploto
+        Formula("Toplota", "Q=m*c*ΔT", "Izracun toplote iz specificne toplote, mase in temperaturne razlike", "m*ΔT*c", [FormulaProviders.specific_heat_capacity, FormulaProviders.delta_temperature, FormulaProviders.mass]),
+        Formula("Temperatura", "°C=K-273", "Izracun temperature iz Kelvinov v Celzije", "K-273", [FormulaProviders.kelvin]),
+        Formula("Temperatura", "K=°C+273", "Izracun temperature iz Celzija v Kelvin", "°C+273", [FormulaProviders.celsius]),
+        
+        
+        # Formule povezane s hitrostjo
+        Formula("Hitrost", "v=^((Wk*2)/m)", "Izracun hitrosti iz kineticne energije in mase", "sqrt((Wk*2)/m)", [FormulaProviders.kinetic_energy, FormulaProviders.mass]),
+        Formula("Koncna hitrost", "v2=v1+a*t", "Velja samo pri enakomernem pospesenem gibanju", "v1+a*t", [FormulaProviders.start_speed, FormulaProviders.time, FormulaProviders.accelaration]),
+        # Formule povezane s potjo
+        Formula("Pot", "s=(a*(t**2))/2", "Izracun poti iz pospeska in casu", "(a*(t**2))/2", [FormulaProviders.accelaration, FormulaProviders.time]),
+        Formula("Pot", "s=((v1+v2)/2)*t", "Izracun poti iz zacetne in koncne hitrosti ter casa", "((v1+v2)/2)*t", [FormulaProviders.start_speed, FormulaProviders.time, FormulaProviders.end_speed]),
+        
+        
+        # Formule povezane z elektriko in električnim tokom
+        Formula("Upor", "R=U/I", "Izracun upora iz napetosti in toka", "U/I", [FormulaProviders.current, FormulaProviders.voltage]),
+        Formula("Tok", "I=U/R", "Izracun toka iz napetosti in upora", "U/R", [FormulaProviders.resistance, FormulaProviders.voltage]),
+        Formula("Napetost", "U=I*R", "Izracun napetosti iz toka in upora", "I*R", [FormulaProviders.resistance, FormulaProviders.current]),
+        
+        
+        # Formule povezane z geometrijo
+        # Krog
+        Formula("Obseg kroga", "o=2*pi*r", "Izracun obsega iz polmera", "2*pi*r", [FormulaProviders.radius]),
+        Formula("Obseg kroga", "o=pi*d", "Izracun obsega iz premera", "pi*d", [FormulaProviders.diameter]),
+        Formula("Pl. kroga", "p=pi*(r**2)", "Izracun ploscine iz polmera", "pi*(r**2)", [FormulaProviders.radius]),
+        # Trikotnik
+        Formula("Pl. trikotnika", "p=(a*va)/2", "Izracun ploscine iz stranice in pripadajoce visine", "(a*v)/2", [FormulaProviders.a, FormulaProviders.height_to_a]),
+        # Prizma
+        Formula("Volumen prizme", "V=Ov", "Izracun volumna iz osnovne ploskve in visine", "O*v", [FormulaProviders.base_area, FormulaProviders.height_geo]),
+        Formula("Povrsina prizme", "P=2*O*Pl", "Izracun povrsine iz osnovne ploskve in plasca", "2*O*Pl", [FormulaProviders.base_area, FormulaProviders.coat]),
+        # Piramida
+        Formula("Volumen piramide", "V=(O*v)/3", "Izracun volumna iz osnovne ploskve in visine", "(O*v)/3", [FormulaProviders.base_area, FormulaProviders.height_geo]),
+        Formula("Povrsina piramide", "P=O*Pl", "Izracun povrsine iz osnovne ploskve in plasca", "O*Pl", [FormulaProviders.base_area, FormulaProviders.coat]),
+        
+        # Pitagorov izrek
+        Formula("Hipotenuza", "h=^(k1**2+k2**2)", "Izracun hipotenuze iz katet", "sqrt(k1**2+k2**2)", [FormulaProviders.leg1, FormulaProviders.leg2]),
+        Formula("Kateta", "k=^(h**2-k**2)", "Izracun katete iz hipotenuze in druge katete", "sqrt(h**2-k1**2)", [FormulaProviders.hypotenuse, FormulaProviders.leg1]),
+    ]
+
+    @staticmethod
+    def providers():
+        return [p for p in FormulaProviders.__dict__.values() if isinstance(p, FormulaProvider)]
+
+    # Graph of which formulas feed which, see planner.py
+    _planner = None
+
+    @staticmethod
+    def check_units():
+        for formula in Formulas.formulas:
+            formula.check_unit()
+
+    @staticmethod
+    def planner():
+        # Built once, the units of the formulas have to be checked by then as they decide what chains.
+        if Formulas._planner is None:
+            from planner import Planner
+            Formulas._planner = Planner(Formulas.formulas)
+        return Formulas._planner
+
+    @staticmethod
+    def chain(values, target):
+        # Result of the cheapest chain of formulas from known quantities to the target symbol, as (value, unit).
+        # values maps quantity numbers of the planner to (value, unit).
+        value, unit = Formulas.planner().solve(values, target)
+        if unit:
+            value, unit = units.normalize(value, unit)
+        return value, unit
+
+    @staticmethod
+    @timed("Formulas.formula_preparation")
+    def formula_preparation(provider_state):
+        # Builds the expression with the entered values in place of the provider symbols. The formula itself is left alone.
+        formula = Formulas.formulas[provider_state.current_formula]
+        values = {}
+        for i in range(len(provider_state.providers)):
+            values[provider_state.providers[i].provider_formula_name] = f"({provider_state.values[i]})"
+        return Math.substitute(formula.calculation_formula, values)
+
+    @staticmethod
+    def evaluate(provider_state):
+        # Result of a formula calculation as (value, unit), the unit is None if the formula has none.
+        value = Math.evaluate(Formulas.formula_preparation(provider_state))
+        unit = Formulas.formulas[provider_state.current_formula].unit
+        if unit:
+            value, unit = units.normalize(value, unit)
+        return value, unit
+
+    # Number of description lines visible in the formula overview
+    description_lines = const(3)
+
+    # Description line breaks, keyed by (formula, characters per line)
+    layouts = {}
+
+    @staticmethod
+    def description_layout(current_formula, width_ratio):
+        key = (current_formula, width_ratio)
+        layout = Formulas.layouts.get(key)
+        if layout is None:
+            layout = TextLayout.wrap(Formulas.formulas[current_formula].description, width_ratio)
+            Formulas.layouts[key] = layout
+        return layout
+
+    @staticmethod
+    def max_description_scroll(current_formula, width_ratio):
+        lines = len(Formulas.description_layout(current_formula, width_ratio)) // 2
+        return max(0, lines - Formulas.description_lines)
+
+    @staticmethod
+    def description(current_formula, width_ratio, scroll=0):
+        # The visible description lines, starting at line scroll.
+        description = Formulas.formulas[current_formula].description
+        layout = Formulas.description_layout(current_formula, width_ratio)
+        lines = []
+        for i in range(Formulas.description_lines):
+            line = (scroll + i) * 2
+            if line >= len(layout):
+                break
+            lines.append(description[layout[line]:layout[line + 1]])
+        return lines
+
+    @staticmethod
+    def lcd_description(lcd, current_formula, scroll=0):
+        # Draws the visible description lines, starting at line scroll.
+        lcd.fill_rect(0, lcd.font_height, lcd.width, Formulas.description_lines * lcd.font_height, Colors.BLACK)
+        lines = Formulas.description(current_formula, lcd.width_ratio, scroll)
+        for i in range(len(lines)):
+            lcd.text(lines[i], 0, (i + 1) * lcd.font_height, Colors.WHITE)
+
+    @staticmethod
+    def lcd_formula_overview(lcd, current_formula, scroll=0):
+        # Draws the overview on a cleared screen. It is the same every time, so the display can cache it (see screencache.py).
+        f = Formulas.formulas[current_formula]
+
+        items = [(f.formula_name, 0, 0, Colors.RED, None)]
+        lines = Formulas.description(current_formula, lcd.width_ratio, scroll)
+        for i in range(len(lines)):
+            items.append((lines[i], 0, (i + 1) * lcd.font_height, Colors.WHITE, None))
+        items.append((f.formula, 0, 4*lcd.font_height, Colors.CYAN, None))
+        for i in range(min(3, len(f.providers))):
+            provider = f.providers[i]
+            items.append((f"{provider.provider_name} {provider.provider_formula_name} {provider.unit}", 0, (i + 5)*lcd.font_height, Colors.YELLOW, None))
+        # Only the unscrolled overview is kept, it is the one every visit starts with
+        lcd.screen(f"overview{current_formula}" if scroll == 0 else None, items)
+        lcd.show()
+
+
+class ProviderState:
+    # Input of one formula calculation. The formula catalog is never modified, the entered values and
+    # the selected provider live here, so a session is a formula index, a cursor and a few short strings.
+    
+    def __init__(self, current_formula):
+        self.current_formula = current_formula
+        self.providers = Formulas.formulas[current_formula].providers
+        self.values = [""] * len(self.providers)
+        self.at_provider = 0
+    
+    @staticmethod
+    def value_x(lcd, provider: FormulaProvider):
+        # Names are indented by two characters to leave room for the selection marker.
+        return (len(provider.provider_name) + 3) * lcd.font_width
+
+
+class Sweep:
+    # Table of a formula evaluated over a range of one of its providers.
+    # A range is entered as a provider value like 1..100 or 0..10..0.5 (start..stop..step).
+    # Only the visible page is ever computed, with the compiled formula in a tight loop.
+    
+    def __init__(self, display, formula: Formula, arguments: list, variable: int, start: float, stop: float, step: float):
+        self.display = display
+        self.formula = formula
+        self.function = formula.compile()
+        self.arguments = arguments
+        self.variable = variable
+        self.start = start
+        self.step = step
+        self.count = int((stop - start) / step + 1e-6) + 1
+        self.page_size = int(display.height / display.font_height) - 1
+        self.pages = int((self.count + self.page_size - 1) / self.page_size)
+        self.page = 0
+        self.results = array("f", [0.0] * self.page_size)
+    
+    @staticmethod
+    def parse_range(value: str):
+        # Returns (start, stop, step) for a range value, or None for a plain number.
+        parts = value.split("..")
+        if len(parts) not in (2, 3):
+            return None
+        start = float(parts[0])
+        stop = float(parts[1])
+        step = float(parts[2]) if len(parts) == 3 else 1.0
+        if step <= 0 or stop < start:
+            raise ValueError("Invalid range")
+        return start, stop, step
+    
+    @staticmethod
+    def from_provider_state(display, provider_state: ProviderState):
+        # Builds a sweep if exactly one provider was given a range, returns None otherwise.
+        # The other values can be expressions, like for a single calculation.
+        if not any(".." in value for value in provider_state.values):
+            return None
+        formula = Formulas.formulas[provider_state.current_formula]
+        arguments = []
+        sweep_range = None
+        variable = 0
+        for i in range(len(provider_state.providers)):
+            value = provider_state.values[i]
+            r = Sweep.parse_range(value)
+            if r is None:
+                arguments.append(Math.evaluate(value))
+            elif sweep_range is None:
+                sweep_range = r
+                variable = i
+                arguments.append(r[0])
+            else:
+                raise ValueError("Only one provider can be swept")
+        if sweep_range is None:
+            return None
+        return Sweep(display, formula, arguments, variable, sweep_range[0], sweep_range[1], sweep_range[2])
+    
+    def x(self, row):
+        return self.start + row * self.step
+    
+    def compute(self):
+        # Evaluates the rows of the current page into self.results.
+        function = self.function
+        arguments = self.arguments
+        variable = self.variable
+        results = self.results
+        first = self.page * self.page_size
+        for i in range(min(self.page_size, self.count - first)):
+            arguments[variable] = self.x(first + i)
+            try:
+                results[i] = function(*arguments)
+            except Exception:
+                results[i] = float("nan")
+    
+    def draw(self):
+        self.compute()
+        lcd = self.display
+        lcd.fill(Colors.BLACK)
+        symbol = self.formula.formula.split("=")[0]
+        lcd.text(f"{self.formula.providers[self.variable].provider_formula_name} {symbol}", 0, 0, Colors.RED)
+        first = self.page * self.page_size
+        for i in range(min(self.page_size, self.count - first)):
+            y = self.results[i]
+            # NaN marks a row that couldn't be calculated
+            lcd.text(f"{self.x(first + i):g} " + ("-" if y != y else f"{y:g}"), 0, (i + 1) * lcd.font_height, Colors.YELLOW)
+        lcd.show()
+    
+    def next_page(self):
+        self.page = self.page + 1 if self.page < self.pages - 1 else 0
+        self.draw()
+    
+    def previous_page(self):
+        self.page = self.page - 1 if self.page > 0 else self.pages - 1
+        self.draw()
+
+
+class MatrixMode:
+    # Matrix calculations on the keypad (see matrix.py). A digit picks the operation from the menu, then the sizes
+    # and the elements are typed like provider values and each one is confirmed with OK, elements row by row.
+    # An element can be any expression, an empty one is 0. The scroll keys page through a result matrix,
+    # OK goes back to the menu.
+    
+    ADD = 0
+    MULTIPLY = 1
+    TRANSPOSE = 2
+    DETERMINANT = 3
+    INVERSE = 4
+    SOLVE = 5
+    labels = ("A+B", "A*B", "trans(A)", "det(A)", "inv(A)", "Ax=b")
+    # Sizes asked for each operation, the other sizes follow from them
+    size_prompts = (
+        ("A vrstice", "A stolpci"),
+        ("A vrstice", "A stolpci", "B stolpci"),
+        ("A vrstice", "A stolpci"),
+        ("A velikost",),
+        ("A velikost",),
+        ("A velikost",),
+    )
+    
+    # Phases
+    menu = 0
+    sizes = 1
+    entry = 2
+    result = 3
+    
+    def __init__(self, display, formatter: NumberFormatter):
+        self.display = display
+        self.formatter = formatter
+        self.page_size = int(display.height / display.font_height) - 1
+        # Element labels go up to "8,8", values start after them
+        self.value_column = 4
+        self.phase = MatrixMode.menu
+        self.operation = 0
+        self.size_values = []
+        # Matrices being entered, the one being entered and the element being entered
+        self.matrices = []
+        self.current = 0
+        self.index = 0
+        self.value = ""
+        self.output = None
+        self.number = None
+        self.error = None
+        self.page = 0
+    
+    def line_y(self, line):
+        return line * self.display.font_height
+    
+    def draw(self):
+        lcd = self.display
+        lcd.fill(Colors.BLACK)
+        if self.phase == MatrixMode.menu:
+            lcd.text("MATRIKE", 0, 0, Colors.RED)
+            for i in range(min(len(MatrixMode.labels), self.page_size)):
+                lcd.text(f"{i + 1} {MatrixMode.labels[i]}", 0, self.line_y(i + 1), Colors.WHITE)
+        elif self.phase == MatrixMode.sizes:
+            lcd.text(MatrixMode.labels[self.operation], 0, 0, Colors.RED)
+            prompts = MatrixMode.size_prompts[self.operation]
+            for i in range(len(self.size_values) + 1):
+                lcd.text(prompts[i], 0, self.line_y(i + 1), Colors.WHITE)
+                value = str(self.size_values[i]) if i < len(self.size_values) else self.value
+                lcd.text(value, (len(prompts[i]) + 1) * lcd.font_width, self.line_y(i + 1), Colors.YELLOW)
+        elif self.phase == MatrixMode.entry:
+            m = self.matrices[self.current]
+            lcd.text(f"{'AB'[self.current]} {m.rows}x{m.cols}", 0, 0, Colors.RED)
+            first = self.index - self.index % self.page_size
+            for k in range(first, self.index):
+                self.draw_element(m, k, Colors.WHITE)
+            self.draw_label(m, self.index, Colors.YELLOW)
+            self.draw_value(self.value)
+        elif self.error:
+            lcd.text(MatrixMode.labels[self.operation], 0, 0, Colors.RED)
+            lcd.text(self.error, 0, self.line_y(1), Colors.RED)
+        elif self.output is None:
+            lcd.text(MatrixMode.labels[self.operation], 0, 0, Colors.RED)
+            self.formatter.format(self.number, lcd.width_ratio)
+            lcd.text(self.formatter.view(), 0, self.line_y(1), Colors.YELLOW)
+        else:
+            m = self.output
+            pages = (m.rows * m.cols + self.page_size - 1) // self.page_size
+            lcd.text(f"{MatrixMode.labels[self.operation]} {self.page + 1}/{pages}", 0, 0, Colors.RED)
+            first = self.page * self.page_size
+            for k in range(first, min(first + self.page_size, m.rows * m.cols)):
+                self.draw_element(m, k, Colors.YELLOW)
+    
+    def label(self, m, k):
+        # (i, j) from 1, a vector only needs i
+        if m.cols == 1:
+            return str(k + 1)
+        return f"{k // m.cols + 1},{k % m.cols + 1}"
+    
+    def draw_label(self, m, k, color):
+        self.display.text(self.label(m, k), 0, self.line_y(1 + k % self.page_size), color)
+    
+    def draw_element(self, m, k, color):
+        lcd = self.display
+        self.draw_label(m, k, Colors.WHITE)
+        self.formatter.format(m.data[k], lcd.width_ratio - self.value_column)
+        lcd.text(self.formatter.view(), self.value_column * lcd.font_width, self.line_y(1 + k % self.page_size), color)
+    
+    def value_x(self):
+        if self.phase == MatrixMode.sizes:
+            return (len(MatrixMode.size_prompts[self.operation][len(self.size_values)]) + 1) * self.display.font_width
+        return self.value_column * self.display.font_width
+    
+    def value_line(self):
+        if self.phase == MatrixMode.sizes:
+            return len(self.size_values) + 1
+        return 1 + self.index % self.page_size
+    
+    def draw_value(self, text, color=Colors.YELLOW):
+        lcd = self.display
+        y = self.line_y(self.value_line())
+        lcd.fill_rect(self.value_x(), y, lcd.width - self.value_x(), lcd.font_height, Colors.BLACK)
+        lcd.text(text, self.value_x(), y, color)
+    
+    def key(self, m):
+        if self.phase == MatrixMode.menu:
+            if m.isdigit() and 1 <= int(m) <= len(MatrixMode.labels):
+                self.operation = int(m) - 1
+                self.size_values = []
+                self.value = ""
+                self.phase = MatrixMode.sizes
+                self.draw()
+        elif self.phase == MatrixMode.sizes or self.phase == MatrixMode.entry:
+            self.value += m
+            self.draw_value(self.value)
+    
+    def delete(self):
+        if (self.phase == MatrixMode.sizes or self.phase == MatrixMode.entry) and self.value:
+            self.value = self.value[:-1]
+            lcd = self.display
+            lcd.fill_rect(self.value_x() + len(self.value) * lcd.font_width, self.line_y(self.value_line()), lcd.font_width, lcd.font_height, Colors.BLACK)
+    
+    def ok(self):
+        if self.phase == MatrixMode.sizes:
+            self.ok_size()
+        elif self.phase == MatrixMode.entry:
+            self.ok_element()
+        elif self.phase == MatrixMode.result:
+            self.output = None
+            self.phase = MatrixMode.menu
+            self.draw()
+    
+    def ok_size(self):
+        # Each size is checked as it is entered, only that one is asked again
+        try:
+            size = int(self.value)
+        except ValueError:
+            size = 0
+        self.value = ""
+        if not 0 < size <= MAX_SIZE:
+            print(f"[MATRIX] Size {size} not supported")
+            self.draw_value("NAPAKA", Colors.RED)
+            return
+        self.size_values.append(size)
+        if len(self.size_values) < len(MatrixMode.size_prompts[self.operation]):
+            self.draw()
+            return
+        self.matrices = self.allocate()
+        self.current = 0
+        self.index = 0
+        self.phase = MatrixMode.entry
+        self.draw()
+    
+    def allocate(self):
+        # The matrices to enter for the operation and sizes.
+        s = self.size_values
+        if len(s) == 1:
+            a = Matrix(s[0], s[0])
+            return [a, Matrix(s[0], 1)] if self.operation == MatrixMode.SOLVE else [a]
+        a = Matrix(s[0], s[1])
+        if self.operation == MatrixMode.ADD:
+            return [a, Matrix(s[0], s[1])]
+        if self.operation == MatrixMode.MULTIPLY:
+            return [a, Matrix(s[1], s[2])]
+        return [a]
+    
+    def ok_element(self):
+        m = self.matrices[self.current]
+        try:
+            m.data[self.index] = float(Math.evaluate(self.value)) if self.value else 0.0
+        except Exception as e:
+            print(f"[MATRIX] {e}")
+            self.value = ""
+            self.draw_value("NAPAKA", Colors.RED)
+            return
+        self.value = ""
+        self.draw_element(m, self.index, Colors.WHITE)
+        self.index += 1
+        if self.index < m.rows * m.cols:
+            if self.index % self.page_size:
+                self.draw_label(m, self.index, Colors.YELLOW)
+            else:
+                self.draw()
+        elif self.current + 1 < len(self.matrices):
+            self.current += 1
+            self.index = 0
+            self.draw()
+        else:
+            self.calculate()
+    
+    def calculate(self):
+        a = self.matrices[0]
+        b = self.matrices[1] if len(self.matrices) > 1 else None
+        self.output = None
+        self.number = None
+        self.error = None
+        self.page = 0
+        try:
+            if self.operation == MatrixMode.ADD:
+                self.output = a.add(b)
+            elif self.operation == MatrixMode.MULTIPLY:
+                self.output = a.multiply(b)
+            elif self.operation == MatrixMode.TRANSPOSE:
+                self.output = a.transpose()
+            elif self.operation == MatrixMode.DETERMINANT:
+                self.number = a.determinant()
+            elif self.operation == MatrixMode.INVERSE:
+                self.output = a.invert()
+            else:
+                self.output = a.solve(b)
+        except Singular:
+            self.error = "SINGULARNA"
+        # The operands aren't shown again, only the result is kept
+        self.matrices = []
+        self.phase = MatrixMode.result
+        self.draw()
+    
+    def scroll(self, direction):
+        # Pages through a result matrix.
+        if self.phase != MatrixMode.result or self.output is None:
+            return
+        pages = (self.output.rows * self.output.cols + self.page_size - 1) // self.page_size
+        self.page = (self.page + direction) % pages
+        self.draw()
+
+
+class Viewport:
+    # Scrolling window over the expression in the calculate state.
+    # Expression lines are kept in a ring of display rows and the window is moved with the hardware scroll
+    # (ST7789 VSCRDEF/VSCRSADD, SSD1306 display start line), so a keystroke only ever draws one line,
+    # no matter how long the expression is.
+    
+    def __init__(self, display):
+        self.display = display
+        if display.displayType == "IPS":
+            # The result bar stays fixed below the scroll area.
+            self.ring = int((display.height - display.font_height) / display.font_height)
+            self.visible = self.ring
+            self.fixed_result = True
+        else:
+            # The whole screen scrolls, so the result bar is the row after the last visible line.
+            self.ring = int(display.height / display.font_height)
+            self.visible = self.ring - 1
+            self.fixed_result = False
+        display.set_scroll_area(self.ring * display.font_height)
+        self.top = 0
+        self.length = 0
+    
+    def y(self, line):
+        return (line % self.ring) * self.display.font_height
+    
+    def result_y(self):
+        if self.fixed_result:
+            return self.display.height - self.display.font_height
+        return self.y(self.top + self.visible)
+    
+    def last_line(self, length):
+        return max(0, int((length - 1) / self.display.width_ratio))
+    
+    def target_top(self, length):
+        # The window follows the last line once the expression is longer than the screen.
+        return max(0, self.last_line(length) - self.visible + 1)
+    
+    def clear_line(self, line):
+        self.display.fill_rect(0, self.y(line), self.display.width, self.display.font_height, Colors.BLACK)
+    
+    def draw_line(self, text, line):
+        ratio = self.display.width_ratio
+        self.display.text(text[ratio*line:ratio*(line+1)], 0, self.y(line))
+    
+    def scroll(self, text, top):
+        # Moves the window so it starts at line top, drawing only the lines that came into view.
+        # Returns whether the window moved.
+        if top == self.top:
+            return False
+        if abs(top - self.top) >= self.visible:
+            self.redraw(text)
+            return True
+        while self.top < top:
+            self.top += 1
+            line = self.top + self.visible - 1
+            self.clear_line(line)
+            self.draw_line(text, line)
+        while self.top > top:
+            self.top -= 1
+            self.clear_line(self.top)
+            self.draw_line(text, self.top)
+        if not self.fixed_result:
+            self.clear_line(self.top + self.visible)
+        self.display.scroll_to(self.y(self.top))
+        return True
+    
+    def redraw(self, text):
+        # Draws the whole window. Only needed when the expression is replaced.
+        self.top = self.target_top(len(text))
+        self.display.fill_rect(0, 0, self.display.width, self.ring * self.display.font_height, Colors.BLACK)
+        for line in range(self.top, self.top + self.visible):
+            self.draw_line(text, line)
+        self.length = len(text)
+        self.display.scroll_to(self.y(self.top))
+    
+    def append(self, text):
+        # text is the previous expression with one character appended.
+        index = len(text) - 1
+        if not self.scroll(text, self.target_top(len(text))):
+            ratio = self.display.width_ratio
+            self.display.text(text[index], (index % ratio) * self.display.font_width, self.y(int(index / ratio)))
+        self.length = len(text)
+    
+    def delete(self, text):
+        # text is the previous expression without its last character.
+        index = len(text)
+        ratio = self.display.width_ratio
+        self.display.fill_rect((index % ratio) * self.display.font_width, self.y(int(index / ratio)), self.display.font_width, self.display.font_height, Colors.BLACK)
+        self.scroll(text, self.target_top(len(text)))
+        self.length = len(text)
+    
+    def reset(self):
+        # Moves the window back to the top without drawing, for when the screen was cleared some other way.
+        self.top = 0
+        self.length = 0
+        self.display.scroll_to(0)
+    
+    def clear(self):
+        # Clears the lines in use and moves the window back to the top.
+        for line in range(self.top, min(self.top + self.visible, self.last_line(self.length) + 1)):
+            self.clear_line(line)
+        self.reset()
+
+
+class DrawOps:
+    # The drawing interface of Display, recording every call as a tuple like ("text", text, x, y, color, background).
+    # With a target display the calls are also forwarded right away, so slow drawing (like a plot) still shows up
+    # progressively. Without one, the geometry of the IPS display is used.
+    
+    def __init__(self, target=None, record=True, width=240, height=240, font_width=16, font_height=32, display_type="IPS"):
+        self.target = target
+        self.record = record
+        self.ops = []
+        if target is not None:
+            width = target.width
+            height = target.height
+            font_width = target.font_width
+            font_height = target.font_height
+            display_type = target.displayType
+        self.width = width
+        self.height = height
+        self.font_width = font_width
+        self.font_height = font_height
+        self.width_ratio = int(width / font_width)
+        self.displayType = display_type
+    
+    def op(self, *args):
+        if self.record:
+            self.ops.append(args)
+        if self.target is not None:
+            getattr(self.target, args[0])(*args[1:])
+    
+    def text(self, text, x, y, color=Colors.WHITE, background=Colors.BLACK):
+        if self.record and not isinstance(text, str):
+            # A formatted number is a view of a buffer that is reused, the recording needs its own copy
+            text = str(bytes(text), "ascii")
+        self.op("text", text, x, y, color, background)
+    
+    def screen(self, key, items, background=Colors.BLACK):
+        # A screen of fixed text, items are (text, x, y, color, font). It is recorded as its text operations,
+        # the display may draw it from its screen cache in one go.
+        if self.record:
+            for text, x, y, color, font in items:
+                self.ops.append(("text", text, x, y, color, background))
+        if self.target is not None:
+            self.target.screen(key, items, background)
+    
+    def fill(self, color):
+        self.op("fill", color)
+    
+    def fill_rect(self, x, y, width, height, color):
+        self.op("fill_rect", x, y, width, height, color)
+    
+    def show(self):
+        self.op("show")
+    
+    def set_scroll_area(self, height):
+        self.op("set_scroll_area", height)
+    
+    def scroll_to(self, y):
+        self.op("scroll_to", y)
+    
+    def take(self):
+        # Returns the operations recorded since the last call.
+        ops = self.ops
+        self.ops = []
+        return ops
+    
+    @staticmethod
+    def replay(ops, display):
+        for op in ops:
+            getattr(display, op[0])(*op[1:])
+
+
+class Calculator:
+    # The calculator state machine. step() handles one button and returns what it drew.
+    
+    def __init__(self, display: DrawOps):
+        self.display = display
+        self.viewport = Viewport(display)
+        
+        self.to_eval = ""
+        self.has_calculated = False
+        self.state = State.calculate
+        self.current_formula = 0
+        self.description_scroll = 0
+        self.provider_state = None
+        self.sweep = None
+        self.plot = None
+        self.matrix = None
+        self.diagnostics_page = 0
+        # High-precision mode, results are exact fractions whose digits are generated as the result line is scrolled
+        self.precise = False
+        self.result = None
+        self.result_offset = 0
+        # Last formula result, for unit conversion
+        self.result_value = None
+        self.result_unit = None
+        # Float results are formatted to fit the screen width
+        self.formatter = NumberFormatter(display.width_ratio)
+        # Rectangle of the cursor while it is drawn
+        self.cursor_at = None
+        
+        self.handlers = {
+            Buttons.sleep: self.sleep,
+            Buttons.back: self.back,
+            Buttons.ok: self.ok,
+            Buttons.convert: self.convert,
+            Buttons.plot: self.start_plot,
+            Buttons.menu: self.menu,
+            Buttons.cancel: self.cancel,
+            Buttons.delete: self.delete,
+            Buttons.down: self.down,
+            Buttons.up: self.up,
+            Buttons.scroll_down: self.scroll_down,
+            Buttons.scroll_up: self.scroll_up,
+            Buttons.diagnostics: self.diagnostics,
+            Buttons.precision: self.toggle_precision,
+        }
+    
+    def step(self, button):
+        # Handles one button and returns the drawing operations it caused.
+        if type(button) == str:
+            self.key(button)
+        else:
+            handler = self.handlers.get(button)
+            if handler:
+                handler()
+        return self.display.take()
+    
+    def cursor(self, visible):
+        # Draws or erases the cursor after the expression, only the calculate state has one.
+        # It has to be erased before the next step, the step doesn't know it is there.
+        lcd = self.display
+        if self.cursor_at is not None:
+            x, y, width, height = self.cursor_at
+            lcd.fill_rect(x, y, width, height, Colors.BLACK)
+            self.cursor_at = None
+        if visible and self.state == State.calculate and not self.has_calculated:
+            index = len(self.to_eval)
+            line = int(index / lcd.width_ratio)
+            viewport = self.viewport
+            if viewport.top <= line < viewport.top + viewport.visible:
+                self.cursor_at = ((index % lcd.width_ratio) * lcd.font_width, viewport.y(line) + lcd.font_height - 2, lcd.font_width, 2)
+                x, y, width, height = self.cursor_at
+                lcd.fill_rect(x, y, width, height, Colors.WHITE)
+        lcd.show()
+        return lcd.take()
+    
+    def subsystem(self):
+        # Name of the current state, for per-state statistics.
+        return State.names[self.state]
+    
+    def run(self, buttons):
+        # Feeds a sequence of buttons, for scripted input.
+        for button in buttons:
+            self.step(button)
+    
+    def redraw_providers(self, marker=True):
+        lcd = self.display
+        provider_state = self.provider_state
+        
+        if not provider_state:
+            return
+        
+        self.optimized_clear()
+        
+        for i in range(len(provider_state.providers)):
+            provider = provider_state.providers[i]
+            lcd.text(provider.provider_name, 2 * lcd.font_width, i * lcd.font_height)
+            lcd.text(provider_state.values[i], ProviderState.value_x(lcd, provider), i * lcd.font_height, Colors.YELLOW)
+        if marker:
+            lcd.text("→", 0, provider_state.at_provider * lcd.font_height)
+        lcd.show()
+    
+    def move_provider_marker(self, at_provider):
+        # Moves the selection marker, only the two marker cells are redrawn.
+        lcd = self.display
+        lcd.fill_rect(0, self.provider_state.at_provider * lcd.font_height, lcd.font_width, lcd.font_height, Colors.BLACK)
+        self.provider_state.at_provider = at_provider
+        lcd.text("→", 0, at_provider * lcd.font_height)
+        lcd.show()
+    
+    def redraw(self):
+        # Draws the screen of the current state from nothing, for a state that was restored (see session.py)
+        # or a screen that was blanked by sleep.
+        # A calculated result is calculated again, a high-precision one needs its digit generator back anyway.
+        lcd = self.display
+        lcd.fill(Colors.BLACK)
+        self.viewport.reset()
+        if self.state == State.sweep:
+            self.sweep.draw()
+        elif self.state == State.plot:
+            self.plot.render()
+        elif self.state == State.diagnostics:
+            self.draw_diagnostics()
+        elif self.state == State.matrix:
+            self.matrix.draw()
+        elif self.state == State.formula_overview:
+            Formulas.lcd_formula_overview(lcd, self.current_formula, self.description_scroll)
+        elif self.state == State.formula_calculation:
+            y = lcd.height - lcd.font_height
+            if self.provider_state:
+                self.redraw_providers()
+            elif self.to_eval:
+                self.draw_number(self.result_value if self.result_value is not None else self.to_eval, y, self.result_unit)
+            else:
+                lcd.text("NAPAKA", 0, y, Colors.RED)
+        elif self.has_calculated:
+            self.ok()
+        else:
+            self.viewport.redraw(self.to_eval)
+        lcd.show()
+    
+    def reset_provider_state(self):
+        self.provider_state = None
+    
+    @timed("optimized_clear")
+    def optimized_clear(self):
+        lcd = self.display
+        state = self.state
+        if state == State.formula_overview:
+            lcd.fill(Colors.BLACK)
+        elif state == State.calculate:
+            # We clear the result bar
+            if self.has_calculated:
+                lcd.fill_rect(0, self.viewport.result_y(), lcd.width, lcd.font_height, Colors.BLACK)
+            
+            self.viewport.clear()
+        elif state == State.formula_calculation:
+            lcd.fill_rect(0, lcd.height - lcd.font_height, lcd.width, lcd.font_height, Colors.BLACK)
+            providers = Formulas.formulas[self.current_formula].providers
+            lcd.fill_rect(0, 0, lcd.width, len(providers) * lcd.font_height, Colors.BLACK)
+        elif state == State.sweep or state == State.plot or state == State.diagnostics or state == State.matrix:
+            lcd.fill(Colors.BLACK)
+    
+    def key(self, m):
+        lcd = self.display
+        if self.state == State.calculate:
+            if self.has_calculated:
+                self.optimized_clear()
+                self.has_calculated = False
+                self.to_eval += m
+                self.viewport.redraw(self.to_eval)
+            else:
+                inverse = Functions.inverse.get(m)
+                if inverse and self.to_eval.endswith(m):
+                    for c in m:
+                        self.to_eval = self.to_eval[:-1]
+                        self.viewport.delete(self.to_eval)
+                    m = inverse
+                # Function keys type more than one character
+                for c in m:
+                    self.to_eval += c
+                    self.viewport.append(self.to_eval)
+        elif self.state == State.formula_calculation:
+            provider_state = self.provider_state
+            if provider_state:
+                i = provider_state.at_provider
+                provider_state.values[i] += m
+                lcd.text(provider_state.values[i], ProviderState.value_x(lcd, provider_state.providers[i]), i * lcd.font_height, Colors.YELLOW)
+            else:
+                lcd.fill(Colors.BLACK)
+                self.state = State.calculate
+                self.to_eval += m
+                self.viewport.redraw(self.to_eval)
+        elif self.state == State.plot:
+            # Digits move the plot like arrow keys, + and - zoom
+            plot = self.plot
+            step = int(lcd.width / 8)
+            if m == Buttons.four:
+                plot.pan(-step, 0)
+            elif m == Buttons.six:
+                plot.pan(step, 0)
+            elif m == Buttons.two:
+                plot.pan(0, step)
+            elif m == Buttons.eight:
+                plot.pan(0, -step)
+            elif m == Buttons.plus:
+                plot.zoom(2)
+            elif m == Buttons.minus:
+                plot.zoom(0.5)
+        elif self.state == State.matrix:
+            self.matrix.key(m)
+        lcd.show()
+    
+    def sleep(self):
+        self.display.fill(Colors.BLACK)
+        self.display.show()
+    
+    def back(self):
+        if self.provider_state and self.state == State.formula_calculation and self.provider_state.at_provider > 0:
+            self.move_provider_marker(self.provider_state.at_provider - 1)
+    
+    def ok(self):
+        lcd = self.display
+        viewport = self.viewport
+        if self.state == State.diagnostics:
+            profiler.dump()
+        elif self.state == State.matrix:
+            self.matrix.ok()
+            lcd.show()
+        elif self.state == State.calculate:
+            lcd.fill_rect(0, viewport.result_y(), lcd.width, lcd.font_height, Colors.BLACK)
+            try:
+                self.result = None
+                self.result_offset = 0
+                if self.precise:
+                    try:
+                        self.result = precise.evaluate(Math.prepare(self.to_eval))
+                    except precise.Inexact as e:
+                        print(f"[PRECISE] {e}, calculating with floats")
+                if self.result:
+                    self.to_eval = self.result.expression()
+                    self.optimized_clear()
+                    self.draw_result()
+                else:
+                    value = Math.evaluate(self.to_eval)
+                    self.to_eval = str(value)
+                    self.optimized_clear()
+                    self.draw_number(value, viewport.result_y())
+            except:
+                self.result = None
+                lcd.fill(Colors.BLACK)
+                viewport.reset()
+                lcd.text("NAPAKA", 0, viewport.result_y(), Colors.RED)
+                self.to_eval = ""
+            lcd.show()
+            self.has_calculated = True
+        elif self.state == State.formula_overview:
+            lcd.fill(0)
+            self.state = State.formula_calculation
+            self.provider_state = ProviderState(self.current_formula)
+            self.redraw_providers()
+        elif self.state == State.formula_calculation:
+            provider_state = self.provider_state
+            if provider_state:
+                if provider_state.at_provider < len(provider_state.providers) - 1:
+                    self.move_provider_marker(provider_state.at_provider + 1)
+                else:
+                    self.redraw_providers(marker=False)
+                    try:
+                        self.sweep = Sweep.from_provider_state(lcd, provider_state)
+                        if self.sweep:
+                            self.state = State.sweep
+                            self.sweep.draw()
+                        else:
+                            value, unit = Formulas.evaluate(provider_state)
+                            self.result_value, self.result_unit = value, unit
+                            self.to_eval = str(value)
+                            self.draw_number(value, lcd.height-lcd.font_height, unit)
+                    except Exception as e:
+                        print(e)
+                        lcd.text("NAPAKA", 0, lcd.height-lcd.font_height, Colors.RED)
+                        self.to_eval = ""
+                        self.result_value = None
+                        self.result_unit = None
+                    lcd.show()
+                    self.reset_provider_state()
+    
+    def convert(self):
+        # Converts the last formula result to the next unit of the same dimension
+        lcd = self.display
+        if self.state == State.formula_calculation and not self.provider_state and self.result_unit:
+            options = units.alternatives(self.result_unit)
+            if len(options) > 1:
+                i = options.index(self.result_unit) if self.result_unit in options else -1
+                target = options[(i + 1) % len(options)]
+                self.result_value = units.convert(self.result_value, self.result_unit, target)
+                self.result_unit = target
+                self.to_eval = str(self.result_value)
+                lcd.fill_rect(0, lcd.height-lcd.font_height, lcd.width, lcd.font_height, Colors.BLACK)
+                self.draw_number(self.result_value, lcd.height-lcd.font_height, self.result_unit)
+                lcd.show()
+    
+    def start_plot(self):
+        lcd = self.display
+        if self.state == State.calculate and self.to_eval:
+            try:
+                self.plot = Plot(lcd, Math.compile(self.to_eval, Buttons.x), Colors.YELLOW, Colors.BLUE)
+                # The plot uses the whole screen, so the expression window goes back to the top
+                self.viewport.reset()
+                self.plot.render()
+                self.state = State.plot
+                print(f"[PLOT] {self.plot.evaluations} evaluations")
+            except Exception as e:
+                print(e)
+                if self.plot is not None:
+                    # The plot may have covered the expression
+                    self.plot = None
+                    lcd.fill(Colors.BLACK)
+                    self.viewport.redraw(self.to_eval)
+                lcd.fill_rect(0, self.viewport.result_y(), lcd.width, lcd.font_height, Colors.BLACK)
+                lcd.text("NAPAKA", 0, self.viewport.result_y(), Colors.RED)
+                lcd.show()
+    
+    def menu(self):
+        if self.state == State.formula_overview:
+            # The menu key in the formula menu opens the matrix mode
+            self.start_matrix()
+            return
+        self.reset_provider_state()
+        self.sweep = None
+        self.plot = None
+        self.matrix = None
+        self.result_unit = None
+        self.optimized_clear()
+        self.state = State.formula_overview
+        self.description_scroll = 0
+        Formulas.lcd_formula_overview(self.display, self.current_formula)
+    
+    def start_matrix(self):
+        self.optimized_clear()
+        self.state = State.matrix
+        self.matrix = MatrixMode(self.display, self.formatter)
+        self.matrix.draw()
+        self.display.show()
+    
+    def cancel(self):
+        self.optimized_clear()
+        self.reset_provider_state()
+        self.sweep = None
+        self.plot = None
+        self.matrix = None
+        self.result_unit = None
+        
+        self.state = State.calculate
+        self.to_eval = ""
+        
+        self.display.show()
+    
+    def delete(self):
+        lcd = self.display
+        if self.state == State.calculate:
+            if self.to_eval:
+                self.to_eval = self.to_eval[:-1]
+                self.viewport.delete(self.to_eval)
+        elif self.state == State.formula_calculation:
+            provider_state = self.provider_state
+            if provider_state:
+                # This means we are still in the process of calculating this formula and we are just deleting last entered value
+                # Cut off last digit
+                i = provider_state.at_provider
+                provider_state.values[i] = provider_state.values[i][:-1]
+                x = ProviderState.value_x(lcd, provider_state.providers[i]) + len(provider_state.values[i]) * lcd.font_width
+                lcd.fill_rect(x, i*lcd.font_height, lcd.font_width, lcd.font_height, Colors.BLACK)
+            else:
+                self.optimized_clear()
+                self.state = State.calculate
+                self.to_eval = self.to_eval[:-1]
+                self.viewport.redraw(self.to_eval)
+        elif self.state == State.matrix:
+            self.matrix.delete()
+        lcd.show()
+    
+    def select_formula(self, current_formula):
+        self.current_formula = current_formula
+        self.description_scroll = 0
+        self.optimized_clear()
+        Formulas.lcd_formula_overview(self.display, current_formula)
+    
+    def down(self):
+        if self.state == State.sweep:
+            self.sweep.next_page()
+        elif self.state == State.diagnostics:
+            self.diagnostics_page += 1
+            self.draw_diagnostics()
+        elif self.state == State.formula_overview:
+            self.select_formula(self.current_formula + 1 if self.current_formula < len(Formulas.formulas) - 1 else 0)
+    
+    def up(self):
+        if self.state == State.sweep:
+            self.sweep.previous_page()
+        elif self.state == State.diagnostics:
+            self.diagnostics_page -= 1
+            self.draw_diagnostics()
+        elif self.state == State.formula_overview:
+            self.select_formula(self.current_formula - 1 if self.current_formula > 0 else len(Formulas.formulas) - 1)
+    
+    def draw_number(self, value, y, unit=None):
+        # Draws a float result in the line at y, the one way results of calculations and formulas are shown.
+        # The number is fitted to what the unit leaves of the line, formula results with a unit use
+        # engineering notation so the exponent matches the SI prefixes.
+        lcd = self.display
+        if not isinstance(value, (int, float)):
+            # Like a complex number
+            lcd.text(str(value), 0, y, Colors.YELLOW)
+            return
+        if unit:
+            unit = str(unit)
+        width = lcd.width_ratio - (len(unit) + 1 if unit else 0)
+        length = self.formatter.format(value, width, engineering=bool(unit))
+        lcd.text(self.formatter.view(), 0, y, Colors.YELLOW)
+        if unit:
+            lcd.text(unit, (length + 1) * lcd.font_width, y, Colors.YELLOW)
+    
+    def draw_result(self):
+        # Draws the visible part of the high-precision result, only those digits are ever generated.
+        lcd = self.display
+        y = self.viewport.result_y()
+        lcd.fill_rect(0, y, lcd.width, lcd.font_height, Colors.BLACK)
+        lcd.text(self.result.window(self.result_offset, lcd.width_ratio), 0, y, Colors.YELLOW)
+    
+    def scroll_result(self, direction):
+        # Moves the result line by a screen width, less the → marker.
+        if not (self.state == State.calculate and self.has_calculated and self.result):
+            return False
+        step = self.display.width_ratio - 1
+        offset = self.result_offset + direction * step
+        if offset < 0 or (direction > 0 and not self.result.more(offset)):
+            return True
+        self.result_offset = offset
+        self.draw_result()
+        self.display.show()
+        return True
+    
+    def toggle_precision(self):
+        if self.state == State.diagnostics:
+            # The math library is switched where the timings are, so both can be compared on the device
+            Math.select(not Math.fast)
+            self.draw_diagnostics()
+            return
+        self.precise = not self.precise
+        if self.state == State.calculate:
+            lcd = self.display
+            y = self.viewport.result_y()
+            lcd.fill_rect(0, y, lcd.width, lcd.font_height, Colors.BLACK)
+            lcd.text("NATANCNO" if self.precise else "PRIBLIZNO", 0, y, Colors.CYAN)
+            lcd.show()
+    
+    def scroll_down(self):
+        if self.scroll_result(1):
+            return
+        if self.state == State.matrix:
+            self.matrix.scroll(1)
+            self.display.show()
+        if self.state == State.formula_overview and self.description_scroll < Formulas.max_description_scroll(self.current_formula, self.display.width_ratio):
+            self.description_scroll += 1
+            Formulas.lcd_description(self.display, self.current_formula, self.description_scroll)
+            self.display.show()
+    
+    def scroll_up(self):
+        if self.scroll_result(-1):
+            return
+        if self.state == State.matrix:
+            self.matrix.scroll(-1)
+            self.display.show()
+        if self.state == State.formula_overview and self.description_scroll > 0:
+            self.description_scroll -= 1
+            Formulas.lcd_description(self.display, self.current_formula, self.description_scroll)
+            self.display.show()
+    
+    def diagnostics(self):
+        # Hidden screen with the profiler counters. Up and down page through them, OK dumps them over serial.
+        self.reset_provider_state()
+        self.sweep = None
+        self.plot = None
+        self.matrix = None
+        self.viewport.reset()
+        self.state = State.diagnostics
+        self.diagnostics_page = 0
+        self.draw_diagnostics()
+    
+    def draw_diagnostics(self):
+        lcd = self.display
+        width = lcd.width_ratio
+        lines = []
+        for name, value in profiler.gauges():
+            lines.append((name[:width], Colors.WHITE))
+            lines.append((f"  {value}"[:width], Colors.YELLOW))
+        for name in profiler.names:
+            s = profiler.stats[name]
+            lines.append((name[:width], Colors.WHITE))
+            lines.append((f"  {s.average()}/{s.max}us"[:width], Colors.YELLOW))
+        per_page = int(lcd.height / lcd.font_height) - 1
+        pages = max(1, int((len(lines) + per_page - 1) / per_page))
+        self.diagnostics_page %= pages
+        lcd.fill(Colors.BLACK)
+        lcd.text(f"DIAG {self.diagnostics_page + 1}/{pages}", 0, 0, Colors.RED)
+        first = self.diagnostics_page * per_page
+        for i in range(min(per_page, len(lines) - first)):
+            text, color = lines[first + i]
+            lcd.text(text, 0, (i + 1) * lcd.font_height, color)
+        lcd.show()
@@ -0,0 +1,162 @@
+# Off-screen RGB565 strip compositor for the ST7789 IPS backend
+#
+# Every text/fill_rect call on the st7789 driver sets up its own address window
+# on the (slow, software) SPI bus. The compositor collects the drawing between
+# two show() calls instead and pushes it with as few blit_buffer calls as
+# possible.
+#
+# A copy of the whole panel would take 240 * 240 * 2 = 115200 bytes, about half
+# of the heap. It isn't needed: every drawing operation is opaque, fills cover
+# their rectangle and text and bitmaps draw their background too, so the pixels
+# of everything drawn since the last show() follow from those operations alone.
+# show() merges their rectangles, dropping the ones inside others and joining
+# neighbours that make a rectangle together (like the runs of a line of text),
+# and renders each merged rectangle into a framebuf.RGB565 strip of STRIP_ROWS
+# rows of the screen width, replaying the operations that touch it in order.
+# Each strip goes out in one blit_buffer.
+
+from micropython import const
+import framebuf
+
+import fonts
+
+
+STRIP_ROWS = const(16)
+
+# Operations, recorded as (kind, x, y, width, height, ...) with the rectangle clipped to the screen
+FILL_RECT = const(0)
+TEXT = const(1)
+BITMAP = const(2)
+
+
+def swap_bytes(color):
+    # framebuf stores RGB565 pixels little endian, the panel expects big endian.
+    return ((color & 0xFF) << 8) | (color >> 8)
+
+
+def join(a, b):
+    # The rectangle covered by a and b together, None if that isn't a rectangle.
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    if ax <= bx and ay <= by and bx + bw <= ax + aw and by + bh <= ay + ah:
+        return a
+    if bx <= ax and by <= ay and ax + aw <= bx + bw and ay + ah <= by + bh:
+        return b
+    if ay == by and ah == bh and ax <= bx + bw and bx <= ax + aw:
+        x = min(ax, bx)
+        return (x, ay, max(ax + aw, bx + bw) - x, ah)
+    if ax == bx and aw == bw and ay <= by + bh and by <= ay + ah:
+        y = min(ay, by)
+        return (ax, y, aw, max(ay + ah, by + bh) - y)
+    return None
+
+
+def merge(rects):
+    rects = list(rects)
+    merged = True
+    while merged:
+        merged = False
+        i = 0
+        while i < len(rects):
+            j = i + 1
+            while j < len(rects):
+                r = join(rects[i], rects[j])
+                if r is None:
+                    j += 1
+                else:
+                    rects[i] = r
+                    rects.pop(j)
+                    merged = True
+            i += 1
+    return rects
+
+
+class StripCompositor:
+    def __init__(self, display, width, height, strip_rows=STRIP_ROWS):
+        self.display = display
+        self.width = width
+        self.height = height
+
+        self.scratch = bytearray(width * strip_rows * 2)
+        # Operations since the last show()
+        self.ops = []
+
+        self.palette = framebuf.FrameBuffer(bytearray(4), 2, 1, framebuf.RGB565)
+        # Pixel data sent to the panel
+        self.bytes_pushed = 0
+
+    def add(self, kind, x, y, width, height, *args):
+        x0 = max(x, 0)
+        y0 = max(y, 0)
+        x1 = min(x + width, self.width)
+        y1 = min(y + height, self.height)
+        if x0 >= x1 or y0 >= y1:
+            return
+        self.ops.append((kind, x0, y0, x1 - x0, y1 - y0, x, y) + args)
+
+    def fill(self, color):
+        # Covers everything drawn before it
+        self.ops = []
+        self.add(FILL_RECT, 0, 0, self.width, self.height, swap_bytes(color))
+
+    def fill_rect(self, x, y, width, height, color):
+        self.add(FILL_RECT, x, y, width, height, swap_bytes(color))
+
+    def text(self, font, text, x, y, color, background):
+        if not isinstance(text, str):
+            # A formatted number is a view of a buffer that is reused before show()
+            text = bytes(text)
+        self.add(TEXT, x, y, len(text) * font.WIDTH, font.HEIGHT, font, text, swap_bytes(color), swap_bytes(background))
+
+    def bitmap(self, source, x, y, width, height, color, background):
+        # Draws a MONO_HLSB framebuffer in two colors. It is read in show(), so it has to stay unchanged until then.
+        self.add(BITMAP, x, y, width, height, source, swap_bytes(color), swap_bytes(background))
+
+    def show(self):
+        # Pushes everything drawn since the last show() to the panel.
+        ops = self.ops
+        if not ops:
+            return
+        for x, y, width, height in merge(op[1:5] for op in ops):
+            self.push(x, y, width, height)
+        self.ops = []
+
+    def push(self, x, y, width, height):
+        # Renders a rectangle covered by the operations, a strip at a time, and sends it.
+        rows = max(1, len(self.scratch) // (width * 2))
+        for top in range(y, y + height, rows):
+            n = min(rows, y + height - top)
+            strip = framebuf.FrameBuffer(self.scratch, width, n, framebuf.RGB565)
+            for op in self.ops:
+                if op[1] < x + width and x < op[1] + op[3] and op[2] < top + n and top < op[2] + op[4]:
+                    self.draw(strip, op, x, top, width)
+            self.display.blit_buffer(memoryview(self.scratch)[:width * n * 2], x, top, width, n)
+            self.bytes_pushed += width * n * 2
+
+    def draw(self, strip, op, left, top, width):
+        # Draws an operation into a strip whose top left corner is at (left, top) on the screen.
+        kind = op[0]
+        x = op[5] - left
+        y = op[6] - top
+        if kind == FILL_RECT:
+            strip.fill_rect(op[1] - left, op[2] - top, op[3], op[4], op[7])
+            return
+        palette = self.palette
+        if kind == BITMAP:
+            source, color, background = op[7:]
+            palette.pixel(0, 0, background)
+            palette.pixel(1, 0, color)
+            strip.blit(source, x, y, -1, palette)
+            return
+        font, text, color, background = op[7:]
+        palette.pixel(0, 0, background)
+        palette.pixel(1, 0, color)
+        for char in text:
+            # Glyphs outside of the strip are skipped, a line of text is replayed for every strip it crosses
+            if -font.WIDTH < x < width:
+                # Formatted numbers come as bytes, fonts.code() takes both
+                c = fonts.code(char)
+                if not font.has(c):
+                    c = 0x3F
+                strip.blit(font.glyph(c), x, y, -1, palette)
+            x += font.WIDTH
@@ -39,8 +39,13 @@ Python's deep copy operation avoids these problems by:
     set of components copied
 
 This version does not copy types like module, class, function, method,
-nor stack trace, stack frame, nor file, socket, window, nor array, nor
-any similar types.
+nor stack trace, stack frame, nor file, socket, window, nor any similar
+types. bytearray and array.array are copied by slicing.
+
+deepcopy() doesn't recurse: it works through an explicit stack, so deeply
+nested data can't overflow MicroPython's small C stack. The way each class
+is copied is worked out once and cached, containers holding only atomic
+values are copied in one step, and only mutable objects go into the memo.
 
 Classes can use the same interfaces to control copying that they use
 to control pickling: they can define methods called __getinitargs__(),
@@ -48,8 +53,6 @@ __getstate__() and __setstate__().  See the documentation for module
 "pickle" for information on these methods.
 """
 
-import types
-
 # import weakref
 # from copyreg import dispatch_table
 # import builtins
@@ -67,13 +70,64 @@ except ImportError:
     OrderedDict = None
 
 try:
-    from org.python.core import PyStringMap
+    from array import array as _array
 except ImportError:
-    PyStringMap = None
+    _array = None
 
 __all__ = ["Error", "copy", "deepcopy"]
 
 
+# The few type objects copying needs, made here instead of importing types,
+# which builds a lot more than this on import.
+def _f():
+    pass
+
+
+class _C:
+    def _m(self):
+        pass
+
+
+_FunctionType = type(_f)
+_BuiltinFunctionType = type(len)
+_MethodType = type(_C()._m)
+_code = getattr(_f, "__code__", None)
+_CodeType = type(_code) if _code is not None else None
+
+del _f, _C, _code
+
+
+_atomic_types = [
+    type(None),
+    type(Ellipsis),
+    int,
+    float,
+    bool,
+    bytes,
+    str,
+    type,
+    range,
+    _BuiltinFunctionType,
+    _FunctionType,
+    _CodeType,
+]
+try:
+    _atomic_types.append(complex)
+except NameError:
+    pass
+_atomic_types = tuple(t for t in _atomic_types if t is not None)
+
+
+def _default(name):
+    # The object implementation of a special method, None if there is none (MicroPython)
+    return getattr(object, name, None)
+
+
+_DEFAULT_REDUCE_EX = _default("__reduce_ex__")
+_DEFAULT_REDUCE = _default("__reduce__")
+_DEFAULT_GETSTATE = _default("__getstate__")
+
+
 def copy(x):
     """Shallow copy operation on arbitrary Python objects.
 
@@ -90,24 +144,13 @@ def copy(x):
     if copier:
         return copier(x)
 
-    raise Error("un(shallow)copyable object of type %s" % cls)
-
-    dispatch_table = {}
-    reductor = dispatch_table.get(cls)
-    if reductor:
-        rv = reductor(x)
-    else:
-        reductor = getattr(x, "__reduce_ex__", None)
-        if reductor:
-            rv = reductor(2)
-        else:
-            reductor = getattr(x, "__reduce__", None)
-            if reductor:
-                rv = reductor()
-            else:
-                raise Error("un(shallow)copyable object of type %s" % cls)
+    if _strategy(cls) == _INSTANCE:
+        y = cls.__new__(cls)
+        for name, value in _instance_state(x):
+            setattr(y, name, value)
+        return y
 
-    return _reconstruct(x, rv, 0)
+    raise Error("un(shallow)copyable object of type %s" % cls)
 
 
 _copy_dispatch = d = {}
@@ -117,27 +160,13 @@ def _copy_immutable(x):
     return x
 
 
-for t in (
-    type(None),
-    int,
-    float,
-    bool,
-    str,
-    tuple,
-    type,
-    range,
-    types.BuiltinFunctionType,
-    type(Ellipsis),
-    types.FunctionType,
-):
-    d[t] = _copy_immutable
-t = getattr(types, "CodeType", None)
-if t is not None:
+for t in _atomic_types:
     d[t] = _copy_immutable
 # for name in ("complex", "unicode"):
 #    t = getattr(builtins, name, None)
 #    if t is not None:
 #        d[t] = _copy_immutable
+d[tuple] = _copy_immutable
 
 
 def _copy_with_constructor(x):
@@ -150,151 +179,244 @@ if OrderedDict is not None:
     d[OrderedDict] = _copy_with_constructor
 
 
-def _copy_with_copy_method(x):
-    return x.copy()
+def _copy_with_slice(x):
+    return x[:]
 
 
-if PyStringMap is not None:
-    d[PyStringMap] = _copy_with_copy_method
+d[bytearray] = _copy_with_slice
+if _array is not None:
+    d[_array] = _copy_with_slice
 
 del d
 
 
-def deepcopy(x, memo=None, _nil=[]):
-    """Deep copy operation on arbitrary Python objects.
-
-    See the module's __doc__ string for more info.
-    """
-
-    if memo is None:
-        memo = {}
-
-    d = id(x)
-    y = memo.get(d, _nil)
-    if y is not _nil:
-        return y
-
-    cls = type(x)
-
-    copier = _deepcopy_dispatch.get(cls)
-    if copier:
-        y = copier(x, memo)
-    else:
-        try:
-            issc = issubclass(cls, type)
-        except TypeError:  # cls is not a class (old Boost; see SF #502085)
-            issc = 0
-        if issc:
-            y = _deepcopy_atomic(x, memo)
-        else:
-            copier = getattr(x, "__deepcopy__", None)
-            if copier:
-                y = copier(memo)
-            else:
-                reductor = dispatch_table.get(cls)
-                if reductor:
-                    rv = reductor(x)
-                else:
-                    reductor = getattr(x, "__reduce_ex__", None)
-                    if reductor:
-                        rv = reductor(2)
-                    else:
-                        reductor = getattr(x, "__reduce__", None)
-                        if reductor:
-                            rv = reductor()
-                        else:
-                            raise Error("un(deep)copyable object of type %s" % cls)
-                y = _reconstruct(x, rv, 1, memo)
-
-    # If is its own copy, don't memoize.
-    if y is not x:
-        memo[d] = y
-        _keep_alive(x, memo)  # Make sure x lives at least as long as d
-    return y
-
-
-_deepcopy_dispatch = d = {}
-
-
-def _deepcopy_atomic(x, memo):
-    return x
-
-
-d[type(None)] = _deepcopy_atomic
-d[type(Ellipsis)] = _deepcopy_atomic
-d[int] = _deepcopy_atomic
-d[float] = _deepcopy_atomic
-d[bool] = _deepcopy_atomic
-try:
-    d[complex] = _deepcopy_atomic
-except NameError:
-    pass
-d[bytes] = _deepcopy_atomic
-d[str] = _deepcopy_atomic
-try:
-    d[types.CodeType] = _deepcopy_atomic
-except AttributeError:
-    pass
-d[type] = _deepcopy_atomic
-d[range] = _deepcopy_atomic
-d[types.BuiltinFunctionType] = _deepcopy_atomic
-d[types.FunctionType] = _deepcopy_atomic
-# d[weakref.ref] = _deepcopy_atomic
-
-
-def _deepcopy_list(x, memo):
-    y = []
-    memo[id(x)] = y
-    for a in x:
-        y.append(deepcopy(a, memo))
-    return y
+# How deepcopy() copies an object, decided once per class by _strategy()
+_ATOMIC = 0
+_LIST = 1
+_TUPLE = 2
+_DICT = 3
+_SET = 4
+_FROZENSET = 5
+_SLICE = 6
+_INSTANCE = 7
+_METHOD = 8
+_DEEPCOPY = 9
+_REDUCE = 10
+
+# CPython flags classes defined in Python, built-in types can't be created empty
+_HEAPTYPE = 1 << 9
+
+_strategies = {}
+for t in _atomic_types:
+    _strategies[t] = _ATOMIC
+_strategies[list] = _LIST
+_strategies[tuple] = _TUPLE
+_strategies[dict] = _DICT
+_strategies[set] = _SET
+_strategies[frozenset] = _FROZENSET
+_strategies[bytearray] = _SLICE
+_strategies[_MethodType] = _METHOD
+if OrderedDict is not None:
+    _strategies[OrderedDict] = _DICT
+if _array is not None:
+    _strategies[_array] = _SLICE
 
 
-d[list] = _deepcopy_list
+def _strategy(cls):
+    strategy = _strategies.get(cls)
+    if strategy is None:
+        strategy = _classify(cls)
+        _strategies[cls] = strategy
+    return strategy
 
 
-def _deepcopy_tuple(x, memo):
-    y = []
-    for a in x:
-        y.append(deepcopy(a, memo))
-    # We're not going to put the tuple in the memo, but it's still important we
-    # check for it, in case the tuple contains recursive mutable structures.
+def _classify(cls):
     try:
-        return memo[id(x)]
-    except KeyError:
+        if issubclass(cls, type):
+            return _ATOMIC
+    except TypeError:  # cls is not a class (old Boost; see SF #502085)
         pass
-    for i in range(len(x)):
-        if x[i] is not y[i]:
-            y = tuple(y)
+    if getattr(cls, "__deepcopy__", None):
+        return _DEEPCOPY
+    if (
+        getattr(cls, "__reduce_ex__", None) is _DEFAULT_REDUCE_EX
+        and getattr(cls, "__reduce__", None) is _DEFAULT_REDUCE
+        and getattr(cls, "__getstate__", None) is _DEFAULT_GETSTATE
+        and not hasattr(cls, "__setstate__")
+        and not hasattr(cls, "__getnewargs__")
+        and not hasattr(cls, "__getnewargs_ex__")
+        and (hasattr(cls, "__dict__") or hasattr(cls, "__slots__"))
+        and getattr(cls, "__flags__", _HEAPTYPE) & _HEAPTYPE
+    ):
+        # A plain class: a new instance gets copies of the attributes
+        for base in (list, dict, set, tuple, bytearray):
+            if issubclass(cls, base):
+                return _REDUCE
+        return _INSTANCE
+    if getattr(cls, "__reduce_ex__", None) or getattr(cls, "__reduce__", None):
+        return _REDUCE
+    raise Error("un(deep)copyable object of type %s" % cls)
+
+
+def _instance_state(x):
+    # (name, value) pairs of the attributes of a plain instance, from __dict__ and __slots__
+    state = getattr(x, "__dict__", None)
+    if state:
+        for item in state.items():
+            yield item
+    for cls in getattr(type(x), "__mro__", (type(x),)):
+        slots = cls.__dict__.get("__slots__", ()) if hasattr(cls, "__dict__") else ()
+        if isinstance(slots, str):
+            slots = (slots,)
+        for name in slots:
+            if name not in ("__dict__", "__weakref__") and hasattr(x, name):
+                yield name, getattr(x, name)
+
+
+def _is_flat(items):
+    for a in items:
+        if _strategies.get(type(a)) != _ATOMIC:
+            return False
+    return True
+
+
+def _finish_tuple(x, items, parent, key, memo):
+    # A tuple that reaches itself through its items was already built while they were copied,
+    # that copy is the one the items refer to
+    y = memo.get(id(x))
+    if y is not None:
+        parent[key] = y
+        return
+    y = tuple(items)
+    # A tuple whose items are all copied as themselves is its own copy
+    for i in range(len(y)):
+        if y[i] is not x[i]:
+            memo[id(x)] = y
             break
     else:
         y = x
-    return y
+    parent[key] = y
 
 
-d[tuple] = _deepcopy_tuple
+def _finish_frozenset(x, items, parent, key, memo):
+    y = frozenset(items)
+    memo[id(x)] = y
+    parent[key] = y
 
 
-def _deepcopy_dict(x, memo):
-    y = type(x)()
-    memo[id(x)] = y
-    for key, value in x.items():
-        y[deepcopy(key, memo)] = deepcopy(value, memo)
-    return y
+def _finish_set(y, items):
+    for a in items:
+        y.add(a)
 
 
-d[dict] = _deepcopy_dict
-if OrderedDict is not None:
-    d[OrderedDict] = _deepcopy_dict
-if PyStringMap is not None:
-    d[PyStringMap] = _deepcopy_dict
+def _finish_instance(y, state):
+    for name, value in state.items():
+        setattr(y, name, value)
 
 
-def _deepcopy_method(x, memo):  # Copy instance methods
-    return type(x)(x.__func__, deepcopy(x.__self__, memo))
+def deepcopy(x, memo=None, _nil=[]):
+    """Deep copy operation on arbitrary Python objects.
 
+    See the module's __doc__ string for more info.
+    """
 
-_deepcopy_dispatch[types.MethodType] = _deepcopy_method
+    if memo is None:
+        memo = {}
+
+    # Every task either copies one object into parent[key], (x, parent, key), or
+    # finishes an object whose items have been copied, (function, arguments). Tasks pushed later run first, so the items of
+    # a tuple or set are always complete by the time it is built.
+    root = [None]
+    stack = [(x, root, 0)]
+    while stack:
+        task = stack.pop()
+        if len(task) == 2:
+            task[0](*task[1])
+            continue
+        x, parent, key = task
+        cls = type(x)
+        strategy = _strategies.get(cls)
+        if strategy is None:
+            strategy = _strategy(cls)
+        if strategy == _ATOMIC:
+            parent[key] = x
+            continue
+
+        d = id(x)
+        y = memo.get(d, _nil)
+        if y is not _nil:
+            parent[key] = y
+            continue
+
+        if strategy == _LIST:
+            if _is_flat(x):
+                y = x[:]
+            else:
+                y = [None] * len(x)
+                for i in range(len(x)):
+                    stack.append((x[i], y, i))
+        elif strategy == _DICT:
+            if _is_flat(x.values()) and _is_flat(x):
+                y = type(x)(x)
+            else:
+                y = type(x)()
+                for k, v in x.items():
+                    if _strategies.get(type(k)) != _ATOMIC:
+                        k = deepcopy(k, memo)
+                    # Keeps the insertion order, the value is filled in later
+                    y[k] = None
+                    stack.append((v, y, k))
+        elif strategy == _TUPLE or strategy == _FROZENSET:
+            if _is_flat(x):
+                parent[key] = x
+                continue
+            items = list(x)
+            finish = _finish_tuple if strategy == _TUPLE else _finish_frozenset
+            stack.append((finish, (x, items, parent, key, memo)))
+            for i in range(len(items)):
+                stack.append((items[i], items, i))
+            continue
+        elif strategy == _SET:
+            y = set()
+            if _is_flat(x):
+                y.update(x)
+            else:
+                items = list(x)
+                stack.append((_finish_set, (y, items)))
+                for i in range(len(items)):
+                    stack.append((items[i], items, i))
+        elif strategy == _SLICE:
+            y = x[:]
+        elif strategy == _INSTANCE:
+            y = cls.__new__(cls)
+            state = {}
+            stack.append((_finish_instance, (y, state)))
+            for name, value in _instance_state(x):
+                state[name] = None
+                stack.append((value, state, name))
+        elif strategy == _METHOD:
+            y = cls(x.__func__, deepcopy(x.__self__, memo))
+        elif strategy == _DEEPCOPY:
+            y = x.__deepcopy__(memo)
+        else:
+            reductor = getattr(x, "__reduce_ex__", None)
+            if reductor:
+                rv = reductor(2)
+            else:
+                reductor = getattr(x, "__reduce__", None)
+                if reductor:
+                    rv = reductor()
+                else:
+                    raise Error("un(deep)copyable object of type %s" % cls)
+            y = _reconstruct(x, rv, 1, memo)
+
+        # If is its own copy, don't memoize.
+        if y is not x:
+            memo[d] = y
+            if strategy == _REDUCE or strategy == _DEEPCOPY:
+                _keep_alive(x, memo)  # Make sure x lives at least as long as d
+        parent[key] = y
+    return root[0]
 
 
 def _keep_alive(x, memo):
@@ -369,11 +491,3 @@ def _reconstruct(x, info, deep, memo=None):
             y[key] = value
     return y
 
-
-del d
-
-del types
-
-# Helper for instance creation without calling __init__
-class _EmptyClass:
-    pass
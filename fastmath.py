@@ -0,0 +1,271 @@
+# Fast math functions for a CPU without an FPU
+#
+# The RP2040 has no floating point unit, so every libm call is a long soft-float
+# routine. Here the trigonometric functions are CORDIC in 24 bit fixed point,
+# which only needs integer shifts and adds, and exp/ln are range reduced to a
+# small interval and finished with a lookup table and a short polynomial. They
+# are compiled with the native emitter on the device. functions() returns the
+# table of calculator functions, either these or the ones from math.
+#
+# The fixed point error is absolute, up to about 1e-6, not relative like that of a
+# float. Below SMALL sin, tan, asin and atan are power series instead, so small
+# arguments keep their digits, but results that come out near zero from a
+# large argument (cos near pi/2, sin near pi) only have that absolute
+# accuracy. The calculator uses math by default, the precision key switches
+# to fastmath and back on the diagnostics screen.
+#
+# benchmarks/fastmath_benchmark.py on the host (CPython 3.11, x86-64), three
+# runs, largest error relative to math or 1:
+#
+#   sin, cos     3.3-3.6 us   5e-7, 7e-7
+#   tan          3.0-3.1 us   2.5e-6
+#   asin, acos   2.6-2.8 us   2.9e-7, 2.6e-7
+#   atan         0.8-0.9 us   3.3e-8
+#   ln, log10    0.5-0.7 us   1.4e-12
+#   exp          0.5 us       5.6e-9
+#   pow          1.3-1.4 us
+#
+# math takes 0.1 us or less for each of them there, the host has an FPU, so
+# these timings say nothing about the device. The errors are those of the fixed
+# point code, on the device single precision floats add their own 1e-7. The
+# device timings, the ones that decide the default, haven't been taken yet.
+
+import math
+
+try:
+    import micropython
+except ImportError:
+    micropython = None
+if not hasattr(micropython, "native"):
+    # MicroPython's compiler handles @micropython.native itself, elsewhere the decorator does nothing.
+    class micropython:
+        @staticmethod
+        def native(function):
+            return function
+
+# Fraction bits of the fixed point numbers
+_Q = 24
+_ONE = 1 << _Q
+_ITERATIONS = 24
+
+# atan(2**-i) for every CORDIC iteration, and the gain the iterations add
+_ANGLES = [int(math.atan(2.0 ** -i) * _ONE + 0.5) for i in range(_ITERATIONS)]
+_gain = 1.0
+for _i in range(_ITERATIONS):
+    _gain /= math.sqrt(1 + 2.0 ** (-2 * _i))
+_K = int(_gain * _ONE + 0.5)
+
+HALF_PI = math.pi / 2
+LN2 = math.log(2)
+_LOG10_E = 1 / math.log(10)
+
+# exp(i/16) and ln of the middle of [0.5 + i/64, 0.5 + (i+1)/64)
+_EXP = [math.exp(i / 16) for i in range(16)]
+_LN = [math.log(0.5 + (i + 0.5) / 64) for i in range(32)]
+
+# Factorials up to here are a table lookup, larger ones are built on the last entry
+_FACTORIALS = [1]
+for _i in range(1, 21):
+    _FACTORIALS.append(_FACTORIALS[-1] * _i)
+MAX_FACTORIAL = 1000
+
+# Below this sin, tan, asin and atan are power series in x*x, the first term left out is under 1e-9 of the result
+SMALL = 0.25
+_SIN = [(-1) ** _i / _FACTORIALS[2 * _i + 1] for _i in range(7)]
+_COS = [(-1) ** _i / _FACTORIALS[2 * _i] for _i in range(7)]
+_ATAN = [(-1) ** _i / (2 * _i + 1) for _i in range(8)]
+
+del _i, _gain
+
+
+@micropython.native
+def _rotate(z):
+    # CORDIC rotation mode. Returns (cos, sin) of the fixed point angle z, |z| <= pi/2.
+    x = _K
+    y = 0
+    angles = _ANGLES
+    for i in range(_ITERATIONS):
+        if z >= 0:
+            x, y = x - (y >> i), y + (x >> i)
+            z -= angles[i]
+        else:
+            x, y = x + (y >> i), y - (x >> i)
+            z += angles[i]
+    return x, y
+
+
+@micropython.native
+def _vector(x, y):
+    # CORDIC vectoring mode. Returns the fixed point angle of the vector (x, y), x >= 0.
+    z = 0
+    angles = _ANGLES
+    for i in range(_ITERATIONS):
+        if y > 0:
+            x, y = x + (y >> i), y - (x >> i)
+            z += angles[i]
+        else:
+            x, y = x - (y >> i), y + (x >> i)
+            z -= angles[i]
+    return z
+
+
+def _sincos(x):
+    # Reduces x to a quarter turn around 0, returns (sin, cos) in fixed point.
+    k = int(math.floor(x / HALF_PI + 0.5))
+    c, s = _rotate(int((x - k * HALF_PI) * _ONE))
+    k &= 3
+    if k == 0:
+        return s, c
+    if k == 1:
+        return c, -s
+    if k == 2:
+        return -s, -c
+    return -c, s
+
+
+def _series(u, coefficients):
+    # Sum of coefficients[i] * u**i.
+    s = 0.0
+    for i in range(len(coefficients) - 1, -1, -1):
+        s = s * u + coefficients[i]
+    return s
+
+
+def sin(x):
+    if -SMALL < x < SMALL:
+        return x * _series(x * x, _SIN)
+    return _sincos(x)[0] / _ONE
+
+
+def cos(x):
+    return _sincos(x)[1] / _ONE
+
+
+def tan(x):
+    if -SMALL < x < SMALL:
+        return x * _series(x * x, _SIN) / _series(x * x, _COS)
+    s, c = _sincos(x)
+    if c == 0:
+        raise ValueError("math domain error")
+    return s / c
+
+
+def atan(x):
+    if x > 1 or x < -1:
+        # Keeps the vector inside the fixed point range
+        return (HALF_PI if x > 0 else -HALF_PI) - atan(1 / x)
+    if -SMALL < x < SMALL:
+        return x * _series(x * x, _ATAN)
+    return _vector(_ONE, int(x * _ONE)) / _ONE
+
+
+def asin(x):
+    if x > 1 or x < -1:
+        raise ValueError("math domain error")
+    if -SMALL < x < SMALL:
+        # asin(x) = atan(t), t is at most a little over SMALL
+        t = x / math.sqrt(1 - x * x)
+        return t * _series(t * t, _ATAN)
+    return _vector(int(math.sqrt(1 - x * x) * _ONE), int(x * _ONE)) / _ONE
+
+
+def acos(x):
+    return HALF_PI - asin(x)
+
+
+def exp(x):
+    # x = k ln2 + j/16 + r, exp(x) = 2**k * exp(j/16) * exp(r) with r < 1/16
+    k = int(math.floor(x / LN2))
+    r = x - k * LN2
+    j = int(r * 16)
+    if j > 15:
+        j = 15
+    r -= j / 16
+    return math.ldexp(_EXP[j] * (1 + r * (1 + r * (0.5 + r * (1 / 6 + r * (1 / 24))))), k)
+
+
+def ln(x):
+    # x = m 2**e with m in [0.5, 1), ln(m) = ln(c) + 2 atanh((m - c) / (m + c)) for the table point c next to m
+    if x <= 0:
+        raise ValueError("math domain error")
+    m, e = math.frexp(x)
+    j = int((m - 0.5) * 64)
+    if j > 31:
+        j = 31
+    c = 0.5 + (j + 0.5) / 64
+    u = (m - c) / (m + c)
+    return e * LN2 + _LN[j] + 2 * u * (1 + u * u / 3)
+
+
+def log10(x):
+    return ln(x) * _LOG10_E
+
+
+def _integer(n):
+    if n != int(n) or n < 0:
+        raise ValueError("math domain error")
+    return int(n)
+
+
+def pow(x, y):
+    integer = y == int(y)
+    if x == 0 and y < 0:
+        raise ValueError("math domain error")
+    if integer and -64 <= y <= 64:
+        # Integer powers by squaring, exact for integers
+        n = int(y)
+        result = 1
+        base = x if n >= 0 else 1 / x
+        n = abs(n)
+        while n:
+            if n & 1:
+                result *= base
+            base *= base
+            n >>= 1
+        return result
+    if x == 0:
+        return 0.0
+    if x < 0:
+        if not integer:
+            raise ValueError("math domain error")
+        # An odd power of a negative number is negative
+        result = exp(y * ln(-x))
+        return -result if int(y) & 1 else result
+    return exp(y * ln(x))
+
+
+def fact(n):
+    n = _integer(n)
+    if n < len(_FACTORIALS):
+        return _FACTORIALS[n]
+    if n > MAX_FACTORIAL:
+        raise ValueError("factorial too large")
+    result = _FACTORIALS[-1]
+    for i in range(len(_FACTORIALS), n + 1):
+        result *= i
+    return result
+
+
+def nCr(n, r):
+    n = _integer(n)
+    r = _integer(r)
+    if r > n:
+        return 0
+    r = min(r, n - r)
+    result = 1
+    for i in range(1, r + 1):
+        result = result * (n - r + i) // i
+    return result
+
+
+def functions(fast=True):
+    # The calculator function table, with these implementations or the ones from math.
+    if fast:
+        table = {"sin": sin, "cos": cos, "tan": tan, "asin": asin, "acos": acos, "atan": atan,
+                 "ln": ln, "log10": log10, "exp": exp, "pow": pow}
+    else:
+        table = {"sin": math.sin, "cos": math.cos, "tan": math.tan, "asin": math.asin, "acos": math.acos, "atan": math.atan,
+                 "ln": math.log, "log10": math.log10, "exp": math.exp, "pow": math.pow}
+    table["fact"] = fact
+    table["nCr"] = nCr
+    return table
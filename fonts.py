@@ -0,0 +1,149 @@
+# Packed bitmap fonts
+#
+# The st7789_mpy bitmap fonts have all 256 CP437 glyphs, the calculator draws
+# less than a hundred of them. tools/build_fonts.py keeps only the glyphs the
+# calculator can draw and run-length encodes each of them into one blob. The
+# generated modules are frozen into the firmware, so the blob stays in flash
+# and is read through a memoryview. A generated module has:
+#
+#   WIDTH, HEIGHT   glyph size in pixels, a glyph is MONO_HLSB
+#   CODES           the CP437 codes of the glyphs, ascending
+#   OFFSETS         where each glyph starts in DATA, 2 bytes each, big endian,
+#                   plus the end of the last one
+#   DATA            the encoded glyphs
+#
+# A glyph is encoded as a sequence of runs. A control byte n below 128 is
+# followed by n + 1 bytes copied as they are, n from 128 up is followed by one
+# byte repeated n - 125 times (3 to 130). Glyphs are mostly empty rows, so this
+# halves them or better.
+#
+# PackedFont decodes glyphs as they are drawn and keeps the last few of them.
+
+try:
+    import framebuf
+except ImportError:
+    # CPython, tools/build_fonts.py only needs the tables and the codec
+    framebuf = None
+
+# The bitmap fonts are CP437, so a few of the symbols we use have a glyph,
+# just not at their unicode code point. Letters CP437 doesn't have are drawn
+# without their caron, Δ as the triangle.
+CP437 = {
+    "→": 0x1A,
+    "°": 0xF8,
+    "Ω": 0xEA,
+    "√": 0xFB,
+    "·": 0xF9,
+    "Δ": 0x1E,
+    "č": 0x63,
+    "š": 0x73,
+    "ž": 0x7A,
+    "Č": 0x43,
+    "Š": 0x53,
+    "Ž": 0x5A,
+}
+
+# Glyphs kept decoded per font
+CACHE_SIZE = 24
+
+# Longest runs of one control byte
+MAX_LITERAL = 128
+MIN_REPEAT = 3
+MAX_REPEAT = 130
+
+
+def code(char):
+    # CP437 code of a character, which can also be a code already (drawing bytes).
+    if isinstance(char, int):
+        return char
+    return CP437.get(char, ord(char))
+
+
+def encode(glyph):
+    # Run-length encodes the bytes of one glyph.
+    out = bytearray()
+    literal = bytearray()
+    i = 0
+    while i < len(glyph):
+        j = i
+        while j < len(glyph) and j - i < MAX_REPEAT and glyph[j] == glyph[i]:
+            j += 1
+        if j - i >= MIN_REPEAT:
+            if literal:
+                _literal(out, literal)
+                literal = bytearray()
+            out.append(128 + j - i - MIN_REPEAT)
+            out.append(glyph[i])
+            i = j
+        else:
+            literal.append(glyph[i])
+            i += 1
+    if literal:
+        _literal(out, literal)
+    return bytes(out)
+
+
+def _literal(out, literal):
+    for start in range(0, len(literal), MAX_LITERAL):
+        chunk = literal[start:start + MAX_LITERAL]
+        out.append(len(chunk) - 1)
+        out.extend(chunk)
+
+
+def decode(data, start, end, buffer):
+    # Decodes the glyph in data[start:end] into buffer.
+    i = start
+    o = 0
+    while i < end:
+        n = data[i]
+        if n < 128:
+            buffer[o:o + n + 1] = data[i + 1:i + n + 2]
+            o += n + 1
+            i += n + 2
+        else:
+            value = data[i + 1]
+            for k in range(o, o + n - 128 + MIN_REPEAT):
+                buffer[k] = value
+            o += n - 128 + MIN_REPEAT
+            i += 2
+
+
+class PackedFont:
+    def __init__(self, module, cache_size=CACHE_SIZE):
+        self.WIDTH = module.WIDTH
+        self.HEIGHT = module.HEIGHT
+        self.size = module.WIDTH * module.HEIGHT // 8
+        self.offsets = memoryview(module.OFFSETS)
+        self.data = memoryview(module.DATA)
+        # Glyph number + 1 by CP437 code, 0 for codes without a glyph
+        self.index = bytearray(256)
+        codes = module.CODES
+        for i in range(len(codes)):
+            self.index[codes[i]] = i + 1
+        self.cache = {}
+        self.cache_size = cache_size
+        # Codes in the cache in the order they were decoded, a ring. The oldest one is dropped first,
+        # the order of a dict isn't kept on MicroPython.
+        self.order = bytearray(cache_size)
+        self.oldest = 0
+
+    def has(self, code):
+        return 0 <= code < 256 and self.index[code] != 0
+
+    def glyph(self, code):
+        # Returns a MONO_HLSB framebuffer over the glyph of a CP437 code the font has. Only valid until the next call,
+        # a full cache reuses the buffer of a glyph it drops.
+        entry = self.cache.get(code)
+        if entry is None:
+            if len(self.cache) >= self.cache_size:
+                entry = self.cache.pop(self.order[self.oldest])
+            else:
+                buffer = bytearray(self.size)
+                entry = (framebuf.FrameBuffer(buffer, self.WIDTH, self.HEIGHT, framebuf.MONO_HLSB), buffer)
+            self.order[self.oldest] = code
+            self.oldest = (self.oldest + 1) % self.cache_size
+            i = (self.index[code] - 1) * 2
+            offsets = self.offsets
+            decode(self.data, offsets[i] << 8 | offsets[i + 1], offsets[i + 2] << 8 | offsets[i + 3], entry[1])
+            self.cache[code] = entry
+        return entry[0]
@@ -0,0 +1,248 @@
+# Headless display backend, streams the screen over the USB serial port
+#
+# Stands in for the st7789 driver when there is no panel attached (remote
+# support, CI). Drawing goes to a character grid of 16x16 pixel cells instead
+# of pixels, and show() sends the cells that changed since the last frame as a
+# run-length encoded delta frame. tools/screen_viewer.py rebuilds the screen on
+# the host.
+#
+# Frames are mixed with the normal log output, so every frame starts with
+# MAGIC, which contains a NUL and can't show up in printed text:
+#
+#   MAGIC, kind (KEYFRAME or DELTA), payload length (2 bytes, big endian), payload
+#
+# The payload walks the visible cells row by row with these operations:
+#
+#   OP_SKIP n            leave the next n cells as they are
+#   OP_COLOR fg bg       color of the following cells, RGB565, 2 bytes each, big endian
+#   OP_REPEAT n code     n cells of the same character
+#   OP_LITERAL n codes   n cells with the given characters
+#
+# Characters are CP437 codes, like in the bitmap fonts. A keyframe is sent
+# first and whenever the host writes REQUEST_KEYFRAME to the port.
+
+from micropython import const
+import fonts
+
+MAGIC = b"\x00SC"
+KEYFRAME = const(0x4B)
+DELTA = const(0x44)
+REQUEST_KEYFRAME = b"K"
+
+OP_SKIP = const(0)
+OP_COLOR = const(1)
+OP_REPEAT = const(2)
+OP_LITERAL = const(3)
+
+CELL_WIDTH = const(16)
+CELL_HEIGHT = const(16)
+
+# Cells only partly covered by fill_rect (plot curves and axes) get this character
+PLOT_CHAR = const(0xF9)
+
+# Longest run a single operation can hold
+MAX_RUN = const(255)
+
+
+class HeadlessDisplay:
+    def __init__(self, stream, width, height, input_stream=None):
+        self.stream = stream
+        self.width = width
+        self.height = height
+        self.columns = width // CELL_WIDTH
+        self.rows = height // CELL_HEIGHT
+
+        # What has been drawn, in display RAM rows like on the panel
+        self.chars = bytearray(b" " * (self.columns * self.rows))
+        self.fg = [0] * (self.columns * self.rows)
+        self.bg = [0] * (self.columns * self.rows)
+
+        # What the host has, in screen rows
+        self.sent_chars = bytearray(self.columns * self.rows)
+        self.sent_fg = [0] * (self.columns * self.rows)
+        self.sent_bg = [0] * (self.columns * self.rows)
+
+        # Vertical scroll, like ST7789 VSCRDEF/VSCRSADD
+        self.scroll_top = 0
+        self.scroll_height = height
+        self.scroll_start = 0
+
+        self.poll = None
+        if input_stream is not None:
+            try:
+                import select
+                self.poll = select.poll()
+                self.poll.register(input_stream, select.POLLIN)
+                self.input_stream = input_stream
+            except (ImportError, AttributeError, OSError):
+                self.poll = None
+        self.keyframe_requested = True
+
+        self.frames = 0
+        self.bytes_sent = 0
+
+    # st7789 driver interface
+
+    def init(self):
+        pass
+
+    def fill(self, color):
+        for i in range(len(self.chars)):
+            self.chars[i] = 32
+            self.fg[i] = color
+            self.bg[i] = color
+
+    def fill_rect(self, x, y, width, height, color):
+        if width <= 0 or height <= 0:
+            return
+        x0 = max(x, 0) // CELL_WIDTH
+        y0 = max(y, 0) // CELL_HEIGHT
+        x1 = min((x + width - 1) // CELL_WIDTH, self.columns - 1)
+        y1 = min((y + height - 1) // CELL_HEIGHT, self.rows - 1)
+        for row in range(y0, y1 + 1):
+            top = max(y, row * CELL_HEIGHT)
+            bottom = min(y + height, (row + 1) * CELL_HEIGHT)
+            for column in range(x0, x1 + 1):
+                left = max(x, column * CELL_WIDTH)
+                right = min(x + width, (column + 1) * CELL_WIDTH)
+                i = row * self.columns + column
+                if right - left == CELL_WIDTH and bottom - top == CELL_HEIGHT:
+                    self.chars[i] = 32
+                    self.bg[i] = color
+                else:
+                    self.chars[i] = PLOT_CHAR
+                self.fg[i] = color
+
+    def text(self, font, text, x, y, color, background):
+        column = x // CELL_WIDTH
+        row = y // CELL_HEIGHT
+        # Glyphs taller than a cell cover the cells below with background
+        cells = max(1, font.HEIGHT // CELL_HEIGHT)
+        for char in text:
+            if 0 <= column < self.columns:
+                c = fonts.code(char)
+                if c > 255:
+                    c = 0x3F
+                for r in range(row, min(row + cells, self.rows)):
+                    i = r * self.columns + column
+                    self.chars[i] = c if r == row else 32
+                    self.fg[i] = color
+                    self.bg[i] = background
+            column += max(1, font.WIDTH // CELL_WIDTH)
+
+    def vscrdef(self, top, height, bottom):
+        self.scroll_top = top
+        self.scroll_height = height
+
+    def vscsad(self, start):
+        self.scroll_start = start
+
+    def blit_buffer(self, buffer, x, y, width, height):
+        # Pixel data can't be shown in a character grid.
+        pass
+
+    # Streaming
+
+    def keyframe(self):
+        # Sends the whole screen with the next frame.
+        self.keyframe_requested = True
+
+    def ram_row(self, row):
+        # Row of the character grid that is shown at screen row, after scrolling.
+        y = row * CELL_HEIGHT
+        if self.scroll_top <= y < self.scroll_top + self.scroll_height:
+            y = self.scroll_top + (self.scroll_start - self.scroll_top + y - self.scroll_top) % self.scroll_height
+        return y // CELL_HEIGHT
+
+    def check_requests(self):
+        if self.poll is None:
+            return
+        while self.poll.poll(0):
+            if self.input_stream.read(1) == REQUEST_KEYFRAME:
+                self.keyframe_requested = True
+
+    def show(self):
+        self.check_requests()
+        keyframe = self.keyframe_requested
+        self.keyframe_requested = False
+
+        payload = bytearray()
+        skip = 0
+        literal = bytearray()
+        fg = bg = None
+        for row in range(self.rows):
+            source = self.ram_row(row) * self.columns
+            target = row * self.columns
+            for column in range(self.columns):
+                i = source + column
+                j = target + column
+                code = self.chars[i]
+                # Spaces only show their background
+                cell_fg = self.fg[i] if code != 32 else self.bg[i]
+                cell_bg = self.bg[i]
+                if not keyframe and code == self.sent_chars[j] and cell_fg == self.sent_fg[j] and cell_bg == self.sent_bg[j]:
+                    if literal:
+                        literal = self.flush_literal(payload, literal)
+                    skip += 1
+                    continue
+                while skip:
+                    n = min(skip, MAX_RUN)
+                    payload.append(OP_SKIP)
+                    payload.append(n)
+                    skip -= n
+                if cell_fg != fg or cell_bg != bg:
+                    if literal:
+                        literal = self.flush_literal(payload, literal)
+                    fg = cell_fg
+                    bg = cell_bg
+                    payload.append(OP_COLOR)
+                    payload.extend(bytes((fg >> 8, fg & 0xFF, bg >> 8, bg & 0xFF)))
+                literal.append(code)
+                self.sent_chars[j] = code
+                self.sent_fg[j] = cell_fg
+                self.sent_bg[j] = cell_bg
+        if literal:
+            self.flush_literal(payload, literal)
+        # Trailing skips don't need to be sent.
+
+        if not payload and not keyframe:
+            return
+        header = MAGIC + bytes((KEYFRAME if keyframe else DELTA, len(payload) >> 8, len(payload) & 0xFF))
+        self.stream.write(header)
+        self.stream.write(payload)
+        self.frames += 1
+        self.bytes_sent += len(header) + len(payload)
+
+    @staticmethod
+    def flush_literal(payload, literal):
+        # Encodes the pending characters, runs of 3 or more as OP_REPEAT. Returns an empty buffer for the next ones.
+        i = 0
+        start = 0
+        while i < len(literal):
+            j = i
+            while j < len(literal) and j - i < MAX_RUN and literal[j] == literal[i]:
+                j += 1
+            if j - i >= 3 or j == len(literal):
+                HeadlessDisplay.emit_literal(payload, literal, start, i)
+                if j - i >= 3:
+                    payload.append(OP_REPEAT)
+                    payload.append(j - i)
+                    payload.append(literal[i])
+                else:
+                    HeadlessDisplay.emit_literal(payload, literal, i, j)
+                start = j
+            i = j
+        return bytearray()
+
+    @staticmethod
+    def emit_literal(payload, literal, start, end):
+        while start < end:
+            n = min(end - start, MAX_RUN)
+            payload.append(OP_LITERAL)
+            payload.append(n)
+            payload.extend(literal[start:start + n])
+            start += n
+
+    def raw_frame_size(self):
+        # Size of a frame that dumps every cell (character and both colors), for comparison.
+        return len(MAGIC) + 3 + self.columns * self.rows * 5
@@ -0,0 +1,136 @@
+# Bit-parallel keypad matrix scanner
+#
+# The keypad is a matrix of row outputs and column inputs with pull-downs, a
+# pressed key connects its row to its column. scan() drives one row at a time
+# through the SIO set/clear registers and reads all the columns at once from
+# GPIO_IN, so the whole 6x6 matrix is six register reads. The state of every
+# key is kept, so keys pressed together are all seen (as far as a matrix
+# without diodes can tell them apart), and each press goes into a typeahead
+# queue that the scheduler drains.
+#
+# A key takes a new state when two scans in a row agree on it, which debounces
+# it. A short press is queued when the key is released, a long press as soon as
+# the key has been held for LONG_PRESS_MS. A key held longer queues nothing
+# more: long presses type functions and open modes, which must not repeat.
+# Releasing a key after a long press queues nothing.
+
+from machine import Pin, mem32
+import time
+from micropython import const
+
+import profiler
+from profiler import timed
+
+SIO_BASE = const(0xD0000000)
+GPIO_IN = const(SIO_BASE + 0x004)
+GPIO_OUT_SET = const(SIO_BASE + 0x014)
+GPIO_OUT_CLR = const(SIO_BASE + 0x018)
+
+# Hold time that makes a press a long press
+LONG_PRESS_MS = const(1000)
+# Time for a column to follow its row through a pressed key
+SETTLE_US = const(5)
+# Presses buffered until the scheduler takes them
+TYPEAHEAD = const(32)
+
+# A queued key is row * KEY_STRIDE + column, with LONG set for a long press
+KEY_STRIDE = const(8)
+LONG = const(0x80)
+
+
+class MatrixKeypad:
+    def __init__(self, rows, cols):
+        for pin in rows:
+            Pin(pin, Pin.OUT, value=0)
+        for pin in cols:
+            Pin(pin, Pin.IN, Pin.PULL_DOWN)
+        self.row_masks = [1 << pin for pin in rows]
+        self.col_pins = cols
+        self.col_mask = (1 << len(cols)) - 1
+        # Columns on consecutive GPIOs come out of GPIO_IN with one shift
+        self.col_shift = cols[0] if list(cols) == list(range(cols[0], cols[0] + len(cols))) else None
+
+        # Column bits by row, of the last sample and of the debounced state
+        self.raw = bytearray(len(rows))
+        self.state = bytearray(len(rows))
+        # Keys that had a long press since they went down
+        self.long_sent = bytearray(len(rows))
+        # ticks_ms of the press by key
+        self.down_at = [0] * (len(rows) * KEY_STRIDE)
+
+        # Ring buffer of queued keys and the ticks_us they were recognized at
+        self.queue = bytearray(TYPEAHEAD)
+        self.times = [0] * TYPEAHEAD
+        self.head = 0
+        self.count = 0
+        self.dropped = 0
+        profiler.gauge("keys dropped", lambda: self.dropped)
+
+    def columns(self, value):
+        # Column bits of a GPIO_IN value.
+        if self.col_shift is not None:
+            return (value >> self.col_shift) & self.col_mask
+        bits = 0
+        for c in range(len(self.col_pins)):
+            if value & (1 << self.col_pins[c]):
+                bits |= 1 << c
+        return bits
+
+    @timed("keypad scan")
+    def scan(self):
+        # Samples the whole matrix and queues what happened since the last scan.
+        now = time.ticks_ms()
+        mask = self.col_mask
+        for r in range(len(self.row_masks)):
+            mem32[GPIO_OUT_SET] = self.row_masks[r]
+            time.sleep_us(SETTLE_US)
+            value = mem32[GPIO_IN]
+            mem32[GPIO_OUT_CLR] = self.row_masks[r]
+            bits = self.columns(value)
+
+            # Keys whose last two samples agree take the sampled state
+            agree = ~(bits ^ self.raw[r]) & mask
+            self.raw[r] = bits
+            old = self.state[r]
+            new = (old & ~agree | bits & agree) & mask
+            self.state[r] = new
+            if not (old | new):
+                continue
+
+            for c in range(len(self.col_pins)):
+                bit = 1 << c
+                key = r * KEY_STRIDE + c
+                if new & bit and not old & bit:
+                    self.down_at[key] = now
+                    self.long_sent[r] &= ~bit
+                elif old & bit and not new & bit:
+                    if not self.long_sent[r] & bit:
+                        self.put(key)
+                    self.long_sent[r] &= ~bit
+                elif new & bit and not self.long_sent[r] & bit and time.ticks_diff(now, self.down_at[key]) >= LONG_PRESS_MS:
+                    self.put(key | LONG)
+                    self.long_sent[r] |= bit
+
+    def put(self, key):
+        if self.count == TYPEAHEAD:
+            self.dropped += 1
+            return
+        i = (self.head + self.count) % TYPEAHEAD
+        self.queue[i] = key
+        self.times[i] = time.ticks_us()
+        self.count += 1
+
+    def get(self):
+        # Returns the oldest queued key as (row, col, is_long_press, ticks_us), or None.
+        if not self.count:
+            return None
+        key = self.queue[self.head]
+        detected = self.times[self.head]
+        self.head = (self.head + 1) % TYPEAHEAD
+        self.count -= 1
+        code = key & ~LONG
+        return code // KEY_STRIDE, code % KEY_STRIDE, bool(key & LONG), detected
+
+    def pressed(self, row, col):
+        # Whether a key is down right now, after debouncing.
+        return bool(self.state[row] & (1 << col))
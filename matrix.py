@@ -0,0 +1,228 @@
+# Small dense matrices in flat float arrays
+#
+# A matrix is rows * cols floats in one array("f"), row after row, so element
+# (i, j) is data[i * cols + j]. That is 4 bytes an element and a single heap
+# block, where a list of lists would be a list and a boxed float per element.
+# The matrix mode only goes up to MAX_SIZE x MAX_SIZE.
+#
+# Operations change the matrix they are called on wherever the result fits in
+# it: add, transpose, determinant (leaves the eliminated matrix behind),
+# invert and solve (leaves the eliminated matrix behind and the solution in
+# b). Only multiply needs a matrix of its own for the result.
+#
+# Elimination uses partial pivoting: each column is eliminated with the row
+# that has the largest value in it, which keeps the rounding errors of single
+# precision floats in check. A pivot that is zero next to the largest element
+# of the matrix, to within EPSILON, makes the matrix singular.
+
+from array import array
+
+MAX_SIZE = 8
+
+# Relative size of a pivot that counts as zero, floats on the device have about 7 digits
+EPSILON = 1e-6
+
+
+class Singular(ValueError):
+    pass
+
+
+class Matrix:
+    def __init__(self, rows, cols, data=None):
+        if not (0 < rows <= MAX_SIZE and 0 < cols <= MAX_SIZE):
+            raise ValueError(f"Size {rows}x{cols} not supported")
+        self.rows = rows
+        self.cols = cols
+        self.data = data if data is not None else array("f", [0.0] * (rows * cols))
+
+    def get(self, i, j):
+        return self.data[i * self.cols + j]
+
+    def set(self, i, j, value):
+        self.data[i * self.cols + j] = value
+
+    def copy(self):
+        return Matrix(self.rows, self.cols, array("f", self.data))
+
+    def add(self, other, sign=1):
+        # Adds other times sign to this matrix.
+        if other.rows != self.rows or other.cols != self.cols:
+            raise ValueError("Sizes don't match")
+        a = self.data
+        b = other.data
+        for k in range(len(a)):
+            a[k] += sign * b[k]
+        return self
+
+    def multiply(self, other, out=None):
+        # Returns this matrix times other, in out if given. out can't be one of the operands.
+        if self.cols != other.rows:
+            raise ValueError("Sizes don't match")
+        if out is None:
+            out = Matrix(self.rows, other.cols)
+        elif out.rows != self.rows or out.cols != other.cols or out is self or out is other:
+            raise ValueError("Unusable result matrix")
+        a = self.data
+        b = other.data
+        c = out.data
+        n = self.cols
+        m = other.cols
+        for i in range(self.rows):
+            for j in range(m):
+                s = 0.0
+                for k in range(n):
+                    s += a[i * n + k] * b[k * m + j]
+                c[i * m + j] = s
+        return out
+
+    def transpose(self):
+        # Transposes in place. A matrix that isn't square is permuted along the cycles of the transposition.
+        a = self.data
+        rows = self.rows
+        cols = self.cols
+        if rows == cols:
+            for i in range(rows):
+                for j in range(i + 1, cols):
+                    a[i * cols + j], a[j * cols + i] = a[j * cols + i], a[i * cols + j]
+        else:
+            # Element k of the transpose comes from element (k % rows) * cols + k // rows
+            last = rows * cols - 1
+            done = bytearray(last + 1)
+            for start in range(1, last):
+                if done[start]:
+                    continue
+                k = start
+                value = a[start]
+                while True:
+                    source = (k % rows) * cols + k // rows
+                    done[k] = 1
+                    if source == start:
+                        a[k] = value
+                        break
+                    a[k] = a[source]
+                    k = source
+        self.rows = cols
+        self.cols = rows
+        return self
+
+    def swap_rows(self, i, j):
+        a = self.data
+        n = self.cols
+        for k in range(n):
+            a[i * n + k], a[j * n + k] = a[j * n + k], a[i * n + k]
+
+    def tolerance(self):
+        # Smallest usable pivot.
+        largest = 0.0
+        for x in self.data:
+            if abs(x) > largest:
+                largest = abs(x)
+        return largest * EPSILON
+
+    def pivot(self, k, tolerance):
+        # Swaps the row with the largest value in column k, from row k down, into row k. Returns the row
+        # it came from, or None if the column has no usable pivot.
+        a = self.data
+        n = self.cols
+        p = k
+        for i in range(k + 1, self.rows):
+            if abs(a[i * n + k]) > abs(a[p * n + k]):
+                p = i
+        if abs(a[p * n + k]) <= tolerance:
+            return None
+        if p != k:
+            self.swap_rows(p, k)
+        return p
+
+    def square(self):
+        if self.rows != self.cols:
+            raise ValueError("Matrix isn't square")
+        return self.rows
+
+    def determinant(self):
+        # Determinant by elimination, the matrix is left upper triangular.
+        n = self.square()
+        a = self.data
+        tolerance = self.tolerance()
+        determinant = 1.0
+        for k in range(n):
+            p = self.pivot(k, tolerance)
+            if p is None:
+                return 0.0
+            if p != k:
+                determinant = -determinant
+            pivot = a[k * n + k]
+            determinant *= pivot
+            for i in range(k + 1, n):
+                f = a[i * n + k] / pivot
+                if f:
+                    for j in range(k + 1, n):
+                        a[i * n + j] -= f * a[k * n + j]
+                a[i * n + k] = 0.0
+        return determinant
+
+    def invert(self):
+        # Inverts in place by Gauss-Jordan elimination. The inverse builds up in the columns that
+        # have been eliminated, so no second matrix is needed. Raises Singular.
+        n = self.square()
+        a = self.data
+        tolerance = self.tolerance()
+        swaps = bytearray(n)
+        for k in range(n):
+            p = self.pivot(k, tolerance)
+            if p is None:
+                raise Singular("Matrix is singular")
+            swaps[k] = p
+            pivot = a[k * n + k]
+            a[k * n + k] = 1.0
+            for j in range(n):
+                a[k * n + j] /= pivot
+            for i in range(n):
+                if i == k:
+                    continue
+                f = a[i * n + k]
+                if f:
+                    a[i * n + k] = 0.0
+                    for j in range(n):
+                        a[i * n + j] -= f * a[k * n + j]
+        # Row swaps of the elimination are column swaps of the inverse, undone in reverse
+        for k in range(n - 1, -1, -1):
+            p = swaps[k]
+            if p != k:
+                for i in range(n):
+                    a[i * n + k], a[i * n + p] = a[i * n + p], a[i * n + k]
+        return self
+
+    def solve(self, b):
+        # Solves this matrix times x = b by elimination and back substitution, for every column of b.
+        # x replaces b, this matrix is left upper triangular. Raises Singular.
+        n = self.square()
+        if b.rows != n:
+            raise ValueError("Sizes don't match")
+        a = self.data
+        x = b.data
+        m = b.cols
+        tolerance = self.tolerance()
+        for k in range(n):
+            p = self.pivot(k, tolerance)
+            if p is None:
+                raise Singular("Matrix is singular")
+            if p != k:
+                b.swap_rows(p, k)
+            pivot = a[k * n + k]
+            for i in range(k + 1, n):
+                f = a[i * n + k] / pivot
+                if not f:
+                    continue
+                a[i * n + k] = 0.0
+                for j in range(k + 1, n):
+                    a[i * n + j] -= f * a[k * n + j]
+                for j in range(m):
+                    x[i * m + j] -= f * x[k * m + j]
+        for i in range(n - 1, -1, -1):
+            for j in range(m):
+                s = x[i * m + j]
+                for k in range(i + 1, n):
+                    s -= a[i * n + k] * x[k * m + j]
+                x[i * m + j] = s / a[i * n + i]
+        return b
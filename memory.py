@@ -0,0 +1,106 @@
+# Garbage collection policy
+#
+# Left alone, MicroPython collects whenever the allocations since the last
+# collection pass gc.threshold (or the heap runs out), which can be right in
+# the middle of a redraw. The memory manager measures how much every key press
+# allocates, per subsystem, and keeps gc.threshold a few interactions above
+# the largest one. Between key presses, when the scheduler is idle, it
+# collects early if the next interaction could cross the threshold, so the
+# pause lands in a gap instead of inside drawing.
+
+import gc
+import time
+from micropython import const
+
+import profiler
+from profiler import Stat
+
+# Smallest threshold ever set, in bytes
+MIN_THRESHOLD = const(4096)
+# Threshold in interactions of the largest observed size
+HEADROOM = const(4)
+# The peak shrinks by 1/PEAK_DECAY of itself every interaction, so one huge plot doesn't pin it forever
+PEAK_DECAY = const(32)
+
+
+class Allocations:
+    # Bytes allocated per interaction by one subsystem.
+
+    def __init__(self, name):
+        self.name = name
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def add(self, allocated):
+        self.count += 1
+        self.total += allocated
+        if allocated > self.max:
+            self.max = allocated
+
+    def report(self):
+        average = self.total // self.count if self.count else 0
+        print(f"[MEMORY] {self.name}: {self.count}x, avg {average} B, max {self.max} B per interaction")
+
+
+class MemoryManager:
+    def __init__(self):
+        self.subsystems = {}
+        self.peak = 0
+        # Set by the first tune()
+        self.threshold = 0
+        # Interactions during which an automatic collection ran
+        self.missed = 0
+        self.start = 0
+        self.collections = Stat("gc collect")
+        profiler.gauge("gc threshold", lambda: self.threshold)
+        self.collect()
+        self.tune()
+
+    def begin(self):
+        # Called before an interaction.
+        self.start = gc.mem_alloc()
+
+    def end(self, subsystem):
+        # Called after an interaction, records what it allocated and retunes the threshold.
+        allocated = gc.mem_alloc() - self.start
+        if allocated < 0:
+            # Less allocated than before, so the GC ran in the middle of it
+            self.missed += 1
+            return
+        a = self.subsystems.get(subsystem)
+        if a is None:
+            a = Allocations(subsystem)
+            self.subsystems[subsystem] = a
+        a.add(allocated)
+        self.peak = max(allocated, self.peak - self.peak // PEAK_DECAY)
+        self.tune()
+
+    def tune(self):
+        # Room for HEADROOM of the largest interactions, but never more than half of the free heap,
+        # so an automatic collection still happens long before memory runs out.
+        threshold = max(MIN_THRESHOLD, min(self.peak * HEADROOM, gc.mem_free() // 2))
+        if threshold != self.threshold:
+            self.threshold = threshold
+            gc.threshold(threshold)
+
+    def collect(self):
+        start = time.ticks_us()
+        gc.collect()
+        self.base = gc.mem_alloc()
+        self.collections.add(time.ticks_diff(time.ticks_us(), start))
+
+    def due(self):
+        # Whether the next interaction, if it is as big as the largest one, could trigger an automatic collection.
+        return gc.mem_alloc() - self.base + self.peak * 2 > self.threshold
+
+    def idle(self):
+        # Called in gaps between interactions.
+        if self.due():
+            self.collect()
+
+    def report(self):
+        for name in self.subsystems:
+            self.subsystems[name].report()
+        self.collections.report("MEMORY")
+        print(f"[MEMORY] threshold {self.threshold} B, peak {self.peak} B, {self.missed} collections during interactions")
@@ -0,0 +1,234 @@
+# Width-aware number formatting into a preallocated buffer
+#
+# Results used to be drawn with str(value), which can be longer than the
+# screen and allocates on every result. NumberFormatter writes a number into
+# its own bytearray, picking the notation that fits the width:
+#
+#   fixed        1'234'567.5    digits grouped by thousands while it fits
+#   scientific   1.234568e-12
+#   engineering  12.34568e-12   the exponent is a multiple of 3, for SI units
+#
+# Digits beyond the width are rounded half up, and a carry moves into the
+# next digit or exponent (9.9996 in 5 characters is 10.00 -> 10). Digits
+# are worked out with integer arithmetic, which on MicroPython stays within
+# small ints, so the only allocations are the few floats of scaling a float
+# to its digits. No strings are built on the way.
+
+import math
+
+# Significant digits a float carries, single precision on the Pico
+PRECISION = 7 if 1.0 + 1e-8 == 1.0 else 15
+
+GROUP = ord("'")
+POINT = ord(".")
+MINUS = ord("-")
+EXPONENT = ord("e")
+ZERO = ord("0")
+
+# Smallest decimal exponent still shown in fixed notation, 0.001234 but 1.234e-4
+FIXED_MIN_EXPONENT = -3
+
+
+class NumberFormatter:
+    def __init__(self, width):
+        self.buffer = bytearray(width)
+        self.length = 0
+
+    def view(self):
+        # The formatted number. Only valid until the next format().
+        return memoryview(self.buffer)[:self.length]
+
+    def text(self):
+        return str(bytes(self.view()), "ascii")
+
+    def format(self, value, width=None, engineering=False):
+        # Formats value into at most width characters and returns the length.
+        if width is None or width > len(self.buffer):
+            width = len(self.buffer)
+        self.length = 0
+        if value != value:
+            return self.word(b"nan", width)
+        negative = value < 0
+        if negative:
+            value = -value
+        if value == float("inf"):
+            return self.word(b"-inf" if negative else b"inf", width)
+        if value == 0:
+            return self.word(b"0", width)
+
+        if isinstance(value, int):
+            digits = value
+            count = self.count(digits)
+            exponent = count - 1
+            whole = width
+        else:
+            digits, exponent = self.decompose(value)
+            count = PRECISION
+            # Whole digits past the precision of a float would be made up zeros
+            whole = PRECISION
+        digits, count = self.strip(digits, count)
+        # value = digits * 10 ** (exponent - count + 1)
+
+        sign = 1 if negative else 0
+        while True:
+            result = self.fixed(negative, digits, count, exponent, width - sign, whole)
+            if result is None:
+                result = self.scientific(negative, digits, count, exponent, width - sign, engineering)
+            if result is None and engineering:
+                # Up to two more whole digits, 174e15 doesn't fit where 2e17 does
+                result = self.scientific(negative, digits, count, exponent, width - sign, False)
+            if result is None:
+                # Not even one digit fits
+                return self.word(b"#" * width, width)
+            if result is True:
+                return self.length
+            # Rounded to fewer digits, try again with the rounded number
+            digits, count, exponent = result
+
+    def word(self, text, width):
+        n = min(len(text), width)
+        self.buffer[:n] = text[:n]
+        self.length = n
+        return n
+
+    @staticmethod
+    def count(digits):
+        n = 1
+        while digits >= 10:
+            digits //= 10
+            n += 1
+        return n
+
+    @staticmethod
+    def strip(digits, count):
+        while count > 1 and digits % 10 == 0:
+            digits //= 10
+            count -= 1
+        return digits, count
+
+    @staticmethod
+    def decompose(value):
+        # Returns (digits, exponent) with PRECISION significant digits, value ~ digits * 10 ** (exponent - PRECISION + 1).
+        exponent = int(math.floor(math.log10(value)))
+        while True:
+            scale = PRECISION - 1 - exponent
+            # In two steps, 10 ** scale alone can overflow single precision for tiny values
+            half = scale // 2
+            digits = int(value * 10.0 ** half * 10.0 ** (scale - half) + 0.5)
+            if digits >= 10 ** PRECISION:
+                exponent += 1
+            elif digits < 10 ** (PRECISION - 1):
+                exponent -= 1
+            else:
+                return digits, exponent
+
+    @staticmethod
+    def round(digits, count, exponent, keep):
+        # Rounds to keep significant digits, returns the new (digits, count, exponent).
+        drop = count - keep
+        power = 10 ** drop
+        digits = (digits + power // 2) // power
+        count = keep
+        if digits >= 10 ** keep:
+            # Carry into a new digit, 9.99 -> 10.0
+            digits //= 10
+            exponent += 1
+        digits, count = NumberFormatter.strip(digits, count)
+        return digits, count, exponent
+
+    def put_sign(self, negative):
+        if negative:
+            self.buffer[self.length] = MINUS
+            self.length += 1
+
+    def put_digits(self, digits, count, first, last, group):
+        # Writes digit positions first..last-1 of the count digit number digits, position 0 being the top digit.
+        # Positions past the end of the number are zeros. With group, a separator goes before every third digit
+        # counted from last.
+        for position in range(first, last):
+            if group and position > first and (last - position) % 3 == 0:
+                self.buffer[self.length] = GROUP
+                self.length += 1
+            if position < count:
+                self.buffer[self.length] = ZERO + (digits // 10 ** (count - 1 - position)) % 10
+            else:
+                self.buffer[self.length] = ZERO
+            self.length += 1
+
+    def fixed(self, negative, digits, count, exponent, width, limit):
+        # Returns True if written, None if fixed notation can't fit or would need more than limit whole digits,
+        # or a rounded number to try again.
+        if exponent < FIXED_MIN_EXPONENT or exponent >= width or exponent >= limit:
+            return None
+        whole = exponent + 1 if exponent >= 0 else 1
+        fraction = max(0, count - 1 - exponent)
+        for group in (True, False):
+            length = whole + ((whole - 1) // 3 if group else 0)
+            room = width - length
+            if room < 0 or (group and whole < 5):
+                # Only numbers of five digits and more are grouped
+                continue
+            if fraction and room < 2:
+                if exponent < 0:
+                    return None
+                # Round the fraction away
+                return self.round(digits, count, exponent, exponent + 1)
+            if fraction > room - 1 > -1:
+                keep = room - 1 + exponent + 1
+                if keep < 1:
+                    return None
+                if exponent < 0 and keep < min(count, 2) and width >= 3 + self.count(-exponent):
+                    # Too few significant digits would be left for scientific notation to show more.
+                    # Where even that doesn't fit, one digit is better than none: 0.3 in three characters.
+                    return None
+                return self.round(digits, count, exponent, keep)
+            self.length = 0
+            self.put_sign(negative)
+            if exponent >= 0:
+                self.put_digits(digits, count, 0, whole, group)
+            else:
+                self.buffer[self.length] = ZERO
+                self.length += 1
+            if fraction:
+                self.buffer[self.length] = POINT
+                self.length += 1
+                if exponent >= 0:
+                    self.put_digits(digits, count, whole, count, False)
+                else:
+                    for i in range(-exponent - 1):
+                        self.buffer[self.length] = ZERO
+                        self.length += 1
+                    self.put_digits(digits, count, 0, count, False)
+            return True
+        return None
+
+    def scientific(self, negative, digits, count, exponent, width, engineering):
+        shift = exponent % 3 if engineering else 0
+        power = exponent - shift
+        whole = shift + 1
+        magnitude = -power if power < 0 else power
+        suffix = 2 + (1 if power < 0 else 0) + (self.count(magnitude) - 1)
+        room = width - whole - suffix
+        if room < 0:
+            return None
+        fraction = max(0, count - whole)
+        if fraction and room < 2:
+            if count > whole:
+                return self.round(digits, count, exponent, whole)
+            return None
+        if fraction and fraction > room - 1:
+            return self.round(digits, count, exponent, whole + room - 1)
+        self.length = 0
+        self.put_sign(negative)
+        self.put_digits(digits, count, 0, whole, False)
+        if fraction:
+            self.buffer[self.length] = POINT
+            self.length += 1
+            self.put_digits(digits, count, whole, count, False)
+        self.buffer[self.length] = EXPONENT
+        self.length += 1
+        if power < 0:
+            self.buffer[self.length] = MINUS
+            self.length += 1
+        self.put_digits(magnitude, self.count(magnitude), 0, self.count(magnitude), False)
+        return True
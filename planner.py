@@ -0,0 +1,164 @@
+# Chaining formulas to reach a quantity that no single formula gives
+#
+# Every formula takes the quantities of its providers and gives one quantity,
+# the symbol left of the = in Formula.formula. A quantity is a symbol and a
+# dimension, so the speed v (m/s) and the height v (cm) of the geometry
+# formulas are different quantities, while h in m and h in cm are the same one
+# in different units.
+#
+# The formulas form a graph where a formula can be used once all of its inputs
+# are known. plan() finds the cheapest chain of formulas from the known
+# quantities to a target symbol, with Knuth's generalization of Dijkstra's
+# algorithm to such graphs: a formula costs one plus what its inputs cost.
+# Plans are cached by the known set and the target, so asking again is a
+# dictionary lookup, and evaluate() runs the chain with the compiled formulas,
+# converting values between the units of one formula's result and the next
+# formula's provider.
+
+import units
+
+
+class NoPlan(ValueError):
+    pass
+
+
+class Planner:
+    def __init__(self, formulas):
+        # formulas need their units checked first, the unit of a result decides where it can go.
+        self.formulas = formulas
+        # (symbol, dimension) of every quantity, numbered in order of appearance
+        self.quantities = []
+        self.numbers = {}
+        # Unit of the values of each quantity, the first provider's or the first result's
+        self.units = []
+        # Per formula, the quantity numbers of its providers and of its result
+        self.inputs = []
+        self.outputs = []
+        # Per quantity, the formulas that take it
+        self.consumers = []
+        # Plans by (known mask, target symbol)
+        self.plans = {}
+
+        for formula in formulas:
+            inputs = []
+            for provider in formula.providers:
+                q = self.quantity(provider.provider_formula_name, provider.parsed_unit)
+                if q not in inputs:
+                    inputs.append(q)
+            self.inputs.append(inputs)
+            self.outputs.append(self.quantity(formula.formula.split("=")[0], formula.unit))
+        for f in range(len(formulas)):
+            for q in self.inputs[f]:
+                self.consumers[q].append(f)
+
+    def quantity(self, symbol, unit):
+        # Number of the quantity, added if it is new. A result without a unit has no dimension and can't feed another formula.
+        key = (symbol, unit.dimension if unit else None)
+        q = self.numbers.get(key)
+        if q is None:
+            q = len(self.quantities)
+            self.numbers[key] = q
+            self.quantities.append(key)
+            self.units.append(unit)
+            self.consumers.append([])
+        return q
+
+    def find(self, symbol, unit=None):
+        # Number of the quantity with this symbol, and the dimension of unit if the symbol alone is ambiguous.
+        found = [q for q in range(len(self.quantities)) if self.quantities[q][0] == symbol
+                 and (unit is None or self.quantities[q][1] == unit.dimension)]
+        if not found:
+            raise NoPlan(f"Unknown quantity {symbol}")
+        if len(found) > 1:
+            raise NoPlan(f"{symbol} needs a unit")
+        return found[0]
+
+    @staticmethod
+    def mask(known):
+        # Bit mask of a set of quantity numbers, the cache key of the known set.
+        mask = 0
+        for q in known:
+            mask |= 1 << q
+        return mask
+
+    def plan(self, known, target):
+        # Returns the formula numbers to evaluate in order to get the target symbol from the known quantity numbers.
+        # An empty plan if the target is known. Raises NoPlan if there is no way.
+        key = (self.mask(known), target)
+        if key in self.plans:
+            plan = self.plans[key]
+            if plan is None:
+                raise NoPlan(f"No way to {target}")
+            return plan
+
+        count = len(self.quantities)
+        cost = [None] * count
+        via = [None] * count
+        done = bytearray(count)
+        # Inputs of each formula that aren't done yet
+        missing = [len(inputs) for inputs in self.inputs]
+        for q in known:
+            cost[q] = 0
+
+        plan = None
+        while True:
+            # The cheapest quantity that isn't done, the graph is a few dozen nodes so a scan does
+            q = None
+            for i in range(count):
+                if not done[i] and cost[i] is not None and (q is None or cost[i] < cost[q]):
+                    q = i
+            if q is None:
+                break
+            done[q] = 1
+            if self.quantities[q][0] == target:
+                plan = []
+                self.collect(q, cost, via, plan)
+                break
+            for f in self.consumers[q]:
+                missing[f] -= 1
+                if missing[f] == 0:
+                    output = self.outputs[f]
+                    c = 1 + sum(cost[i] for i in self.inputs[f])
+                    if not done[output] and (cost[output] is None or c < cost[output]):
+                        cost[output] = c
+                        via[output] = f
+
+        self.plans[key] = plan
+        if plan is None:
+            raise NoPlan(f"No way to {target}")
+        return plan
+
+    def collect(self, q, cost, via, plan):
+        # Appends the formulas needed for quantity q after the ones for its inputs.
+        f = via[q]
+        if cost[q] == 0 or f in plan:
+            return
+        for i in self.inputs[f]:
+            self.collect(i, cost, via, plan)
+        plan.append(f)
+
+    def evaluate(self, plan, values):
+        # Runs a plan. values maps the known quantity numbers to (value, unit), the unit None for a value
+        # in the quantity's own unit. Returns (value, unit) of the last formula, or of the known target.
+        values = dict(values)
+        result = None
+        for f in plan:
+            formula = self.formulas[f]
+            arguments = []
+            for provider in formula.providers:
+                value, unit = values[self.numbers[(provider.provider_formula_name, provider.parsed_unit.dimension)]]
+                if unit is not None and unit is not provider.parsed_unit:
+                    value = units.convert(value, unit, provider.parsed_unit)
+                arguments.append(value)
+            result = (formula.compile()(*arguments), formula.unit)
+            values[self.outputs[f]] = result
+        return result
+
+    def solve(self, values, target):
+        # Plans and evaluates in one go. values maps known quantity numbers to (value, unit).
+        plan = self.plan(values.keys(), target)
+        if not plan:
+            q = [q for q in values if self.quantities[q][0] == target][0]
+            value, unit = values[q]
+            return value, unit if unit is not None else self.units[q]
+        return self.evaluate(plan, values)
@@ -0,0 +1,153 @@
+# y=f(x) plotting with incremental column-wise rendering
+#
+# The function is sampled on a grid of half columns: every column edge, plus
+# the middle of a column when the curve is steep there, to tell a steep curve
+# from a discontinuity (like 1/x at 0). Samples are kept in world coordinates,
+# so panning and zooming only evaluate the points that weren't on the grid of
+# the previous view, and moving up or down evaluates nothing at all.
+# The curve is drawn column by column and flushed every few columns, so the
+# first part of the plot shows up while the rest is still being computed.
+
+from array import array
+try:
+    from micropython import const
+except ImportError:
+    # CPython, for the host tools
+    def const(x):
+        return x
+
+# Columns drawn between two display flushes
+FLUSH_COLUMNS = const(16)
+
+# How close (in half columns) a new sample has to be to an old one to reuse it
+REUSE_TOLERANCE = 0.001
+
+NAN = float("nan")
+
+
+class Plot:
+    def __init__(self, display, function, color, axis_color, background=0, x_min=-10.0, x_max=10.0, y_min=-10.0, y_max=10.0):
+        self.display = display
+        self.function = function
+        self.color = color
+        self.axis_color = axis_color
+        self.background = background
+        self.width = display.width
+        self.height = display.height
+
+        self.x_min = x_min
+        self.dx = (x_max - x_min) / self.width
+        self.y_min = y_min
+        self.dy = (y_max - y_min) / self.height
+
+        # samples[k] is f(x_min + k * dx / 2), column i is drawn between samples 2i and 2i + 2
+        self.points = 2 * self.width + 1
+        self.samples = array("f", [0.0] * self.points)
+        self.valid = bytearray(self.points)
+        self.evaluations = 0
+
+    def evaluate(self, x):
+        self.evaluations += 1
+        try:
+            return float(self.function(x))
+        except Exception:
+            # Outside of the domain, like sqrt of a negative number
+            return NAN
+
+    def sample(self, k):
+        if not self.valid[k]:
+            self.samples[k] = self.evaluate(self.x_min + k * self.dx / 2)
+            # Values too large for a single precision float are stored as inf, drawn as a gap like NaN
+            y = self.samples[k]
+            if y - y != 0:
+                self.samples[k] = NAN
+            self.valid[k] = 1
+        return self.samples[k]
+
+    def remap(self, x_min, dx):
+        # Moves to a new view, keeping every sample that lands on a sample of the old one.
+        samples = array("f", [0.0] * self.points)
+        valid = bytearray(self.points)
+        for j in range(self.points):
+            p = (x_min + j * dx / 2 - self.x_min) / self.dx * 2
+            i = int(p + 0.5) if p >= 0 else -1
+            if 0 <= i < self.points and abs(p - i) < REUSE_TOLERANCE and self.valid[i]:
+                samples[j] = self.samples[i]
+                valid[j] = 1
+        self.samples = samples
+        self.valid = valid
+        self.x_min = x_min
+        self.dx = dx
+
+    def pan(self, columns, rows):
+        # Moves the view right by columns and up by rows pixels.
+        if columns:
+            self.remap(self.x_min + columns * self.dx, self.dx)
+        self.y_min += rows * self.dy
+        self.render()
+
+    def zoom(self, factor):
+        # Zooms around the center of the view, factor > 1 zooms in.
+        center_x = self.x_min + self.width / 2 * self.dx
+        center_y = self.y_min + self.height / 2 * self.dy
+        dx = self.dx / factor
+        self.dy /= factor
+        self.y_min = center_y - self.height / 2 * self.dy
+        self.remap(center_x - self.width / 2 * dx, dx)
+        self.render()
+
+    def row(self, y):
+        # Rows far off the screen are clamped, they are only compared with the screen and each other.
+        # Deep zooms can take them past what int() takes.
+        r = self.height - 1 - (y - self.y_min) / self.dy
+        if r < -self.height:
+            return -self.height
+        if r > 2 * self.height:
+            return 2 * self.height
+        return int(r)
+
+    def draw_column(self, i):
+        a = self.sample(2 * i)
+        b = self.sample(2 * i + 2)
+        # NaN never equals itself
+        if a != a or b != b:
+            if a == a:
+                self.point(i, self.row(a))
+            return
+        top = self.row(a)
+        bottom = self.row(b)
+        if abs(top - bottom) > 1:
+            middle = self.sample(2 * i + 1)
+            m = self.row(middle) if middle == middle else -1
+            if middle != middle or m < min(top, bottom) - 1 or m > max(top, bottom) + 1:
+                # Discontinuity, don't connect the samples
+                self.point(i, top)
+                return
+        if top > bottom:
+            top, bottom = bottom, top
+        if bottom < 0 or top >= self.height:
+            return
+        top = max(top, 0)
+        bottom = min(bottom, self.height - 1)
+        self.display.fill_rect(i, top, 1, bottom - top + 1, self.color)
+
+    def point(self, x, y):
+        if 0 <= y < self.height:
+            self.display.fill_rect(x, y, 1, 1, self.color)
+
+    def draw_axes(self):
+        axis_row = self.row(0)
+        if 0 <= axis_row < self.height:
+            self.display.fill_rect(0, axis_row, self.width, 1, self.axis_color)
+        axis_column = int(-self.x_min / self.dx)
+        if 0 <= axis_column < self.width:
+            self.display.fill_rect(axis_column, 0, 1, self.height, self.axis_color)
+
+    def render(self):
+        self.display.fill(self.background)
+        self.draw_axes()
+        for i in range(self.width):
+            self.draw_column(i)
+            if i % FLUSH_COLUMNS == FLUSH_COLUMNS - 1:
+                self.display.show()
+        self.display.show()
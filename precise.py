@@ -0,0 +1,233 @@
+# Exact arithmetic for the high-precision mode
+#
+# Expressions are evaluated over fractions of Python big integers instead of
+# floats, so 2**100 or 1/7 come out exact. Digits of the result are produced by
+# long division from a generator, only as far as the result line has been
+# scrolled, so a result with hundreds of digits costs nothing until someone
+# looks at them.
+#
+# Only + - * / and integer powers are exact. sqrt is exact for perfect squares,
+# anything else (sqrt(2), pi) raises Inexact and the calculator falls back to
+# a float.
+
+
+class Inexact(ValueError):
+    pass
+
+
+# Largest exponent of a power, 2**100000 would take minutes on the Pico
+MAX_EXPONENT = 4096
+
+
+def _gcd(a, b):
+    while b:
+        a, b = b, a % b
+    return a
+
+
+class Fraction:
+    def __init__(self, numerator, denominator=1):
+        if denominator == 0:
+            raise ZeroDivisionError("division by zero")
+        if denominator < 0:
+            numerator = -numerator
+            denominator = -denominator
+        g = _gcd(abs(numerator), denominator)
+        if g > 1:
+            numerator //= g
+            denominator //= g
+        self.numerator = numerator
+        self.denominator = denominator
+
+    @staticmethod
+    def of(value):
+        if isinstance(value, Fraction):
+            return value
+        if isinstance(value, int):
+            return Fraction(value)
+        raise Inexact("Not exact")
+
+    def __add__(self, other):
+        other = Fraction.of(other)
+        return Fraction(self.numerator * other.denominator + other.numerator * self.denominator, self.denominator * other.denominator)
+
+    __radd__ = __add__
+
+    def __sub__(self, other):
+        return self + -Fraction.of(other)
+
+    def __rsub__(self, other):
+        return Fraction.of(other) + -self
+
+    def __mul__(self, other):
+        other = Fraction.of(other)
+        return Fraction(self.numerator * other.numerator, self.denominator * other.denominator)
+
+    __rmul__ = __mul__
+
+    def __truediv__(self, other):
+        other = Fraction.of(other)
+        return Fraction(self.numerator * other.denominator, self.denominator * other.numerator)
+
+    def __rtruediv__(self, other):
+        return Fraction.of(other) / self
+
+    def __pow__(self, power):
+        power = Fraction.of(power)
+        if power.denominator != 1:
+            raise Inexact("Fractional power")
+        n = power.numerator
+        if abs(n) > MAX_EXPONENT and abs(self.numerator) != self.denominator and self.numerator:
+            raise Inexact("Power too large")
+        if n < 0:
+            return Fraction(self.denominator ** -n, self.numerator ** -n)
+        return Fraction(self.numerator ** n, self.denominator ** n)
+
+    def __rpow__(self, base):
+        return Fraction.of(base) ** self
+
+    def __neg__(self):
+        return Fraction(-self.numerator, self.denominator)
+
+    def __pos__(self):
+        return self
+
+    def __float__(self):
+        return self.numerator / self.denominator
+
+    def expression(self):
+        # The value as calculator input, so a following calculation starts from the exact value.
+        if self.denominator == 1:
+            return str(self.numerator)
+        return f"({self.numerator}/{self.denominator})"
+
+    def digits(self):
+        # Generates the decimal expansion one character at a time. Repeating fractions never end.
+        numerator = self.numerator
+        if numerator < 0:
+            yield "-"
+            numerator = -numerator
+        whole, remainder = divmod(numerator, self.denominator)
+        # The integer part from the top digit down, without converting all of it
+        power = 1
+        while power * 10 <= whole:
+            power *= 10
+        while power:
+            digit, whole = divmod(whole, power)
+            yield chr(48 + digit)
+            power //= 10
+        if remainder:
+            yield "."
+        while remainder:
+            digit, remainder = divmod(remainder * 10, self.denominator)
+            yield chr(48 + digit)
+
+
+def _isqrt(n):
+    # Integer square root by Newton's method.
+    if n < 2:
+        return n
+    x = 1 << ((_bit_length(n) + 1) // 2)
+    while True:
+        y = (x + n // x) // 2
+        if y >= x:
+            return x
+        x = y
+
+
+def _bit_length(n):
+    length = 0
+    while n:
+        n >>= 1
+        length += 1
+    return length
+
+
+def sqrt(x):
+    x = Fraction.of(x)
+    if x.numerator < 0:
+        raise ValueError("math domain error")
+    a = _isqrt(x.numerator)
+    b = _isqrt(x.denominator)
+    if a * a != x.numerator or b * b != x.denominator:
+        raise Inexact("Irrational square root")
+    return Fraction(a, b)
+
+
+def _literal(text):
+    # Turns a decimal literal like 1.25 into a fraction.
+    if "e" in text or "E" in text:
+        raise Inexact("Exponent notation")
+    whole, _, fraction = text.partition(".")
+    return f"_f({int(whole + fraction) if whole + fraction else 0}, {10 ** len(fraction)})"
+
+
+def rewrite(expression):
+    # Replaces the number literals of a prepared expression with fractions.
+    result = []
+    i = 0
+    while i < len(expression):
+        c = expression[i]
+        if c.isdigit() or (c == "." and i + 1 < len(expression) and expression[i + 1].isdigit()):
+            j = i
+            while j < len(expression) and (expression[j].isdigit() or expression[j] == "."):
+                j += 1
+            result.append(_literal(expression[i:j]))
+            i = j
+        elif c.isalpha() or c == "_":
+            # Names are copied whole, so digits in them aren't taken for numbers
+            j = i
+            while j < len(expression) and (expression[j].isalpha() or expression[j].isdigit() or expression[j] == "_"):
+                j += 1
+            result.append(expression[i:j])
+            i = j
+        else:
+            result.append(c)
+            i += 1
+    return "".join(result)
+
+
+namespace = {"_f": Fraction, "sqrt": sqrt}
+
+
+def evaluate(expression):
+    # Evaluates an expression prepared by Math.prepare exactly. Raises Inexact if it can't be.
+    try:
+        value = eval(rewrite(expression), namespace)
+    except NameError:
+        # Like pi, which has no exact value
+        raise Inexact("Not exact")
+    return Result(Fraction.of(value))
+
+
+class Result:
+    # A result whose digits are generated as they are needed.
+
+    def __init__(self, value: Fraction):
+        self.value = value
+        self.generator = value.digits()
+        self.text = []
+        self.done = False
+
+    def expression(self):
+        return self.value.expression()
+
+    def fill(self, length):
+        # Generates digits until there are length of them, or all of them.
+        while len(self.text) < length and not self.done:
+            try:
+                self.text.append(next(self.generator))
+            except StopIteration:
+                self.done = True
+
+    def more(self, length):
+        # Whether there is anything after the first length characters.
+        self.fill(length + 1)
+        return len(self.text) > length
+
+    def window(self, start, width):
+        # The characters of the result line starting at start. A trailing → marks that there is more.
+        self.fill(start + width + 1)
+        if len(self.text) > start + width:
+            return "".join(self.text[start:start + width - 1]) + "→"
+        return "".join(self.text[start:start + width])
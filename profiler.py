@@ -0,0 +1,177 @@
+# Boot timeline profiler and runtime counters
+#
+# Records how long each boot step took and how much heap it used, so we can
+# see where the time between power-on and a usable prompt goes. After boot,
+# timed() counts calls into the stages we care about, gauges() tracks values
+# like bytes sent on the display bus, and snapshot() keeps the last few heap
+# readings. dump() prints all of it over serial, the calculator shows it on
+# its diagnostics screen.
+
+try:
+    from time import ticks_ms, ticks_us, ticks_diff
+    from gc import mem_free, mem_alloc
+    from micropython import const
+except ImportError:
+    # CPython, where the calculator core runs for the host tools. Ticks don't wrap there,
+    # and there is no MicroPython heap to report.
+    import time
+
+    def ticks_ms():
+        return time.perf_counter_ns() // 1000000
+
+    def ticks_us():
+        return time.perf_counter_ns() // 1000
+
+    def ticks_diff(end, start):
+        return end - start
+
+    def mem_free():
+        return 0
+
+    def mem_alloc():
+        return 0
+
+    def const(x):
+        return x
+
+# Histogram buckets, bucket i counts durations below 2**(i + 4) us, the last one everything longer
+BUCKETS = const(14)
+
+# Heap snapshots kept
+SNAPSHOTS = const(16)
+
+
+class BootProfiler:
+    def __init__(self):
+        self.start = ticks_ms()
+        self.last = self.start
+        self.free = mem_free()
+        self.steps = []
+
+    def step(self, name: str):
+        # Closes the current step. Heap is the difference in free memory, so a
+        # garbage collection during the step can make it negative.
+        now = ticks_ms()
+        free = mem_free()
+        self.steps.append((name, ticks_diff(now, self.last), self.free - free))
+        self.last = now
+        self.free = free
+
+    def total(self):
+        return ticks_diff(self.last, self.start)
+
+    def report(self):
+        for name, ms, heap in self.steps:
+            print(f"[BOOT] {name}: {ms} ms, {heap} B heap")
+        print(f"[BOOT] Usable after {self.total()} ms, {mem_free()} B heap free")
+
+
+class Stat:
+    # Running count, min, average, max and a power of two histogram of a duration in microseconds.
+
+    def __init__(self, name: str):
+        self.name = name
+        self.histogram = [0] * BUCKETS
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.total = 0
+        self.min = 0
+        self.max = 0
+        for i in range(BUCKETS):
+            self.histogram[i] = 0
+
+    def add(self, us: int):
+        if not self.count or us < self.min:
+            self.min = us
+        if us > self.max:
+            self.max = us
+        self.count += 1
+        self.total += us
+        bucket = 0
+        us >>= 4
+        while us and bucket < BUCKETS - 1:
+            us >>= 1
+            bucket += 1
+        self.histogram[bucket] += 1
+
+    def average(self):
+        return self.total // self.count if self.count else 0
+
+    def report(self, tag: str):
+        print(f"[{tag}] {self.name}: {self.count}x, min {self.min} us, avg {self.average()} us, max {self.max} us")
+
+    def report_histogram(self, tag: str):
+        buckets = []
+        for i in range(BUCKETS):
+            if self.histogram[i]:
+                bound = f"<{1 << (i + 4)}" if i < BUCKETS - 1 else f">={1 << (i + 3)}"
+                buckets.append(f"{bound}: {self.histogram[i]}")
+        print(f"[{tag}] {self.name} us " + ", ".join(buckets))
+
+
+# Stage counters by name, in the order they were created
+stats = {}
+names = []
+
+# Functions returning a number worth watching, like bytes sent to the display, by name
+_gauges = {"mem free": mem_free, "mem alloc": mem_alloc}
+
+# Last heap readings as (label, ticks_ms, free, allocated)
+snapshots = []
+
+
+def stat(name: str):
+    s = stats.get(name)
+    if s is None:
+        s = Stat(name)
+        stats[name] = s
+        names.append(name)
+    return s
+
+
+def timed(name: str):
+    # Decorator counting the calls of a function into the stat name.
+    s = stat(name)
+
+    def decorator(function):
+        def wrapper(*args, **kwargs):
+            start = ticks_us()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                s.add(ticks_diff(ticks_us(), start))
+        return wrapper
+    return decorator
+
+
+def gauge(name: str, function):
+    _gauges[name] = function
+
+
+def gauges():
+    # Current value of every gauge, as (name, value) pairs.
+    return [(name, function()) for name, function in _gauges.items()]
+
+
+def snapshot(label):
+    if len(snapshots) >= SNAPSHOTS:
+        snapshots.pop(0)
+    snapshots.append((label, ticks_ms(), mem_free(), mem_alloc()))
+
+
+def dump():
+    # Prints every counter, gauge and snapshot over serial.
+    for name in names:
+        stats[name].report("STATS")
+        stats[name].report_histogram("STATS")
+    for name, value in gauges():
+        print(f"[STATS] {name}: {value}")
+    for label, ms, free, allocated in snapshots:
+        print(f"[STATS] heap at {ms} ms after {label}: {free} B free, {allocated} B allocated")
+
+
+def reset():
+    for name in names:
+        stats[name].reset()
@@ -0,0 +1,213 @@
+# Cooperative runtime on uasyncio
+#
+# The keypad scanner, the key handler, the render flusher, the idle timer, the
+# session saver and the cursor blinker each run as their own task. Keys go from the scanner to
+# the handler through a queue, so a key pressed while the display is busy is
+# not lost, and drawing only marks the frame dirty: the flusher pushes it to
+# the display at most once per frame interval. Keys are turned into buttons
+# when they are handled, so keys typed ahead are read in the state the
+# calculator is in by then.
+
+try:
+    import uasyncio as asyncio
+except ImportError:
+    import asyncio
+
+import time
+from micropython import const
+
+import profiler
+from profiler import Stat
+
+# Shortest time between two display flushes, about 30 frames per second
+FRAME_MS = const(33)
+# How often the keypad is scanned
+SCAN_MS = const(20)
+# Inactivity before the screen is blanked
+IDLE_MS = const(120000)
+# Half period of the cursor blink
+BLINK_MS = const(500)
+# Quiet time after a key before the GC may run
+GC_GAP_MS = const(50)
+# Quiet time after a key before the session is written to flash
+SAVE_IDLE_MS = const(2000)
+
+
+class Queue:
+    # A bounded FIFO for tasks of one event loop. put_nowait drops the oldest item when full.
+
+    def __init__(self, size=32):
+        self.items = []
+        self.size = size
+        self.event = asyncio.Event()
+
+    def put_nowait(self, item):
+        if len(self.items) >= self.size:
+            self.items.pop(0)
+        self.items.append(item)
+        self.event.set()
+
+    async def get(self):
+        while not self.items:
+            self.event.clear()
+            await self.event.wait()
+        return self.items.pop(0)
+
+
+class FrameLimiter:
+    # Stands in for the display. show() only marks the frame dirty, unless the last flush was a whole
+    # frame interval ago, so long drawing (like a plot) still shows up progressively.
+    # Everything else is passed through to the display.
+
+    def __init__(self, display, frame_ms=FRAME_MS):
+        self.display = display
+        self.frame_ms = frame_ms
+        self.dirty = False
+        self.last = time.ticks_ms()
+        self.flushes = Stat("flush")
+
+    def __getattr__(self, name):
+        return getattr(self.display, name)
+
+    def show(self):
+        self.dirty = True
+        if time.ticks_diff(time.ticks_ms(), self.last) >= self.frame_ms:
+            self.flush()
+
+    def flush(self):
+        start = time.ticks_us()
+        self.dirty = False
+        self.display.show()
+        self.last = time.ticks_ms()
+        self.flushes.add(time.ticks_diff(time.ticks_us(), start))
+
+
+class Scheduler:
+    def __init__(self, calculator, frame: FrameLimiter, keypad, sleep_button, memory=None, session=None):
+        self.calculator = calculator
+        self.memory = memory
+        self.session = session
+        # Whether keys were handled since the session was last saved
+        self.unsaved = False
+        self.frame = frame
+        self.keypad = keypad
+        self.sleep_button = sleep_button
+        self.keys = Queue()
+        self.last_input = time.ticks_ms()
+        self.asleep = False
+
+        # From a key being recognized to the calculator being done with it
+        self.key_latency = Stat("key latency")
+        # How late the periodic tasks wake up
+        self.wakeup_latency = Stat("wakeup latency")
+
+    async def tick(self, ms):
+        start = time.ticks_ms()
+        await asyncio.sleep_ms(ms)
+        self.wakeup_latency.add(max(0, time.ticks_diff(time.ticks_ms(), start) - ms) * 1000)
+
+    async def scan(self):
+        keypad = self.keypad
+        while True:
+            # The keypad queues presses itself, this only moves them to the handler
+            keypad.scan()
+            while True:
+                key = keypad.get()
+                if key is None:
+                    break
+                self.keys.put_nowait(key)
+            await self.tick(SCAN_MS)
+
+    async def handle(self):
+        while True:
+            row, col, is_long_press, detected = await self.keys.get()
+            button = self.keypad.translate_pin(row, col, self.calculator.state, is_long_press)
+            if button is not None:
+                self.press(button, detected)
+
+    def press(self, button, detected):
+        calculator = self.calculator
+        print(f"[PIN] Detected {button}")
+        self.last_input = time.ticks_ms()
+        woken = self.asleep and button != self.sleep_button
+        self.asleep = button == self.sleep_button
+        calculator.cursor(False)
+        if self.memory:
+            self.memory.begin()
+            subsystem = calculator.subsystem()
+        try:
+            if woken:
+                # Sleep blanked the screen, the key is handled on the screen it left
+                calculator.redraw()
+            calculator.step(button)
+        except Exception as e:
+            # A key that fails must not take the handler task down with it
+            print(f"[SCHED] {button} failed: {e}")
+        self.key_latency.add(time.ticks_diff(time.ticks_us(), detected))
+        if self.memory:
+            self.memory.end(subsystem)
+        profiler.snapshot(button)
+        self.unsaved = True
+        if self.asleep:
+            # Power may be cut while it sleeps
+            self.save()
+
+    def save(self):
+        if self.session:
+            self.unsaved = False
+            self.session.save(self.calculator)
+
+    async def render(self):
+        frame = self.frame
+        while True:
+            await self.tick(frame.frame_ms)
+            if frame.dirty:
+                frame.flush()
+
+    async def idle(self):
+        while True:
+            await self.tick(1000)
+            if not self.asleep and time.ticks_diff(time.ticks_ms(), self.last_input) >= IDLE_MS:
+                self.press(self.sleep_button, time.ticks_us())
+                self.report()
+
+    async def collect(self):
+        # Lets the memory manager collect while nothing else is going on.
+        while True:
+            await self.tick(GC_GAP_MS)
+            if not self.keys.items and not self.frame.dirty and time.ticks_diff(time.ticks_ms(), self.last_input) >= GC_GAP_MS:
+                self.memory.idle()
+
+    async def persist(self):
+        # Saves the session once the keys stop for a while, flash is slow to write and wears out.
+        while True:
+            await self.tick(SAVE_IDLE_MS // 4)
+            if self.unsaved and not self.keys.items and time.ticks_diff(time.ticks_ms(), self.last_input) >= SAVE_IDLE_MS:
+                self.save()
+
+    async def blink(self):
+        visible = False
+        while True:
+            await self.tick(BLINK_MS)
+            visible = not visible and not self.asleep
+            self.calculator.cursor(visible)
+
+    def report(self):
+        self.key_latency.report("SCHED")
+        self.wakeup_latency.report("SCHED")
+        self.frame.flushes.report("SCHED")
+        if self.memory:
+            self.memory.report()
+
+    async def main(self):
+        for task in (self.scan, self.handle, self.render, self.idle, self.blink):
+            asyncio.create_task(task())
+        if self.memory:
+            asyncio.create_task(self.collect())
+        if self.session:
+            asyncio.create_task(self.persist())
+        while True:
+            await asyncio.sleep_ms(60000)
+
+    def run(self):
+        asyncio.run(self.main())
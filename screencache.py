@@ -0,0 +1,169 @@
+# Pre-rendered static screens
+#
+# The splash screen and the formula overviews are the same text every time
+# they are shown, yet each view draws them a glyph at a time, and without the
+# compositor every glyph is a transfer of its own on the bus. The screen cache
+# renders such a screen once, on its first view, into a one bit per pixel
+# bitmap as wide as the display and keeps it on flash. Later views read it
+# back and the display draws it with one blit per band, a band being the rows
+# of a line of text with its colors.
+#
+# A screen is stored under its key together with a signature of what was
+# rendered: the text, positions and colors of its lines, the display size and
+# the fonts. It is only drawn from the cache if the signature matches, so a
+# changed formula catalog, display or font renders the screen again and
+# replaces the stale file.
+#
+# A cached screen, little endian:
+#
+#   signature length (2 bytes), signature (utf-8)
+#   band count (1 byte), per band: y, height, color, background (2 bytes each)
+#   per row of every band: n (1 byte), the first n bytes of the row, the rest of it is empty
+
+import framebuf
+import os
+import struct
+
+import fonts
+import profiler
+
+DIRECTORY = "screens"
+BAND = "<HHHH"
+BAND_SIZE = struct.calcsize(BAND)
+
+
+class ScreenCache:
+    def __init__(self, width, height, directory=DIRECTORY):
+        self.width = width
+        self.height = height
+        self.stride = (width + 7) // 8
+        self.directory = directory
+        # MONO_HLSB bitmap of the screen last rendered or loaded, allocated on first use
+        self.bitmap = None
+        self.framebuffer = None
+        # (y, height, color, background) of each band of that screen
+        self.bands = []
+        self.hits = 0
+        self.misses = 0
+        profiler.gauge("screen cache hits", lambda: self.hits)
+        profiler.gauge("screen cache misses", lambda: self.misses)
+
+    def get(self, key, items, background):
+        # Returns the bands of a screen of items (text, x, y, color, font), with the screen in the bitmap.
+        # None if the screen can't be drawn in bands, like when lines of different colors overlap.
+        if self.bitmap is None:
+            self.bitmap = bytearray(self.stride * self.height)
+            self.framebuffer = framebuf.FrameBuffer(self.bitmap, self.width, self.height, framebuf.MONO_HLSB)
+        signature = self.signature(items, background).encode("utf-8")
+        if self.load(key, signature):
+            self.hits += 1
+            return self.bands
+        if not self.render(items, background):
+            return None
+        self.misses += 1
+        self.store(key, signature)
+        return self.bands
+
+    def rows(self, y, height):
+        # MONO_HLSB framebuffer over rows of the bitmap.
+        return framebuf.FrameBuffer(memoryview(self.bitmap)[y * self.stride:(y + height) * self.stride], self.width, height, framebuf.MONO_HLSB)
+
+    def signature(self, items, background):
+        parts = [f"{self.width}x{self.height} {background}"]
+        for text, x, y, color, font in items:
+            # The size of the glyph data stands in for the font, a rebuilt font almost always changes it
+            parts.append(f"{x},{y},{color},{font.WIDTH}x{font.HEIGHT}:{len(font.data)} {text}")
+        return "\n".join(parts)
+
+    def path(self, key):
+        return f"{self.directory}/{key}.bin"
+
+    def render(self, items, background):
+        # Draws the items into the bitmap and works out the bands. Returns False if they don't make bands.
+        self.framebuffer.fill(0)
+        bands = []
+        for text, x, y, color, font in items:
+            top = max(0, y)
+            bottom = min(self.height, y + font.HEIGHT)
+            if top >= bottom:
+                continue
+            for i in range(len(bands)):
+                band_top, band_height, band_color, band_background = bands[i]
+                if top < band_top + band_height and band_top < bottom:
+                    if band_color != color or band_background != background:
+                        return False
+                    top = min(top, band_top)
+                    bottom = max(bottom, band_top + band_height)
+                    bands[i] = None
+            bands = [band for band in bands if band is not None]
+            bands.append((top, bottom - top, color, background))
+            for char in text:
+                c = fonts.code(char)
+                if not font.has(c):
+                    c = 0x3F
+                self.framebuffer.blit(font.glyph(c), x, y)
+                x += font.WIDTH
+        self.bands = bands
+        return True
+
+    def load(self, key, signature):
+        # Reads a cached screen into the bitmap. Returns False if there is none, it is for other content or damaged.
+        try:
+            with open(self.path(key), "rb") as f:
+                data = f.read()
+        except OSError:
+            return False
+        try:
+            length = struct.unpack_from("<H", data, 0)[0]
+            if data[2:2 + length] != signature:
+                return False
+            offset = 2 + length
+            bands = []
+            for i in range(data[offset]):
+                bands.append(struct.unpack_from(BAND, data, offset + 1 + i * BAND_SIZE))
+            offset += 1 + len(bands) * BAND_SIZE
+            self.framebuffer.fill(0)
+            bitmap = self.bitmap
+            view = memoryview(data)
+            stride = self.stride
+            for y, height, color, background in bands:
+                for row in range(y, y + height):
+                    n = data[offset]
+                    start = row * stride
+                    bitmap[start:start + n] = view[offset + 1:offset + 1 + n]
+                    offset += 1 + n
+        except (IndexError, ValueError):
+            return False
+        # A file cut short by a reset
+        if offset != len(data):
+            return False
+        self.bands = bands
+        return True
+
+    def store(self, key, signature):
+        out = bytearray(struct.pack("<H", len(signature)))
+        out.extend(signature)
+        out.append(len(self.bands))
+        for band in self.bands:
+            out.extend(struct.pack(BAND, *band))
+        bitmap = self.bitmap
+        stride = self.stride
+        for y, height, color, background in self.bands:
+            for row in range(y, y + height):
+                start = row * stride
+                end = start + stride
+                while end > start and not bitmap[end - 1]:
+                    end -= 1
+                out.append(end - start)
+                out.extend(bitmap[start:end])
+        try:
+            try:
+                os.mkdir(self.directory)
+            except OSError:
+                # Already there
+                pass
+            with open(self.path(key), "wb") as f:
+                f.write(out)
+        except OSError as e:
+            # Drawn from the bitmap all the same, it is just rendered again next time
+            print(f"[SCREENS] Can't store {key}: {e}")
@@ -0,0 +1,221 @@
+# Session snapshots
+#
+# What is on the screen is a small amount of state: the expression, the state
+# of the calculator, the selected formula, the provider values and the last
+# result. It is packed into a few dozen bytes and written to flash when the
+# calculator goes quiet or to sleep, and restored at boot, so a reset puts the
+# user back where they were instead of on an empty screen.
+#
+# session.bin holds two slots of SLOT_SIZE bytes. A snapshot goes into the slot
+# that doesn't hold the newest one, so a write cut short by power loss leaves
+# the previous snapshot intact. A slot is
+#
+#   checksum  4 bytes, Adler-32 of everything after it up to the end of the body
+#   magic     2 bytes
+#   version   1 byte, snapshots of another version are ignored
+#   sequence  4 bytes, the newest valid slot wins
+#   length    2 bytes, of the body
+#   body      fixed fields (BODY) followed by strings, each a 2 byte length and utf-8
+#
+# All of it is little endian. Loading is one read of the whole file.
+
+import struct
+from micropython import const
+
+import profiler
+
+PATH = "session.bin"
+SLOT_SIZE = const(512)
+
+MAGIC = b"SC"
+VERSION = const(1)
+HEADER = "<I2sBIH"
+HEADER_SIZE = const(13)
+
+# state, flags, formula count, current formula, description scroll, at provider, result unit, result dimension, result value
+BODY = "<BBBBBBBId"
+BODY_SIZE = const(19)
+
+HAS_CALCULATED = const(1)
+PRECISE = const(2)
+PROVIDERS = const(4)
+RESULT = const(8)
+
+# Result unit without a name, only its dimension is kept
+UNNAMED = const(254)
+NO_UNIT = const(255)
+
+
+def checksum(data, start, end):
+    # Adler-32, Fletcher's checksum mod 255 can't tell a byte of 0x00 from one of 0xFF.
+    a = 1
+    b = 0
+    for i in range(start, end):
+        a = (a + data[i]) % 65521
+        b = (b + a) % 65521
+    return b << 16 | a
+
+
+def pack_string(out, text):
+    data = text.encode("utf-8")
+    out.extend(struct.pack("<H", len(data)))
+    out.extend(data)
+
+
+def unpack_string(data, offset):
+    length = struct.unpack_from("<H", data, offset)[0]
+    offset += 2
+    return str(data[offset:offset + length], "utf-8"), offset + length
+
+
+def pack(calculator):
+    # Body of a snapshot of the calculator.
+    from calculator import State, Formulas
+    import units
+
+    state = calculator.state
+    to_eval = calculator.to_eval
+    has_calculated = calculator.has_calculated
+    # Screens that can't be rebuilt from the snapshot resume on the screen they were opened from
+    if state == State.sweep:
+        state = State.formula_overview
+    elif state == State.plot or state == State.diagnostics or state == State.matrix:
+        state = State.calculate
+
+    flags = HAS_CALCULATED if has_calculated else 0
+    if calculator.precise:
+        flags |= PRECISE
+    provider_state = calculator.provider_state if state == State.formula_calculation else None
+    if provider_state:
+        flags |= PROVIDERS
+    value = calculator.result_value
+    if isinstance(value, (int, float)):
+        flags |= RESULT
+    else:
+        value = 0.0
+    unit = calculator.result_unit
+    unit_index = NO_UNIT
+    dimension = 0
+    if unit:
+        unit_index = units.UNITS.index(unit) if unit in units.UNITS else UNNAMED
+        dimension = unit.dimension
+
+    out = bytearray(struct.pack(BODY, state, flags, len(Formulas.formulas), calculator.current_formula,
+                                calculator.description_scroll, provider_state.at_provider if provider_state else 0,
+                                unit_index, dimension, value))
+    pack_string(out, to_eval)
+    if provider_state:
+        for v in provider_state.values:
+            pack_string(out, v)
+    return out
+
+
+def unpack(data, calculator):
+    # Puts the state of a snapshot body into the calculator. Returns False, leaving the calculator alone,
+    # if the snapshot doesn't fit the formula catalog of this firmware.
+    from calculator import State, Formulas, ProviderState
+    import units
+
+    state, flags, formula_count, current_formula, scroll, at_provider, unit_index, dimension, value = struct.unpack_from(BODY, data, 0)
+    if formula_count != len(Formulas.formulas) or current_formula >= formula_count or state > State.formula_calculation:
+        return False
+    to_eval, offset = unpack_string(data, BODY_SIZE)
+    provider_state = None
+    if flags & PROVIDERS:
+        provider_state = ProviderState(current_formula)
+        for i in range(len(provider_state.values)):
+            provider_state.values[i], offset = unpack_string(data, offset)
+        provider_state.at_provider = min(at_provider, len(provider_state.values) - 1)
+
+    calculator.state = state
+    calculator.to_eval = to_eval
+    calculator.has_calculated = bool(flags & HAS_CALCULATED)
+    calculator.precise = bool(flags & PRECISE)
+    calculator.current_formula = current_formula
+    calculator.description_scroll = scroll
+    calculator.provider_state = provider_state
+    calculator.result_value = value if flags & RESULT else None
+    if unit_index == NO_UNIT:
+        calculator.result_unit = None
+    elif unit_index == UNNAMED:
+        calculator.result_unit = units.Unit(dimension)
+    else:
+        calculator.result_unit = units.UNITS[unit_index]
+    return True
+
+
+class Session:
+    def __init__(self, path=PATH):
+        self.path = path
+        # Sequence number and slot of the newest snapshot
+        self.sequence = 0
+        self.slot = 1
+        # Body of the last snapshot written or loaded, an unchanged state isn't written again
+        self.saved = None
+        self.writes = 0
+        profiler.gauge("session writes", lambda: self.writes)
+
+    def load(self):
+        # Returns the body of the newest valid snapshot, or None.
+        try:
+            with open(self.path, "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+        body = None
+        for slot in range(len(data) // SLOT_SIZE):
+            start = slot * SLOT_SIZE
+            check, magic, version, sequence, length = struct.unpack_from(HEADER, data, start)
+            if magic != MAGIC or version != VERSION or length > SLOT_SIZE - HEADER_SIZE:
+                continue
+            if checksum(data, start + 4, start + HEADER_SIZE + length) != check:
+                print(f"[SESSION] Slot {slot} is damaged")
+                continue
+            if body is None or sequence > self.sequence:
+                self.sequence = sequence
+                self.slot = slot
+                body = data[start + HEADER_SIZE:start + HEADER_SIZE + length]
+        self.saved = body
+        return body
+
+    def restore(self, calculator, body):
+        # Restores a loaded snapshot and draws its screen. Returns whether it could.
+        try:
+            if not unpack(body, calculator):
+                print("[SESSION] Snapshot is from another formula catalog")
+                return False
+        except Exception as e:
+            print(f"[SESSION] Can't restore: {e}")
+            return False
+        calculator.redraw()
+        print(f"[SESSION] Restored snapshot {self.sequence}")
+        return True
+
+    def save(self, calculator):
+        # Writes a snapshot of the calculator, unless the last one already has this state. Returns whether it wrote.
+        body = pack(calculator)
+        if body == self.saved:
+            return False
+        if HEADER_SIZE + len(body) > SLOT_SIZE:
+            print(f"[SESSION] Snapshot of {len(body)} B doesn't fit a slot")
+            return False
+        slot = bytearray(HEADER_SIZE + len(body))
+        struct.pack_into(HEADER, slot, 0, 0, MAGIC, VERSION, self.sequence + 1, len(body))
+        slot[HEADER_SIZE:] = body
+        struct.pack_into("<I", slot, 0, checksum(slot, 4, len(slot)))
+        target = 1 - self.slot
+
+        try:
+            f = open(self.path, "r+b")
+        except OSError:
+            # First snapshot, both slots start out empty
+            f = open(self.path, "wb")
+            f.write(bytearray(2 * SLOT_SIZE))
+        with f:
+            f.seek(target * SLOT_SIZE)
+            f.write(slot)
+        self.sequence += 1
+        self.slot = target
+        self.saved = body
+        self.writes += 1
+        return True
@@ -85,6 +85,9 @@ class SSD1306(framebuf.FrameBuffer):
     def invert(self, invert):
         self.write_cmd(SET_NORM_INV | (invert & 1))
 
+    def scroll_start(self, line):
+        self.write_cmd(SET_DISP_START_LINE | (line & 0x3F))
+
     def show(self):
         x0 = 0
         x1 = self.width - 1
@@ -0,0 +1,60 @@
+# Formula calculations on the host, through the same Calculator the device runs.
+# Run pytest, or python -P -m pytest, from the repository root (see pytest.ini). The root is appended
+# to sys.path, not inserted, so its copy.py and types.py don't shadow the standard library.
+
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from calculator import Calculator, DrawOps, Buttons, State, Formulas, ProviderState
+
+Formulas.check_units()
+
+
+def calculate(formula, values):
+    # Enters the provider values of a formula like on the keypad and returns the calculator.
+    calculator = Calculator(DrawOps())
+    calculator.step(Buttons.menu)
+    for i in range(formula):
+        calculator.step(Buttons.down)
+    calculator.step(Buttons.ok)
+    for value in values:
+        calculator.run(value)
+        calculator.step(Buttons.ok)
+    return calculator
+
+
+def test_plain_values():
+    calculator = calculate(0, ["6", "3"])
+    assert calculator.result_value == 18
+    assert str(calculator.result_unit) == "J"
+
+
+def test_expression_value():
+    calculator = calculate(0, ["2*3", "3"])
+    assert calculator.result_value == 18
+    assert str(calculator.result_unit) == "J"
+
+
+def test_expression_matches_evaluate():
+    provider_state = ProviderState(0)
+    provider_state.values = ["^16", "2"]
+    assert Formulas.evaluate(provider_state)[0] == 8
+    assert calculate(0, ["^16", "2"]).result_value == 8
+
+
+def test_sweep_with_expression_value():
+    calculator = calculate(0, ["1..3", "2*3"])
+    assert calculator.state == State.sweep
+    calculator.sweep.compute()
+    assert list(calculator.sweep.results[:3]) == [6, 12, 18]
+
+
+def test_unnamed_unit():
+    # cm2 * cm2 has no named unit, the result stays in the units of the providers
+    formula = [f.formula for f in Formulas.formulas].index("P=2*O*Pl")
+    assert Formulas.formulas[formula].unit is None
+    calculator = calculate(formula, ["10", "10"])
+    assert calculator.result_value == 200
+    assert calculator.result_unit is None
@@ -0,0 +1,200 @@
+# Bulk evaluation on the host with the calculator engine
+#
+# Runs expressions, or formulas with provider values, through the same Math and
+# Formulas code the calculator runs (calculator.py imports without any of the
+# hardware modules) and prints one result line per input line:
+#
+#   python tools/batch_eval.py < expressions.txt
+#   python tools/batch_eval.py --formulas --file answers.txt
+#
+# An expression line is what would be typed on the keypad, like 2*^9+sin(1).
+# A formula line is the formula, as shown in the overview (A=F*s) or as its
+# index in the catalog, followed by the provider values in the order they are
+# entered on the device, separated by tabs:
+#
+#   A=F*s	12	3
+#
+# With --chain a line is a target symbol and the known quantities, which can
+# take a unit when the symbol alone is ambiguous. The cheapest chain of
+# formulas from the known quantities to the target is evaluated:
+#
+#   v	Wk=200	m=4
+#   Wp	m=2	h=30 cm
+#
+# Every output line is the input line, a tab and the result. A result is the
+# value as str() gives it, with the unit of a formula after a space, or NAPAKA
+# where the calculator would show it. --screen formats results like the
+# calculator shows them instead.
+#
+# Inputs of POOL_THRESHOLD lines and more are spread over a process pool,
+# the output stays in input order. The throughput is printed to stderr at the
+# end.
+
+import argparse
+import itertools
+import os
+import sys
+import time
+
+# The calculator modules live in the repository root. Appended rather than inserted,
+# so the repository's copy.py and types.py don't shadow the standard library.
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from calculator import Math, Formulas, ProviderState
+from numformat import NumberFormatter
+import precise
+import units
+
+# Smaller inputs are evaluated in this process, a pool costs more than it saves
+POOL_THRESHOLD = 10000
+CHUNK_SIZE = 256
+
+ERROR = "NAPAKA"
+
+# Set up by setup() in every process
+options = None
+formatter = None
+
+
+def setup(arguments):
+    # Prepares the engine like the calculator does at boot. Runs in every worker of the pool.
+    global options, formatter
+    options = arguments
+    formatter = NumberFormatter(arguments.width)
+    # The engine logs with print(), which would end up between the results
+    sys.stdout = sys.stderr if arguments.verbose else open(os.devnull, "w")
+    Math.select(arguments.fastmath)
+    Formulas.check_units()
+
+
+def find_formula(name):
+    if name.isdigit():
+        index = int(name)
+        if index < len(Formulas.formulas):
+            return index
+    for index in range(len(Formulas.formulas)):
+        if Formulas.formulas[index].formula == name:
+            return index
+    raise ValueError(f"Unknown formula {name}")
+
+
+def show(value, unit=None):
+    if unit:
+        unit = str(unit)
+    if options.screen and isinstance(value, (int, float)):
+        width = options.width - (len(unit) + 1 if unit else 0)
+        formatter.format(value, width, engineering=bool(unit))
+        value = formatter.text()
+    return f"{value} {unit}" if unit else str(value)
+
+
+def evaluate_expression(line):
+    if options.precise:
+        try:
+            return precise.evaluate(Math.prepare(line)).expression()
+        except precise.Inexact:
+            pass
+    return show(Math.evaluate(line))
+
+
+def evaluate_formula(line):
+    fields = line.split("\t")
+    provider_state = ProviderState(find_formula(fields[0]))
+    values = fields[1:]
+    if len(values) != len(provider_state.providers):
+        raise ValueError(f"{fields[0]} takes {len(provider_state.providers)} values")
+    provider_state.values = values
+    return show(*Formulas.evaluate(provider_state))
+
+
+def evaluate_chain(line):
+    fields = line.split("\t")
+    planner = Formulas.planner()
+    values = {}
+    for known in fields[1:]:
+        symbol, _, value = known.partition("=")
+        value, _, unit = value.strip().partition(" ")
+        unit = units.parse(unit) if unit else None
+        values[planner.find(symbol.strip(), unit)] = (float(value), unit)
+    return show(*Formulas.chain(values, fields[0]))
+
+
+def evaluate(line):
+    # Returns the output line for an input line, and whether it was an error.
+    try:
+        if options.chain:
+            result = evaluate_chain(line)
+        elif options.formulas:
+            result = evaluate_formula(line)
+        else:
+            result = evaluate_expression(line)
+        return f"{line}\t{result}", False
+    except Exception as e:
+        if options.verbose:
+            print(f"[BATCH] {line}: {e}", file=sys.stderr)
+        return f"{line}\t{ERROR}", True
+
+
+def lines(stream):
+    for line in stream:
+        line = line.rstrip("\r\n")
+        if line:
+            yield line
+
+
+def run(arguments, source, out):
+    setup(arguments)
+    start = time.perf_counter()
+    # Only the beginning is read to decide, the rest is streamed either way
+    head = list(itertools.islice(source, POOL_THRESHOLD))
+    rest = itertools.chain(head, source)
+    pool = None
+    jobs = 1
+    if len(head) == POOL_THRESHOLD and arguments.jobs != 1:
+        import multiprocessing
+        jobs = arguments.jobs or os.cpu_count() or 1
+        pool = multiprocessing.Pool(jobs, setup, (arguments,))
+        results = pool.imap(evaluate, rest, CHUNK_SIZE)
+    else:
+        results = map(evaluate, rest)
+
+    count = errors = 0
+    try:
+        for text, error in results:
+            out.write(text)
+            out.write("\n")
+            count += 1
+            errors += error
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    out.flush()
+
+    elapsed = time.perf_counter() - start
+    rate = count / elapsed if elapsed > 0 else 0
+    print(f"[BATCH] {count} lines in {elapsed:.2f} s, {rate:.0f} lines/s, {errors} errors, {jobs} processes", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluates expressions or formulas with the calculator engine")
+    parser.add_argument("--file", help="input file, stdin if not given")
+    parser.add_argument("--formulas", action="store_true", help="lines are formulas with provider values")
+    parser.add_argument("--chain", action="store_true", help="lines are a target and known quantities, chained over the formulas")
+    parser.add_argument("--precise", action="store_true", help="exact results where possible, like the high-precision mode")
+    parser.add_argument("--fastmath", action="store_true", help="math functions of fastmath instead of the math module")
+    parser.add_argument("--screen", action="store_true", help="format results like the screen shows them")
+    parser.add_argument("--width", type=int, default=15, help="characters in a result line for --screen")
+    parser.add_argument("--jobs", type=int, default=0, help="processes for large inputs, all cores by default")
+    parser.add_argument("--verbose", action="store_true", help="show the engine log and errors on stderr")
+    arguments = parser.parse_args()
+
+    # Results go to the real stdout, setup() takes sys.stdout over for the engine log
+    out = sys.stdout
+    source = open(arguments.file, encoding="utf-8") if arguments.file else sys.stdin
+    with source:
+        run(arguments, lines(source), out)
+
+
+if __name__ == "__main__":
+    main()
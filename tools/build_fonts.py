@@ -0,0 +1,117 @@
+# Builds the packed fonts of the calculator from st7789_mpy bitmap fonts
+#
+# Keeps only the glyphs of characters the calculator can draw, which are the
+# characters of every string in the firmware modules plus what the number
+# formatter produces, and writes them run-length encoded into a module that
+# fonts.PackedFont reads (see fonts.py for the format):
+#
+#   python tools/build_fonts.py st7789_mpy/fonts/bitmap/vga1_16x32.py font_large.py
+#   python tools/build_fonts.py st7789_mpy/fonts/bitmap/vga2_bold_16x16.py font_small.py
+#
+# The CI build runs it before freezing the modules.
+
+import argparse
+import ast
+import glob
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Appended, so the repository's copy.py and types.py don't shadow the standard library
+sys.path.append(ROOT)
+
+import fonts
+
+# Drawn without appearing in a string: numbers, and the glyph for characters a font doesn't have
+ALWAYS = "0123456789.-e' ?"
+
+BYTES_PER_LINE = 32
+
+
+def used_characters(root=ROOT):
+    # Every character of every string constant in the firmware modules.
+    characters = set(ALWAYS)
+    for path in sorted(glob.glob(os.path.join(root, "*.py"))):
+        with open(path, encoding="utf-8") as f:
+            tree = ast.parse(f.read(), path)
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Constant) and isinstance(node.value, str):
+                characters.update(node.value)
+    return characters
+
+
+def load_font(path):
+    # The st7789_mpy fonts are plain modules with WIDTH, HEIGHT, FIRST, LAST and FONT.
+    namespace = {}
+    with open(path, encoding="utf-8") as f:
+        exec(f.read(), namespace)
+    return namespace
+
+
+def pack(font, characters):
+    # Returns (codes, offsets, data) of the glyphs of characters the font has, and the characters it doesn't have.
+    size = font["WIDTH"] * font["HEIGHT"] // 8
+    glyphs = bytes(font["FONT"])
+    codes = set()
+    missing = []
+    for char in characters:
+        if not char.isprintable():
+            continue
+        c = fonts.code(char)
+        if font["FIRST"] <= c <= font["LAST"]:
+            codes.add(c)
+        else:
+            missing.append(char)
+    codes = sorted(codes)
+    offsets = bytearray()
+    data = bytearray()
+    for c in codes:
+        start = (c - font["FIRST"]) * size
+        glyph = glyphs[start:start + size]
+        encoded = fonts.encode(glyph)
+        # The codec is checked on every glyph, a font that doesn't decode would only show up on the device
+        decoded = bytearray(size)
+        fonts.decode(encoded, 0, len(encoded), decoded)
+        assert decoded == glyph, f"Glyph {c} doesn't decode"
+        offsets.extend(len(data).to_bytes(2, "big"))
+        data.extend(encoded)
+    offsets.extend(len(data).to_bytes(2, "big"))
+    assert len(data) < 1 << 16, "Too many glyphs for 2 byte offsets"
+    return bytes(codes), bytes(offsets), bytes(data), sorted(missing)
+
+
+def write_bytes(out, name, value):
+    out.write(f"{name} = (\n")
+    for i in range(0, len(value), BYTES_PER_LINE):
+        out.write(f"    {value[i:i + BYTES_PER_LINE]!r}\n")
+    out.write(")\n")
+
+
+def build(source, target):
+    font = load_font(source)
+    codes, offsets, data, missing = pack(font, used_characters())
+    glyph_count = font["LAST"] - font["FIRST"] + 1
+    with open(target, "w", encoding="utf-8") as out:
+        out.write(f"# Generated by tools/build_fonts.py from {os.path.basename(source)}, {len(codes)} of {glyph_count} glyphs\n")
+        out.write(f"WIDTH = {font['WIDTH']}\n")
+        out.write(f"HEIGHT = {font['HEIGHT']}\n")
+        write_bytes(out, "CODES", codes)
+        write_bytes(out, "OFFSETS", offsets)
+        write_bytes(out, "DATA", data)
+    full = glyph_count * font["WIDTH"] * font["HEIGHT"] // 8
+    packed = len(codes) + len(offsets) + len(data)
+    print(f"[FONTS] {target}: {len(codes)} of {glyph_count} glyphs, {full} B -> {packed} B")
+    if missing:
+        print(f"[FONTS] No glyph for {''.join(missing)}, drawn as ?")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Builds a packed calculator font from a st7789_mpy bitmap font")
+    parser.add_argument("source", help="bitmap font module, like vga1_16x32.py")
+    parser.add_argument("target", help="module to write, like font_large.py")
+    arguments = parser.parse_args()
+    build(arguments.source, arguments.target)
+
+
+if __name__ == "__main__":
+    main()
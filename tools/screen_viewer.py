@@ -0,0 +1,187 @@
+# Host side viewer for the headless display backend (headless.py)
+#
+# Reads the calculator's serial output, prints log lines as they come and
+# redraws the screen in the terminal whenever a frame arrives.
+#
+#   python tools/screen_viewer.py --port /dev/ttyACM0
+#   python tools/screen_viewer.py --file capture.bin
+#
+# Reading from the port needs pyserial. A capture file is replayed as is.
+
+import argparse
+import sys
+
+MAGIC = b"\x00SC"
+KEYFRAME = 0x4B
+DELTA = 0x44
+REQUEST_KEYFRAME = b"K"
+
+OP_SKIP = 0
+OP_COLOR = 1
+OP_REPEAT = 2
+OP_LITERAL = 3
+
+# CP437 codes the calculator uses outside of ASCII, see CP437 in fonts.py
+CP437 = {
+    0x1A: "→",
+    0x1E: "Δ",
+    0xF8: "°",
+    0xEA: "Ω",
+    0xFB: "√",
+    0xF9: "·",
+}
+
+
+class Screen:
+    def __init__(self, columns=15, rows=15):
+        self.columns = columns
+        self.rows = rows
+        self.chars = [32] * (columns * rows)
+        self.fg = [0xFFFF] * (columns * rows)
+        self.bg = [0] * (columns * rows)
+        self.synced = False
+
+    def apply(self, kind, payload):
+        # Applies one frame. Deltas before the first keyframe are dropped, there is nothing to apply them to.
+        if kind == KEYFRAME:
+            self.synced = True
+        elif not self.synced:
+            return False
+        cell = 0
+        fg = bg = 0
+        i = 0
+        while i < len(payload):
+            op = payload[i]
+            if op == OP_SKIP:
+                cell += payload[i + 1]
+                i += 2
+            elif op == OP_COLOR:
+                fg = payload[i + 1] << 8 | payload[i + 2]
+                bg = payload[i + 3] << 8 | payload[i + 4]
+                i += 5
+            elif op == OP_REPEAT:
+                for k in range(payload[i + 1]):
+                    self.set(cell, payload[i + 2], fg, bg)
+                    cell += 1
+                i += 3
+            elif op == OP_LITERAL:
+                n = payload[i + 1]
+                for code in payload[i + 2:i + 2 + n]:
+                    self.set(cell, code, fg, bg)
+                    cell += 1
+                i += 2 + n
+            else:
+                raise ValueError(f"Unknown operation {op} in frame")
+        return True
+
+    def set(self, cell, code, fg, bg):
+        if cell < len(self.chars):
+            self.chars[cell] = code
+            self.fg[cell] = fg
+            self.bg[cell] = bg
+
+    def render(self):
+        # ANSI truecolor, one terminal row per cell row.
+        lines = []
+        for row in range(self.rows):
+            line = []
+            for column in range(self.columns):
+                i = row * self.columns + column
+                code = self.chars[i]
+                char = CP437.get(code, chr(code) if 32 <= code < 127 else "?")
+                line.append("\x1b[38;2;%d;%d;%dm\x1b[48;2;%d;%d;%dm%s" % (rgb(self.fg[i]) + rgb(self.bg[i]) + (char,)))
+            lines.append("".join(line) + "\x1b[0m")
+        return "\n".join(lines)
+
+
+def rgb(color):
+    return ((color >> 11) * 255 // 31, ((color >> 5) & 0x3F) * 255 // 63, (color & 0x1F) * 255 // 31)
+
+
+class FrameReader:
+    # Splits the byte stream into log text and frames.
+
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def feed(self, data):
+        # Yields ("log", bytes) and ("frame", kind, payload) items.
+        self.buffer.extend(data)
+        while self.buffer:
+            start = self.buffer.find(MAGIC)
+            if start < 0:
+                # Keep a possible start of MAGIC for the next read.
+                keep = len(MAGIC) - 1
+                text = bytes(self.buffer[:-keep]) if len(self.buffer) > keep else b""
+                del self.buffer[:len(text)]
+                if text:
+                    yield ("log", text)
+                return
+            if start:
+                yield ("log", bytes(self.buffer[:start]))
+                del self.buffer[:start]
+            header = len(MAGIC) + 3
+            if len(self.buffer) < header:
+                return
+            length = self.buffer[len(MAGIC) + 1] << 8 | self.buffer[len(MAGIC) + 2]
+            if len(self.buffer) < header + length:
+                return
+            kind = self.buffer[len(MAGIC)]
+            payload = bytes(self.buffer[header:header + length])
+            del self.buffer[:header + length]
+            yield ("frame", kind, payload)
+
+
+def run(source, request=None, out=sys.stdout):
+    # source returns the next bytes, empty if there are none yet, or None at the end.
+    screen = Screen()
+    reader = FrameReader()
+    frames = 0
+    size = 0
+    if request:
+        request(REQUEST_KEYFRAME)
+    while True:
+        data = source()
+        if data is None:
+            break
+        for item in reader.feed(data):
+            if item[0] == "log":
+                out.write(item[1].decode("utf-8", "replace"))
+                continue
+            frames += 1
+            size += len(MAGIC) + 3 + len(item[2])
+            if screen.apply(item[1], item[2]):
+                out.write("\x1b[s\x1b[H" + screen.render() + "\x1b[u")
+            elif request:
+                request(REQUEST_KEYFRAME)
+            out.flush()
+    out.write(f"\n{frames} frames, {size} bytes\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Shows the screen of a headless calculator")
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("--port", help="serial port of the calculator")
+    group.add_argument("--file", help="captured serial output to replay")
+    parser.add_argument("--baudrate", type=int, default=115200)
+    args = parser.parse_args()
+
+    if args.file:
+        with open(args.file, "rb") as f:
+            run(lambda: f.read(4096) or None)
+        return
+
+    try:
+        import serial
+    except ImportError:
+        sys.exit("Reading from a serial port needs pyserial: pip install pyserial")
+    with serial.Serial(args.port, args.baudrate, timeout=0.1) as port:
+        sys.stdout.write("\x1b[2J")
+        try:
+            run(lambda: port.read(port.in_waiting or 1), port.write)
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
@@ -20,20 +20,6 @@ MappingProxyType = None  # TODO: Add better sentinel which can't match anything
 SimpleNamespace = None  # TODO: Add better sentinel which can't match anything
 
 
-def _g():
-    yield 1
-
-
-GeneratorType = type(_g())
-
-
-class _C:
-    def _m(self):
-        pass
-
-
-MethodType = type(_C()._m)
-
 BuiltinFunctionType = type(len)
 BuiltinMethodType = type([].append)  # Same as BuiltinFunctionType
 
@@ -55,68 +41,34 @@ MemberDescriptorType = None  # TODO: Add better sentinel which can't match anyth
 del (
     sys,
     _f,
-    _g,
-    _C,
 )  # Not for export
 
 
-# Provide a PEP 3115 compliant mechanism for class creation
-def new_class(name, bases=(), kwds=None, exec_body=None):
-    """Create a class object dynamically using the appropriate metaclass."""
-    meta, ns, kwds = prepare_class(name, bases, kwds)
-    if exec_body is not None:
-        exec_body(ns)
-    return meta(name, bases, ns, **kwds)
+# GeneratorType and MethodType need a generator and a class to be made, and
+# the PEP 3115 class creation helpers live in _types_class. All of them are
+# only built or imported the first time they are looked up.
+_class_helpers = ("new_class", "prepare_class", "_calculate_meta")
 
 
-def prepare_class(name, bases=(), kwds=None):
-    """Call the __prepare__ method of the appropriate metaclass.
+def __getattr__(name):
+    if name == "GeneratorType":
 
-    Returns (metaclass, namespace, kwds) as a 3-tuple
+        def _g():
+            yield 1
 
-    *metaclass* is the appropriate metaclass
-    *namespace* is the prepared class namespace
-    *kwds* is an updated copy of the passed in kwds argument with any
-    'metaclass' entry removed. If no kwds argument is passed in, this will
-    be an empty dict.
-    """
-    if kwds is None:
-        kwds = {}
-    else:
-        kwds = dict(kwds)  # Don't alter the provided mapping
-    if "metaclass" in kwds:
-        meta = kwds.pop("metaclass")
-    else:
-        if bases:
-            meta = type(bases[0])
-        else:
-            meta = type
-    if isinstance(meta, type):
-        # when meta is a type, we first determine the most-derived metaclass
-        # instead of invoking the initial candidate directly
-        meta = _calculate_meta(meta, bases)
-    if hasattr(meta, "__prepare__"):
-        ns = meta.__prepare__(name, bases, **kwds)
+        value = type(_g())
+    elif name == "MethodType":
+
+        class _C:
+            def _m(self):
+                pass
+
+        value = type(_C()._m)
+    elif name in _class_helpers:
+        import _types_class
+
+        value = getattr(_types_class, name)
     else:
-        ns = {}
-    return meta, ns, kwds
-
-
-def _calculate_meta(meta, bases):
-    """Calculate the most derived metaclass."""
-    winner = meta
-    for base in bases:
-        base_meta = type(base)
-        if issubclass(winner, base_meta):
-            continue
-        if issubclass(base_meta, winner):
-            winner = base_meta
-            continue
-        # else:
-        raise TypeError(
-            "metaclass conflict: "
-            "the metaclass of a derived class "
-            "must be a (non-strict) subclass "
-            "of the metaclasses of all its bases"
-        )
-    return winner
+        raise AttributeError(name)
+    globals()[name] = value
+    return value
@@ -0,0 +1,280 @@
+# Dimension vector unit engine
+#
+# A unit is a packed vector of small integer exponents of the SI base units,
+# plus the scale (and offset, for °C) that takes a value to the SI unit of the
+# same dimension. Unit strings are parsed once, after that checking two units
+# is an integer comparison and converting a value is a table lookup and one
+# multiply-add.
+
+from math import sqrt as _sqrt, pi
+
+BASE_UNITS = ("m", "kg", "s", "A", "K")
+
+# Each exponent takes 4 bits, stored with a bias of 8, so exponents go from -8 to 7.
+_BITS = 4
+_MASK = 0xF
+_BIAS = 8
+
+
+class UnitError(ValueError):
+    pass
+
+
+def pack(exponents):
+    dimension = 0
+    for i in range(len(exponents)):
+        e = exponents[i]
+        if e < -_BIAS or e >= _BIAS:
+            raise UnitError("Exponent out of range")
+        dimension |= (e + _BIAS) << (i * _BITS)
+    return dimension
+
+
+def unpack(dimension):
+    return [((dimension >> (i * _BITS)) & _MASK) - _BIAS for i in range(len(BASE_UNITS))]
+
+
+DIMENSIONLESS = pack([0] * len(BASE_UNITS))
+
+
+class Unit:
+    def __init__(self, dimension, scale=1.0, offset=0.0, name=None):
+        self.dimension = dimension
+        self.scale = scale
+        self.offset = offset
+        self.name = name
+
+    def __mul__(self, other):
+        if not isinstance(other, Unit):
+            # Numbers in a formula are part of the value, not of the unit
+            return Unit(self.dimension, self.scale)
+        a = unpack(self.dimension)
+        b = unpack(other.dimension)
+        return Unit(pack([a[i] + b[i] for i in range(len(a))]), self.scale * other.scale)
+
+    __rmul__ = __mul__
+
+    def __truediv__(self, other):
+        if not isinstance(other, Unit):
+            return Unit(self.dimension, self.scale)
+        return self * other ** -1
+
+    def __rtruediv__(self, other):
+        return self ** -1
+
+    def __pow__(self, power):
+        if isinstance(power, Unit):
+            raise UnitError("Exponent has a unit")
+        if power != int(power):
+            raise UnitError("Fractional exponent")
+        a = unpack(self.dimension)
+        return Unit(pack([e * int(power) for e in a]), self.scale ** power)
+
+    def __add__(self, other):
+        # A bare number added to a quantity is taken to be in the same unit, like the 273 in K-273.
+        if isinstance(other, Unit) and other.dimension != self.dimension:
+            raise UnitError(f"Can't add {self} and {other}")
+        return Unit(self.dimension, self.scale)
+
+    __radd__ = __add__
+    __sub__ = __add__
+    __rsub__ = __add__
+
+    def __neg__(self):
+        return self
+
+    __pos__ = __neg__
+
+    def __str__(self):
+        if self.name:
+            return self.name
+        named = find(self)
+        if named:
+            return named.name
+        # Composed from the base units, for dimensions without a name
+        top = []
+        bottom = []
+        exponents = unpack(self.dimension)
+        for i in range(len(exponents)):
+            e = exponents[i]
+            if e:
+                (top if e > 0 else bottom).append(BASE_UNITS[i] + (str(abs(e)) if abs(e) != 1 else ""))
+        text = "*".join(top) or "1"
+        if bottom:
+            text += "/" + "*".join(bottom)
+        return text
+
+
+def sqrt(x):
+    if not isinstance(x, Unit):
+        return _sqrt(x)
+    a = unpack(x.dimension)
+    for e in a:
+        if e % 2:
+            raise UnitError(f"Square root of {x}")
+    return Unit(pack([e // 2 for e in a]), _sqrt(x.scale))
+
+
+def _unit(name, exponents, scale=1.0, offset=0.0):
+    return Unit(pack(exponents), scale, offset, name)
+
+
+#               m  kg  s  A  K
+UNITS = [
+    _unit("m", (1, 0, 0, 0, 0)),
+    _unit("cm", (1, 0, 0, 0, 0), 0.01),
+    _unit("mm", (1, 0, 0, 0, 0), 0.001),
+    _unit("km", (1, 0, 0, 0, 0), 1000.0),
+    _unit("m2", (2, 0, 0, 0, 0)),
+    _unit("cm2", (2, 0, 0, 0, 0), 0.0001),
+    _unit("m3", (3, 0, 0, 0, 0)),
+    _unit("cm3", (3, 0, 0, 0, 0), 0.000001),
+    _unit("l", (3, 0, 0, 0, 0), 0.001),
+    _unit("kg", (0, 1, 0, 0, 0)),
+    _unit("g", (0, 1, 0, 0, 0), 0.001),
+    _unit("s", (0, 0, 1, 0, 0)),
+    _unit("min", (0, 0, 1, 0, 0), 60.0),
+    _unit("h", (0, 0, 1, 0, 0), 3600.0),
+    _unit("m/s", (1, 0, -1, 0, 0)),
+    _unit("km/h", (1, 0, -1, 0, 0), 1 / 3.6),
+    _unit("m/s2", (1, 0, -2, 0, 0)),
+    _unit("N", (1, 1, -2, 0, 0)),
+    _unit("J", (2, 1, -2, 0, 0)),
+    _unit("kJ", (2, 1, -2, 0, 0), 1000.0),
+    _unit("Wh", (2, 1, -2, 0, 0), 3600.0),
+    _unit("W", (2, 1, -3, 0, 0)),
+    _unit("A", (0, 0, 0, 1, 0)),
+    _unit("mA", (0, 0, 0, 1, 0), 0.001),
+    _unit("V", (2, 1, -3, -1, 0)),
+    _unit("Ω", (2, 1, -3, -2, 0)),
+    _unit("K", (0, 0, 0, 0, 1)),
+    _unit("°C", (0, 0, 0, 0, 1), 1.0, 273.15),
+    _unit("J/(kg*K)", (2, 0, -2, 0, -1)),
+]
+
+_by_name = {}
+for _u in UNITS:
+    _by_name[_u.name] = _u
+
+# Names available when evaluating a formula over units
+namespace = {"sqrt": sqrt, "pi": pi}
+
+_parsed = {}
+_alternatives = {}
+_conversions = {}
+
+
+def find(unit):
+    # Returns the named unit with the same dimension and scale, or None.
+    for u in UNITS:
+        if u.dimension == unit.dimension and abs(u.scale - unit.scale) <= 1e-9 * u.scale and u.offset == unit.offset:
+            return u
+    return None
+
+
+def _tokens(text):
+    i = 0
+    while i < len(text):
+        c = text[i]
+        if c == " ":
+            i += 1
+        elif text[i:i + 2] == "**":
+            yield "**"
+            i += 2
+        elif c in "*/()":
+            yield c
+            i += 1
+        elif c.isdigit() or c == "-":
+            j = i + 1
+            while j < len(text) and text[j].isdigit():
+                j += 1
+            yield int(text[i:j])
+            i = j
+        else:
+            # A unit name, trailing digits are an exponent (cm2)
+            j = i
+            while j < len(text) and not text[j].isdigit() and text[j] not in " */()":
+                j += 1
+            yield text[i:j]
+            if j < len(text) and text[j].isdigit():
+                yield "**"
+            i = j
+
+
+def _parse_expression(tokens, position):
+    unit, position = _parse_power(tokens, position)
+    while position < len(tokens) and tokens[position] in ("*", "/"):
+        operator = tokens[position]
+        right, position = _parse_power(tokens, position + 1)
+        unit = unit * right if operator == "*" else unit / right
+    return unit, position
+
+
+def _parse_power(tokens, position):
+    token = tokens[position] if position < len(tokens) else None
+    if token == "(":
+        unit, position = _parse_expression(tokens, position + 1)
+        if position >= len(tokens) or tokens[position] != ")":
+            raise UnitError("Missing )")
+        position += 1
+    elif isinstance(token, str) and token in _by_name:
+        unit = _by_name[token]
+        position += 1
+    else:
+        raise UnitError(f"Unknown unit {token}")
+    if position < len(tokens) and tokens[position] == "**":
+        if position + 1 >= len(tokens) or not isinstance(tokens[position + 1], int):
+            raise UnitError("Missing exponent")
+        unit = unit ** tokens[position + 1]
+        position += 2
+    return unit, position
+
+
+def parse(text):
+    # Parses a unit like "m/(s**2)", "J/(kg*K)" or "cm2". Results are cached by text.
+    unit = _parsed.get(text)
+    if unit is None:
+        if text in _by_name:
+            unit = _by_name[text]
+        else:
+            tokens = list(_tokens(text))
+            unit, position = _parse_expression(tokens, 0)
+            if position != len(tokens):
+                raise UnitError(f"Unexpected {tokens[position]}")
+            named = find(unit)
+            unit = Unit(unit.dimension, unit.scale, unit.offset, named.name if named else text)
+        _parsed[text] = unit
+    return unit
+
+
+def alternatives(unit):
+    # Named units with the same dimension, the ones a value can be converted to.
+    names = _alternatives.get(unit.dimension)
+    if names is None:
+        names = [u for u in UNITS if u.dimension == unit.dimension]
+        _alternatives[unit.dimension] = names
+    return names
+
+
+def convert(value, source, target):
+    # Converts value from source to target unit.
+    # Units worked out from a formula can be unnamed, those aren't cached as their name says nothing.
+    key = (source.name, target.name) if source.name and target.name else None
+    conversion = _conversions.get(key) if key else None
+    if conversion is None:
+        if source.dimension != target.dimension:
+            raise UnitError(f"Can't convert {source} to {target}")
+        factor = source.scale / target.scale
+        conversion = (factor, (source.offset - target.offset) / target.scale)
+        if key:
+            _conversions[key] = conversion
+    return value * conversion[0] + conversion[1]
+
+
+def normalize(value, unit):
+    # Returns value and unit with a named unit if there is one, otherwise both as they are.
+    # Values are only rescaled when the user converts them.
+    named = find(unit)
+    if named:
+        return value, named
+    return value, unit